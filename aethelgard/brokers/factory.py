@@ -0,0 +1,82 @@
+import os
+from typing import Dict, Mapping
+
+from aethelgard.brokers.log_broker import DEFAULT_LOG_BROKER_DIR, LogBroker
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.brokers.redis_broker import RedisBroker
+from aethelgard.brokers.redis_cluster_broker import RedisClusterBroker
+from aethelgard.brokers.redis_streams_broker import RedisStreamsBroker
+from aethelgard.brokers.sqlite_broker import DEFAULT_SQLITE_BROKER_DB, SQLiteBroker
+from aethelgard.core.broker import AdmissionControl, BaseTaskBroker
+from aethelgard.core.codec import get_codec
+
+# Values of the BROKER environment variable
+BROKER_CLASSES: Dict[str, type[BaseTaskBroker]] = {
+    "redis": RedisBroker,
+    "redis_streams": RedisStreamsBroker,
+    "redis_cluster": RedisClusterBroker,
+    "sqlite": SQLiteBroker,
+    "log": LogBroker,
+    "memory": InMemoryBroker,
+}
+
+
+def _flag(env: Mapping[str, str], name: str) -> bool:
+    return env.get(name, "false").lower() == "true"
+
+
+def _optional(env: Mapping[str, str], name: str, cast):
+    return cast(env[name]) if env.get(name) else None
+
+
+def broker_class_from_env(env: Mapping[str, str] | None = None) -> type[BaseTaskBroker]:
+    """
+    Returns the broker class selected by BROKER (default redis). REDIS_CLUSTER=true, as used by
+    the existing server profiles, selects redis_cluster.
+    """
+    env = os.environ if env is None else env
+    name = env.get("BROKER") or ("redis_cluster" if _flag(env, "REDIS_CLUSTER") else "redis")
+    try:
+        return BROKER_CLASSES[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown BROKER {name!r}; expected one of {', '.join(BROKER_CLASSES)}") from None
+
+
+def broker_from_env(env: Mapping[str, str] | None = None) -> BaseTaskBroker:
+    """
+    Builds the broker configured by the environment (see samples/02_production_server.py):
+      - BROKER                       redis | redis_streams | redis_cluster | sqlite | log | memory
+      - REDIS_URL, REDIS_FANOUT, REDIS_MAX_MEMORY_BYTES     Redis brokers
+      - SQLITE_BROKER_DB, LOG_BROKER_DIR                     local brokers
+      - BROKER_CODEC (or REDIS_CODEC)                        task codec: json | float32
+      - ADMISSION_MAX_QUEUE_DEPTH, ADMISSION_MAX_BACKLOG_SECONDS, ADMISSION_POLICY
+    Every call opens its own connections, so each worker process builds its own broker.
+    """
+    env = os.environ if env is None else env
+    broker_class = broker_class_from_env(env)
+
+    admission = None
+    if env.get("ADMISSION_MAX_QUEUE_DEPTH") or env.get("ADMISSION_MAX_BACKLOG_SECONDS"):
+        admission = AdmissionControl(
+            max_queue_depth=_optional(env, "ADMISSION_MAX_QUEUE_DEPTH", int),
+            max_backlog_seconds=_optional(env, "ADMISSION_MAX_BACKLOG_SECONDS", float),
+            policy=env.get("ADMISSION_POLICY", "reject")
+        )
+    if broker_class is InMemoryBroker:
+        return InMemoryBroker(admission=admission)
+
+    codec = get_codec(env.get("BROKER_CODEC") or env.get("REDIS_CODEC", "json"))
+    if broker_class is SQLiteBroker:
+        return SQLiteBroker(env.get("SQLITE_BROKER_DB", DEFAULT_SQLITE_BROKER_DB), codec=codec, admission=admission)
+    if broker_class is LogBroker:
+        return LogBroker(env.get("LOG_BROKER_DIR", DEFAULT_LOG_BROKER_DIR), codec=codec, admission=admission)
+
+    # REDIS_URL points at any node of the cluster for redis_cluster
+    options = {
+        "max_memory_bytes": _optional(env, "REDIS_MAX_MEMORY_BYTES", int),
+        "codec": codec,
+        "admission": admission,
+    }
+    if _flag(env, "REDIS_FANOUT"):
+        options["fanout"] = True
+    return broker_class(redis_url=env.get("REDIS_URL", "redis://localhost:6379"), **options)
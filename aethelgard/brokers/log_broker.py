@@ -0,0 +1,872 @@
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict, deque
+from typing import List, Dict, Any, Tuple, Callable
+from urllib.parse import quote, unquote
+
+from aethelgard.core.broker import (
+    AckRateTracker, AdmissionControl, BaseTaskBroker, DEFAULT_MAX_BATCH, DEFAULT_PRIORITY_AGING, LATENCY_SAMPLES,
+    PRIORITY_LEVELS, PRIORITY_NAMES, PRIORITY_ROUTINE, LocalUpdateHub, UpdateSubscription, admission_report,
+    consensus_status, effective_priority, latency_summary, validate_priority
+)
+from aethelgard.core.codec import TaskCodec, JsonTaskCodec
+from aethelgard.core.config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_LOG_BROKER_DIR = "./broker_log"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Record framing: body length (u32) and CRC32 of the body, then the body: offset (u64), priority (u8),
+# enqueued_at (f64), request_id length (u16), the request_id and the codec-encoded task
+_FRAME = struct.Struct("<II")
+_HEADER = struct.Struct("<QBdH")
+# Dense offset index: the file position of record (base_offset + i) is entry i
+_INDEX = struct.Struct("<Q")
+# The commit log is an append-only series of u64 offsets, rewritten to its last entry past this size
+COMMIT_LOG_BYTES = 1024 * 1024
+# The request log is rewritten as one snapshot per live request once it holds this many times more events
+REQUEST_LOG_COMPACTION_RATIO = 4
+REQUEST_LOG_MIN_EVENTS = 10_000
+# Partitions holding open files (append handles, mmaps, commit log); about 5 descriptors each at most
+DEFAULT_MAX_OPEN_PARTITIONS = 64
+
+
+class Segment:
+    """
+    One `<base_offset>.log` file of framed records and its `<base_offset>.index` of record positions.
+    Appends go through buffered file objects, opened by the first append; reads go through a read-only
+    mmap of the log, remapped when a read reaches past its end. close() releases all three; they are
+    reopened on the next access.
+    """
+
+    def __init__(self, directory: str, base_offset: int):
+        self.base_offset = base_offset
+        self.log_path = os.path.join(directory, f"{base_offset:020d}.log")
+        self.index_path = os.path.join(directory, f"{base_offset:020d}.index")
+        self._positions = array("Q")
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            self._positions.frombytes(data[:len(data) - len(data) % _INDEX.size])
+        self._recover()
+        self._log = None
+        self._index = None
+        self._map: mmap.mmap | None = None
+        self.size = os.path.getsize(self.log_path)
+
+    def _recover(self) -> None:
+        """Drops a torn tail left by a crash mid-append: index entries whose record is short or fails its CRC."""
+        size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        with open(self.log_path, "ab+") as f:
+            end = 0
+            while self._positions:
+                f.seek(self._positions[-1])
+                frame = f.read(_FRAME.size)
+                if len(frame) == _FRAME.size:
+                    length, crc = _FRAME.unpack(frame)
+                    body = f.read(length)
+                    if len(body) == length and zlib.crc32(body) == crc:
+                        end = self._positions[-1] + _FRAME.size + length
+                        break
+                self._positions.pop()
+            if end != size:
+                logger.warning(f"truncating {self.log_path} from {size} to {end} bytes")
+                f.truncate(end)
+        with open(self.index_path, "ab") as f:
+            f.truncate(len(self._positions) * _INDEX.size)
+
+    @property
+    def next_offset(self) -> int:
+        return self.base_offset + len(self._positions)
+
+    def append(self, offset: int, priority: int, enqueued_at: float, request_id: str, task: bytes) -> None:
+        request_id = request_id.encode()
+        header = _HEADER.pack(offset, priority, enqueued_at, len(request_id))
+        length = len(header) + len(request_id) + len(task)
+        crc = zlib.crc32(task, zlib.crc32(request_id, zlib.crc32(header)))
+        if self._log is None:
+            # Read-write, so that the mmap can be taken from the same descriptor
+            self._log = open(self.log_path, "a+b")
+            self._index = open(self.index_path, "ab")
+        self._log.write(_FRAME.pack(length, crc) + header + request_id)
+        self._log.write(task)
+        self._index.write(_INDEX.pack(self.size))
+        self._positions.append(self.size)
+        self.size += _FRAME.size + length
+
+    def flush(self) -> None:
+        if self._log is not None:
+            self._log.flush()
+            self._index.flush()
+
+    @property
+    def disk_bytes(self) -> int:
+        return self.size + len(self._positions) * _INDEX.size
+
+    def fsync(self) -> None:
+        """Syncs the flushed appends to disk through fresh descriptors, as the handles may be closed meanwhile."""
+        for path in (self.log_path, self.index_path):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue                               # deleted by compaction: every record was committed
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _view(self, offset: int) -> Tuple[int, int]:
+        """Returns the (start, end) of the record's body in the mmap, remapping it if needed."""
+        position = self._positions[offset - self.base_offset]
+        if self._map is None or len(self._map) < position + _FRAME.size:
+            self._remap()
+        length, _ = _FRAME.unpack_from(self._map, position)
+        start = position + _FRAME.size
+        if len(self._map) < start + length:
+            self._remap()
+        return start, start + length
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        if self._log is not None:
+            self._log.flush()
+            self._map = mmap.mmap(self._log.fileno(), 0, access=mmap.ACCESS_READ)
+            return
+        with open(self.log_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_header(self, offset: int) -> Tuple[int, float, str]:
+        """Returns (priority, enqueued_at, request_id) of a record."""
+        start, _ = self._view(offset)
+        _, priority, enqueued_at, id_length = _HEADER.unpack_from(self._map, start)
+        request_id = self._map[start + _HEADER.size:start + _HEADER.size + id_length].decode()
+        return priority, enqueued_at, request_id
+
+    def read_task(self, offset: int, decode: Callable[[memoryview], Any]) -> Any:
+        """
+        Applies decode (e.g. TaskCodec.decode) to a view of the record's task in the mmap, so that a
+        float32 vector is copied once, into its array. The view is released when decode returns.
+        """
+        start, end = self._view(offset)
+        id_length = _HEADER.unpack_from(self._map, start)[3]
+        with memoryview(self._map) as view, view[start + _HEADER.size + id_length:end] as task:
+            return decode(task)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._log is not None:
+            self._log.close()
+            self._index.close()
+            self._log = self._index = None
+
+    def delete(self) -> None:
+        self.close()
+        os.remove(self.log_path)
+        os.remove(self.index_path)
+
+
+class HandleCache:
+    """
+    LRU of the partitions holding open files. A partition touches it before each file access; past
+    `capacity`, the least recently used partition is closed, to reopen its files on its next access.
+    This bounds the broker's descriptors whatever the number of clients.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._open: OrderedDict = OrderedDict()
+
+    def touch(self, partition: "Partition") -> None:
+        if partition in self._open:
+            self._open.move_to_end(partition)
+            return
+        self._open[partition] = None
+        while len(self._open) > self.capacity:
+            self._open.popitem(last=False)[0].close()
+
+    def discard(self, partition: "Partition") -> None:
+        self._open.pop(partition, None)
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+
+class Partition:
+    """
+    The log of one client's priority lane: its segments, committed offset and delivery state.
+
+    Records below `committed` are done (acked, shed or dead-lettered). Above it, `acked` holds the
+    offsets settled out of order; the committed offset advances over them once contiguous and is
+    appended to `commit.offsets`. Delivery state (cursor, leases, delivery counts) lives in memory, so
+    on restart every uncommitted record is delivered again from the committed offset.
+
+    Files are opened on demand under `handles`: only the active segment takes append handles, and
+    they are closed when it rolls over.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, handles: HandleCache):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._handles = handles
+        bases = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".log"))
+        self.segments = [Segment(directory, base) for base in bases] or [Segment(directory, 0)]
+        self.next_offset = self.segments[-1].next_offset
+        self._commit_path = os.path.join(directory, "commit.offsets")
+        self.committed = max(self._read_commit(), self.segments[0].base_offset)
+        self._commit_log = None
+        self._dirty: set = set()
+        self.cursor = self.committed                   # next record never delivered by this process
+        self.redeliver: deque = deque()                # offsets whose lease expired, served before the cursor
+        self.inflight: Dict[int, float] = {}           # offset -> lease deadline
+        self.deliveries: Dict[int, int] = {}           # offset -> count
+        self.acked: set = set()                        # settled offsets above `committed`
+        self.by_request: Dict[str, int] = {
+            self.header(offset)[2]: offset for offset in range(self.committed, self.next_offset)
+        }
+
+    def _read_commit(self) -> int:
+        if not os.path.exists(self._commit_path):
+            return 0
+        with open(self._commit_path, "rb") as f:
+            data = f.read()
+        data = data[:len(data) - len(data) % _INDEX.size]
+        return _INDEX.unpack_from(data, len(data) - _INDEX.size)[0] if data else 0
+
+    def _segment(self, offset: int) -> Segment:
+        return self.segments[bisect_right([s.base_offset for s in self.segments], offset) - 1]
+
+    def header(self, offset: int) -> Tuple[int, float, str]:
+        self._handles.touch(self)
+        return self._segment(offset).read_header(offset)
+
+    def read_task(self, offset: int, decode: Callable[[memoryview], Any]) -> Any:
+        self._handles.touch(self)
+        return self._segment(offset).read_task(offset, decode)
+
+    def append(self, request_id: str, priority: int, enqueued_at: float, task: bytes) -> bool:
+        """Appends a task unless the request is already pending here; returns whether it was added."""
+        if request_id in self.by_request:
+            return False
+        self._handles.touch(self)
+        active = self.segments[-1]
+        if active.size >= self.segment_bytes:
+            active.close()
+            active = Segment(self.directory, self.next_offset)
+            self.segments.append(active)
+        active.append(self.next_offset, priority, enqueued_at, request_id, task)
+        self._dirty.add(active)
+        self.by_request[request_id] = self.next_offset
+        self.next_offset += 1
+        return True
+
+    def flush(self) -> List[Segment]:
+        """Flushes pending appends to the OS (visible to the mmap readers); returns the flushed segments."""
+        dirty, self._dirty = list(self._dirty), set()
+        for segment in dirty:
+            segment.flush()
+        if self._commit_log is not None:
+            self._commit_log.flush()
+        return dirty
+
+    def head(self) -> int | None:
+        """Offset of the next record to deliver, skipping the ones settled before delivery."""
+        while self.redeliver and (self.redeliver[0] < self.committed or self.redeliver[0] in self.acked):
+            self.redeliver.popleft()
+        if self.redeliver:
+            return self.redeliver[0]
+        while self.cursor < self.next_offset and (self.cursor in self.acked or self.cursor < self.committed):
+            self.cursor += 1
+        return self.cursor if self.cursor < self.next_offset else None
+
+    def pop_head(self) -> int:
+        offset = self.head()
+        if self.redeliver:
+            self.redeliver.popleft()
+        else:
+            self.cursor += 1
+        return offset
+
+    def settle(self, offset: int) -> None:
+        """Marks a record done and advances the committed offset over the contiguous settled records."""
+        self.inflight.pop(offset, None)
+        self.deliveries.pop(offset, None)
+        self.acked.add(offset)
+        committed = self.committed
+        while committed in self.acked:
+            self.acked.discard(committed)
+            committed += 1
+        if committed == self.committed:
+            return
+        for stale in range(self.committed, committed):
+            # by_request only maps uncommitted offsets, and pending ones are looked up through it
+            request_id = self.header(stale)[2]
+            if self.by_request.get(request_id) == stale:
+                del self.by_request[request_id]
+        self.committed = committed
+        self._handles.touch(self)
+        if self._commit_log is None:
+            self._commit_log = open(self._commit_path, "ab")
+        if self._commit_log.tell() >= COMMIT_LOG_BYTES:
+            self._rewrite_commit_log()
+        self._commit_log.write(_INDEX.pack(committed))
+        self.compact()
+
+    def _rewrite_commit_log(self) -> None:
+        self._commit_log.close()
+        tmp_path = self._commit_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_INDEX.pack(self.committed))
+        os.replace(tmp_path, self._commit_path)
+        self._commit_log = open(self._commit_path, "ab")
+
+    def compact(self) -> int:
+        """Deletes the segments every record of which is committed; returns how many were deleted."""
+        deleted = 0
+        while len(self.segments) > 1 and self.segments[1].base_offset <= self.committed:
+            segment = self.segments.pop(0)
+            self._dirty.discard(segment)
+            segment.delete()
+            deleted += 1
+        return deleted
+
+    @property
+    def backlog(self) -> int:
+        """Records neither committed nor settled: queued plus in flight."""
+        return self.next_offset - self.committed - len(self.acked)
+
+    def disk_bytes(self) -> int:
+        return sum(segment.disk_bytes for segment in self.segments)
+
+    def close(self) -> None:
+        """Flushes and closes the partition's files; the next access reopens the ones it needs."""
+        self.flush()
+        for segment in self.segments:
+            segment.close()
+        if self._commit_log is not None:
+            self._commit_log.close()
+            self._commit_log = None
+        self._handles.discard(self)
+
+
+class LogBroker(BaseTaskBroker):
+    """
+    Append-only segmented log broker on local disk, for single-host deployments with deep queues.
+
+    Layout under `directory`:
+      - clients/<client_id>/p<priority>/   one partition per client and priority lane:
+            <base_offset>.log     framed records (offset, priority, enqueued_at, request_id, task
+                                  encoded with `codec`), CRC-checked on recovery
+            <base_offset>.index   dense u64 record positions, so a read is one index lookup
+            commit.offsets        the client's committed offset, appended on each advance
+      - requests.log               JSON lines of broadcasts, insights, acks and settlements,
+                                   replayed into memory on start and periodically snapshotted
+      - deadletter.log             JSON lines of tasks that exhausted max_deliveries
+      - groups.json                node groups (group -> member client_ids), rewritten on change
+
+    A broadcast appends one record per target lane; polls read records through a read-only mmap
+    of the segment, decoding a float32 vector (Float32TaskCodec) directly from the page cache.
+    An ack settles the record's offset: the committed offset advances over contiguous settled
+    records, and a segment is deleted once the committed offset has passed its last record.
+
+    Leases, priority aging and dead-lettering follow InMemoryBroker; lease state is kept in memory,
+    so after a restart every uncommitted record is delivered again (at-least-once, like any
+    committed-offset consumer). Broadcasts to saturated nodes are handled by `admission` (see
+    AdmissionControl). Appends are flushed to the OS after each operation, which survives a process
+    crash; `fsync=True` also syncs them to disk, off the event loop, against an OS crash.
+
+    A lane is opened by its first append, or on start if it holds uncommitted records, and keeps its
+    files open only while among the `max_open_partitions` most recently used (see HandleCache), so
+    the descriptors stay bounded with thousands of clients.
+
+    Retention mirrors RedisBroker's TTLs: every `prune_interval` seconds the reaper drops a request's
+    insights `insight_ttl` seconds after its last insight, its status once it is that old and neither
+    insights nor tasks remain, and dead letters older than `metadata_ttl` (None keeps them); the
+    request log is then rewritten with the retained requests only.
+    """
+
+    serialised_tasks = True
+
+    def __init__(self, directory: str = DEFAULT_LOG_BROKER_DIR, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 fsync: bool = False, visibility_timeout: float = 300.0, max_deliveries: int = 5,
+                 reap_interval: float = 15.0, codec: TaskCodec | None = None,
+                 priority_aging: float = DEFAULT_PRIORITY_AGING, admission: AdmissionControl | None = None,
+                 max_open_partitions: int = DEFAULT_MAX_OPEN_PARTITIONS, insight_ttl: int | None = 7 * 86_400,
+                 metadata_ttl: int | None = 7 * 86_400, prune_interval: float = 300.0):
+        self.directory = directory
+        self.insight_ttl = insight_ttl
+        self.metadata_ttl = metadata_ttl
+        self.prune_interval = prune_interval
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.admission = admission
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.reap_interval = reap_interval
+        self.priority_aging = priority_aging
+        self.codec = codec or JsonTaskCodec()
+        self._clients_dir = os.path.join(directory, "clients")
+        os.makedirs(self._clients_dir, exist_ok=True)
+        self._handles = HandleCache(max_open_partitions)
+        self._partitions: Dict[str, Dict[int, Partition]] = {}           # client_id -> priority -> lane
+        for name in sorted(os.listdir(self._clients_dir)):
+            self._recover_lanes(unquote(name))
+        self._insights: Dict[str, Dict[str, str]] = defaultdict(dict)       # request_id -> client -> insight
+        self._insight_times: Dict[str, float] = {}                          # request_id -> last insight time
+        self._status: Dict[str, Dict[str, Any]] = {}                      # request_id -> completion counters
+        self._groups_path = os.path.join(directory, "groups.json")
+        self._groups: Dict[str, set] = {}
+        if os.path.exists(self._groups_path):
+            with open(self._groups_path, encoding="utf-8") as f:
+                self._groups = {group: set(members) for group, members in json.load(f).items()}
+        self._requests_path = os.path.join(directory, "requests.log")
+        self._request_events = self._replay_requests()
+        self._requests_log = open(self._requests_path, "a", encoding="utf-8")
+        self._deadletter_path = os.path.join(directory, "deadletter.log")
+        self._deadletter_log = open(self._deadletter_path, "a", encoding="utf-8")
+        self._events: Dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self._updates = LocalUpdateHub()
+        self._counters = {"redelivered": 0, "dead_lettered": 0, "shed": 0}
+        self._ack_rates = AckRateTracker()
+        self._latency = [deque(maxlen=LATENCY_SAMPLES) for _ in range(PRIORITY_LEVELS)]  # pickup latency, ms
+        self._reaper: asyncio.Task | None = None
+        logger.info(f"starting log broker at {directory} ({len(self._partitions)} clients recovered)")
+
+    def _lane_dir(self, client_id: str, priority: int) -> str:
+        return os.path.join(self._clients_dir, quote(client_id, safe=""), f"p{priority}")
+
+    def _lane(self, client_id: str, priority: int) -> Partition:
+        """Returns the client's lane, opening it (and creating its directory) on first use."""
+        lanes = self._partitions.setdefault(client_id, {})
+        partition = lanes.get(priority)
+        if partition is None:
+            partition = lanes[priority] = Partition(self._lane_dir(client_id, priority), self.segment_bytes, self._handles)
+        return partition
+
+    def _recover_lanes(self, client_id: str) -> None:
+        """Opens the client's lanes holding uncommitted records; the others wait for their next append."""
+        for priority in range(PRIORITY_LEVELS):
+            if not os.path.isdir(self._lane_dir(client_id, priority)):
+                continue
+            partition = Partition(self._lane_dir(client_id, priority), self.segment_bytes, self._handles)
+            if partition.backlog:
+                self._partitions.setdefault(client_id, {})[priority] = partition
+            else:
+                partition.close()
+
+    def _replay_requests(self) -> int:
+        """Rebuilds insights and completion counters from the request log; returns its event count."""
+        if not os.path.exists(self._requests_path):
+            return 0
+        events = 0
+        with open(self._requests_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line can be torn, by a crash mid-append
+                    logger.warning(f"skipping a torn line of {self._requests_path}")
+                    continue
+                self._apply(event)
+                events += 1
+        return events
+
+    def _apply(self, event: Dict[str, Any]) -> None:
+        op, request_id = event["op"], event["request_id"]
+        # Events logged before retention carry no time: their retention starts now
+        at = event.get("at") or time.time()
+        if op == "snapshot":
+            if event["status"] is not None:
+                status = event["status"]
+                self._status[request_id] = {
+                    "expected": status["expected"], "acks": status["acks"], "outstanding": set(status["outstanding"]),
+                    "created": status.get("created") or at,
+                }
+            if event["insights"]:
+                self._insights[request_id].update(event["insights"])
+                self._insight_times[request_id] = event.get("insight_at") or at
+            return
+        if op == "insight":
+            self._insights[request_id][event["client_id"]] = event["insight"]
+            self._insight_times[request_id] = at
+            return
+        status = self._status.setdefault(request_id, {"expected": 0, "acks": 0, "outstanding": set(), "created": at})
+        if op == "broadcast":
+            status["expected"] += len(event["clients"])
+            status["outstanding"].update(event["clients"])
+        elif event["client_id"] in status["outstanding"]:
+            # "ack" or "settle" (shed / dead-lettered)
+            status["outstanding"].discard(event["client_id"])
+            if op == "ack":
+                status["acks"] += 1
+
+    def _record(self, event: Dict[str, Any]) -> None:
+        self._apply(event)
+        self._requests_log.write(json.dumps(event) + "\n")
+        self._request_events += 1
+
+    def _snapshot_requests(self) -> None:
+        """Rewrites the request log as one snapshot event per retained request (see prune_expired())."""
+        self._requests_log.close()
+        tmp_path = self._requests_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for request_id in self._status.keys() | self._insights.keys():
+                status = self._status.get(request_id)
+                if status is not None:
+                    status = {**status, "outstanding": sorted(status["outstanding"])}
+                f.write(json.dumps({
+                    "op": "snapshot", "request_id": request_id, "status": status,
+                    "insights": self._insights.get(request_id, {}), "insight_at": self._insight_times.get(request_id),
+                }) + "\n")
+        os.replace(tmp_path, self._requests_path)
+        self._requests_log = open(self._requests_path, "a", encoding="utf-8")
+        self._request_events = len(self._status.keys() | self._insights.keys())
+
+    async def _flush(self, partitions: List[Partition] = ()) -> None:
+        """Hands the operation's appends to the OS, and with `fsync` waits for them to reach the disk."""
+        segments = [segment for partition in partitions for segment in partition.flush()]
+        self._requests_log.flush()
+        if self.fsync:
+            def sync():
+                for segment in segments:
+                    segment.fsync()
+                os.fsync(self._requests_log.fileno())
+            await asyncio.get_running_loop().run_in_executor(None, sync)
+
+    async def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reaper_loop())
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for lanes in self._partitions.values():
+            for partition in lanes.values():
+                partition.close()
+        self._requests_log.close()
+        self._deadletter_log.close()
+
+    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float],
+                            priority: int = PRIORITY_ROUTINE) -> None:
+        await self.enqueue_many(request_id, [client_id], query_vector, priority)
+
+    async def enqueue_many(self, request_id: str, client_ids: List[str], query_vector: List[float],
+                           priority: int = PRIORITY_ROUTINE) -> Dict[str, Any]:
+        validate_priority(priority)
+        targets, shed_counts = await self._admit(client_ids)
+        shed = {client_id: await self._shed_oldest(client_id, count, priority) for client_id, count in shed_counts.items()}
+        task = self.codec.encode(request_id, query_vector)
+        if isinstance(task, str):
+            task = task.encode()
+        now = time.time()
+        added = [client_id for client_id in targets if self._lane(client_id, priority).append(request_id, priority, now, task)]
+        if added:
+            self._record({"op": "broadcast", "request_id": request_id, "clients": added, "at": now})
+        await self._flush([self._partitions[client_id][priority] for client_id in added] +
+                          [partition for client_id in shed for partition in self._partitions.get(client_id, {}).values()])
+        for client_id in added:
+            self._events[client_id].set()
+        return admission_report([client_id for client_id in client_ids if client_id not in targets], shed)
+
+    async def _shed_oldest(self, client_id: str, count: int, priority: int) -> List[str]:
+        shed = []
+        lanes = self._partitions.get(client_id, {})
+        for partition in [lanes[lane] for lane in sorted(lanes) if lane <= priority]:
+            while len(shed) < count and partition.head() is not None:
+                offset = partition.pop_head()
+                request_id = partition.header(offset)[2]
+                partition.settle(offset)
+                self._record({"op": "settle", "request_id": request_id, "client_id": client_id, "at": time.time()})
+                self._updates.notify(request_id)
+                shed.append(request_id)
+        self._counters["shed"] += len(shed)
+        return shed
+
+    async def get_node_load(self, client_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return {
+            client_id: {
+                "backlog": sum(partition.backlog for partition in self._partitions.get(client_id, {}).values()),
+                "ack_rate": self._ack_rates.rate(client_id),
+            }
+            for client_id in client_ids
+        }
+
+    async def add_group_members(self, group: str, client_ids: List[str]) -> int:
+        members = self._groups.setdefault(group, set())
+        added = len(set(client_ids) - members)
+        members.update(client_ids)
+        if added:
+            self._save_groups()
+        return added
+
+    async def remove_group_members(self, group: str, client_ids: List[str]) -> int:
+        members = self._groups.get(group, set())
+        removed = len(members & set(client_ids))
+        members.difference_update(client_ids)
+        if not members:
+            self._groups.pop(group, None)
+        if removed:
+            self._save_groups()
+        return removed
+
+    def _save_groups(self) -> None:
+        tmp_path = self._groups_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({group: sorted(members) for group, members in self._groups.items()}, f)
+        os.replace(tmp_path, self._groups_path)
+
+    async def get_group_members(self, group: str) -> List[str]:
+        return sorted(self._groups.get(group, ()))
+
+    async def list_groups(self) -> Dict[str, int]:
+        return {group: len(members) for group, members in sorted(self._groups.items())}
+
+    async def dequeue_queries(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                              wait_timeout: float = 0.0) -> List[Dict[str, Any]]:
+        """Leases up to max_batch tasks; if none are pending, waits up to wait_timeout seconds for one."""
+        return await self._dequeue(client_id, max_batch, wait_timeout, self.codec.decode)
+
+    async def dequeue_raw(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                          wait_timeout: float = 0.0) -> List[bytes]:
+        return await self._dequeue(client_id, max_batch, wait_timeout, self.codec.to_json)
+
+    async def _dequeue(self, client_id: str, max_batch: int, wait_timeout: float, decode: Callable) -> list:
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            tasks = self._pop(client_id, max_batch, decode)
+            remaining = deadline - time.monotonic()
+            if tasks or remaining <= 0:
+                return tasks
+            try:
+                await asyncio.wait_for(self._events[client_id].wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return []
+
+    def _pop(self, client_id: str, max_batch: int, decode: Callable) -> list:
+        lanes = self._partitions.get(client_id)
+        if not lanes:
+            self._events[client_id].clear()
+            return []
+        now = time.time()
+        lease_deadline = now + self.visibility_timeout
+        heads: Dict[int, Tuple[int, float]] = {}                           # priority -> (offset, enqueued_at)
+
+        def head_priority(priority: int) -> float:
+            return effective_priority(priority, now - heads[priority][1], self.priority_aging)
+
+        batch = []
+        while len(batch) < max_batch:
+            for priority, partition in lanes.items():
+                offset = partition.head()
+                if offset is None:
+                    heads.pop(priority, None)
+                elif heads.get(priority, (None,))[0] != offset:
+                    heads[priority] = (offset, partition.header(offset)[1])
+            if not heads:
+                break
+            # max() keeps the first of equal candidates, so the highest lane wins ties
+            priority = max(sorted(heads, reverse=True), key=head_priority)
+            partition = lanes[priority]
+            offset = partition.pop_head()
+            partition.inflight[offset] = lease_deadline
+            partition.deliveries[offset] = partition.deliveries.get(offset, 0) + 1
+            if partition.deliveries[offset] == 1:
+                self._latency[priority].append((now - heads[priority][1]) * 1000)
+            batch.append(partition.read_task(offset, decode))
+        if not heads:
+            self._events[client_id].clear()
+        return batch
+
+    def _ack(self, client_id: str, request_id: str) -> Partition | None:
+        """Settles the task's record; returns its partition (to flush), or None if it was not pending."""
+        for partition in self._partitions.get(client_id, {}).values():
+            offset = partition.by_request.get(request_id)
+            if offset is None or offset < partition.committed or offset in partition.acked:
+                continue
+            if offset in partition.inflight:
+                self._ack_rates.record(client_id)
+            partition.settle(offset)
+            status = self._status.get(request_id)
+            if status is not None and client_id in status["outstanding"]:
+                self._record({"op": "ack", "request_id": request_id, "client_id": client_id, "at": time.time()})
+                self._updates.notify(request_id)
+            return partition
+        return None
+
+    async def ack(self, client_id: str, request_id: str) -> None:
+        partition = self._ack(client_id, request_id)
+        if partition is not None:
+            await self._flush([partition])
+
+    async def save_insight(self, request_id: str, client_id: str, insight: str) -> None:
+        # Keyed by client, so a re-submission replaces the node's previous insight
+        self._record({"op": "insight", "request_id": request_id, "client_id": client_id, "insight": insight,
+                      "at": time.time()})
+        await self._flush()
+        self._updates.notify(request_id)
+
+    async def save_results(self, client_id: str, results: List[Tuple[str, str | None]]) -> None:
+        """Records the whole batch, then flushes (and with `fsync` syncs) the logs once."""
+        partitions, insights = {}, []
+        for request_id, insight in results:
+            if insight is not None:
+                self._record({"op": "insight", "request_id": request_id, "client_id": client_id, "insight": insight,
+                              "at": time.time()})
+                insights.append(request_id)
+            partition = self._ack(client_id, request_id)
+            if partition is not None:
+                partitions[id(partition)] = partition
+        await self._flush(list(partitions.values()))
+        for request_id in insights:
+            self._updates.notify(request_id)
+
+    async def get_consensus(self, request_id: str) -> List[Dict[str, Any]]:
+        return [{"client_id": client_id, "insight": insight}
+                for client_id, insight in self._insights.get(request_id, {}).items()]
+
+    async def get_status(self, request_id: str) -> Dict[str, Any]:
+        status, insights = self._status.get(request_id), len(self._insights.get(request_id, {}))
+        if status is None:
+            return consensus_status(None, insights, 0, 0)
+        return consensus_status(status["expected"], insights, status["acks"], len(status["outstanding"]))
+
+    def subscribe_updates(self, request_id: str) -> UpdateSubscription:
+        return self._updates.subscribe(request_id)
+
+    async def _reaper_loop(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            try:
+                await self.reap_expired_leases()
+                if time.monotonic() - last_prune >= self.prune_interval:
+                    last_prune = time.monotonic()
+                    pruned = await self.prune_expired()
+                    if any(pruned.values()):
+                        logger.info(f"Retention sweep: {pruned}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lease reaper failed: {e}")
+            await asyncio.sleep(self.reap_interval)
+
+    async def reap_expired_leases(self) -> Dict[str, int]:
+        """
+        Re-queues (ahead of the lane's undelivered records) or dead-letters every expired lease,
+        then compacts the request log if it has grown far past the live requests.
+        """
+        totals = {"redelivered": 0, "dead_lettered": 0}
+        now = time.time()
+        touched = []
+        for client_id, lanes in self._partitions.items():
+            for partition in lanes.values():
+                expired = sorted(offset for offset, deadline in partition.inflight.items() if deadline <= now)
+                for offset in expired:
+                    del partition.inflight[offset]
+                    if partition.deliveries.get(offset, 0) >= self.max_deliveries:
+                        request_id = partition.header(offset)[2]
+                        partition.settle(offset)
+                        self._deadletter_log.write(json.dumps({"client_id": client_id, "request_id": request_id,
+                                                               "created_at": now}) + "\n")
+                        self._record({"op": "settle", "request_id": request_id, "client_id": client_id, "at": now})
+                        self._updates.notify(request_id)
+                        totals["dead_lettered"] += 1
+                    else:
+                        partition.redeliver.append(offset)
+                        self._events[client_id].set()
+                        totals["redelivered"] += 1
+                if expired:
+                    touched.append(partition)
+        for name, count in totals.items():
+            self._counters[name] += count
+        self._deadletter_log.flush()
+        await self._flush(touched)
+        live = len(self._status.keys() | self._insights.keys())
+        if self._request_events >= max(REQUEST_LOG_MIN_EVENTS, REQUEST_LOG_COMPACTION_RATIO * live):
+            self._snapshot_requests()
+        return totals
+
+    async def prune_expired(self) -> Dict[str, int]:
+        """
+        Forgets the requests and dead letters past their retention (see insight_ttl), then rewrites
+        the request log, and the dead-letter log, without them.
+        """
+        now = time.time()
+        pruned = {"insights": 0, "requests": 0, "deadletter": 0}
+        if self.insight_ttl is not None:
+            cutoff = now - self.insight_ttl
+            # A request's insights go together, insight_ttl after the last one (as its Redis hash)
+            for request_id in [request_id for request_id, at in self._insight_times.items() if at < cutoff]:
+                del self._insight_times[request_id]
+                pruned["insights"] += len(self._insights.pop(request_id, {}))
+            for request_id in [request_id for request_id, status in self._status.items()
+                               if status["created"] < cutoff and not status["outstanding"]
+                               and request_id not in self._insights]:
+                del self._status[request_id]
+                pruned["requests"] += 1
+        if pruned["insights"] or pruned["requests"]:
+            self._snapshot_requests()
+        if self.metadata_ttl is not None:
+            pruned["deadletter"] = self._prune_deadletter_log(now - self.metadata_ttl)
+        return pruned
+
+    def _prune_deadletter_log(self, cutoff: float) -> int:
+        """Rewrites the dead-letter log without the entries created before cutoff; returns how many went."""
+        self._deadletter_log.flush()
+        with open(self._deadletter_path, encoding="utf-8") as f:
+            lines = f.readlines()
+        kept = []
+        for line in lines:
+            try:
+                if json.loads(line)["created_at"] >= cutoff:
+                    kept.append(line)
+            except (json.JSONDecodeError, KeyError):
+                continue
+        if len(kept) < len(lines):
+            self._deadletter_log.close()
+            tmp_path = self._deadletter_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(kept)
+            os.replace(tmp_path, self._deadletter_path)
+            self._deadletter_log = open(self._deadletter_path, "a", encoding="utf-8")
+        return len(lines) - len(kept)
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        partitions = [partition for lanes in self._partitions.values() for partition in lanes.values()]
+        deadlines = [deadline for partition in partitions for deadline in partition.inflight.values()]
+        oldest_lease_age = max(0.0, now - (min(deadlines) - self.visibility_timeout)) if deadlines else 0.0
+        return {
+            "redelivered_total": self._counters["redelivered"],
+            "dead_lettered_total": self._counters["dead_lettered"],
+            "shed_total": self._counters["shed"],
+            "in_flight": len(deadlines),
+            "oldest_lease_age_s": round(oldest_lease_age, 3),
+            "visibility_timeout_s": self.visibility_timeout,
+            "queued": {
+                name: sum(lanes[priority].backlog - len(lanes[priority].inflight)
+                          for lanes in self._partitions.values() if priority in lanes)
+                for priority, name in enumerate(PRIORITY_NAMES)
+            },
+            "pickup_latency": {
+                name: latency_summary(list(samples)) for name, samples in zip(PRIORITY_NAMES, self._latency)
+            },
+            "log": {
+                "segments": sum(len(partition.segments) for partition in partitions),
+                "open_partitions": len(self._handles),
+                "disk_bytes": sum(partition.disk_bytes() for partition in partitions),
+            },
+        }
@@ -0,0 +1,321 @@
+import asyncio
+import time
+from array import array
+from collections import defaultdict, deque
+from typing import List, Dict, Any
+
+from aethelgard.core.broker import (
+    AckRateTracker, AdmissionControl, BaseTaskBroker, DEFAULT_MAX_BATCH, DEFAULT_PRIORITY_AGING, LATENCY_SAMPLES,
+    PRIORITY_LEVELS, PRIORITY_NAMES, PRIORITY_ROUTINE, LocalUpdateHub, UpdateSubscription, admission_report,
+    consensus_status, effective_priority, latency_summary, validate_priority
+)
+from aethelgard.core.config import get_logger
+
+logger = get_logger(__name__)
+
+
+class InMemoryBroker(BaseTaskBroker):
+    """
+    In-process broker built on asyncio primitives, for single-host deployments and tests.
+    State lives in plain dicts keyed by client_id / request_id, so every operation is O(1)
+    (dequeue is O(batch)) with no network hop and no serialisation. A broadcast stores one
+    task dict shared by all target queues. Pollers may wait on a per-client asyncio.Event
+    and are woken as soon as work is enqueued.
+
+    Leases and priority lanes follow the same semantics as RedisBroker: a dequeued task is in
+    flight for `visibility_timeout` seconds, then re-queued by the reaper, or dead-lettered after
+    `max_deliveries` attempts; higher lanes are served first, a waiting task gaining one level
+    per `priority_aging` seconds. Broadcasts to saturated nodes are handled by `admission`
+    (see AdmissionControl). Node groups are sets of client_ids. State is lost when the process exits.
+
+    Retention mirrors RedisBroker's TTLs: every `prune_interval` seconds the reaper drops a request's
+    insights `insight_ttl` seconds after its last insight, its status once it is that old and neither
+    insights nor tasks remain, dead letters older than `metadata_ttl` (None keeps them; each client
+    keeps at most `max_dead_letters`), and the bookkeeping of clients with nothing queued or in flight.
+    """
+
+    def __init__(self, visibility_timeout: float = 300.0, max_deliveries: int = 5, reap_interval: float = 15.0,
+                 priority_aging: float = DEFAULT_PRIORITY_AGING, admission: AdmissionControl | None = None,
+                 insight_ttl: int | None = 7 * 86_400, metadata_ttl: int | None = 7 * 86_400,
+                 prune_interval: float = 300.0, max_dead_letters: int = 1000):
+        self.admission = admission
+        self.insight_ttl = insight_ttl
+        self.metadata_ttl = metadata_ttl
+        self.prune_interval = prune_interval
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.reap_interval = reap_interval
+        self.priority_aging = priority_aging
+        # client -> one FIFO of request_ids per priority lane
+        self._queues: Dict[str, List[deque]] = defaultdict(lambda: [deque() for _ in range(PRIORITY_LEVELS)])
+        self._enqueued: Dict[str, Dict[str, tuple]] = defaultdict(dict)    # client -> request_id -> (priority, time)
+        self._tasks: Dict[str, Dict[str, dict]] = defaultdict(dict)        # client -> request_id -> task
+        self._inflight: Dict[str, Dict[str, float]] = defaultdict(dict)    # client -> request_id -> lease deadline
+        self._deliveries: Dict[str, Dict[str, int]] = defaultdict(dict)    # client -> request_id -> count
+        # client -> (request_id, dead-letter time), newest max_dead_letters
+        self._deadletter: Dict[str, deque] = defaultdict(lambda: deque(maxlen=max_dead_letters))
+        self._insights: Dict[str, Dict[str, str]] = defaultdict(dict)       # request_id -> client -> insight
+        self._insight_times: Dict[str, float] = {}                          # request_id -> last insight time
+        self._status: Dict[str, Dict[str, Any]] = {}                      # request_id -> completion counters
+        self._groups: Dict[str, set] = defaultdict(set)                     # group -> member client_ids
+        self._events: Dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self._waiting: Dict[str, int] = defaultdict(int)                    # client -> pollers waiting on its event
+        self._updates = LocalUpdateHub()
+        self._counters = {"redelivered": 0, "dead_lettered": 0, "shed": 0}
+        self._ack_rates = AckRateTracker()
+        self._latency = [deque(maxlen=LATENCY_SAMPLES) for _ in range(PRIORITY_LEVELS)]  # pickup latency, ms
+        self._reaper: asyncio.Task | None = None
+        logger.info("starting in-memory broker")
+
+    async def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reaper_loop())
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float],
+                            priority: int = PRIORITY_ROUTINE) -> None:
+        await self.enqueue_many(request_id, [client_id], query_vector, priority)
+
+    async def enqueue_many(self, request_id: str, client_ids: List[str], query_vector: List[float],
+                           priority: int = PRIORITY_ROUTINE) -> Dict[str, Any]:
+        validate_priority(priority)
+        targets, shed_counts = await self._admit(client_ids)
+        shed = {client_id: await self._shed_oldest(client_id, count, priority) for client_id, count in shed_counts.items()}
+        # Tasks are handed out as-is, so a packed float32 vector becomes the float list polls return
+        task = {"request_id": request_id,
+                "query_vector": query_vector.tolist() if isinstance(query_vector, array) else query_vector}
+        now = time.time()
+        if targets:
+            # Like the other brokers, a broadcast that reached no target leaves no status (it reads expired)
+            status = self._status.setdefault(request_id,
+                                             {"expected": 0, "acks": 0, "outstanding": set(), "created": now})
+            status["expected"] += len(targets)
+            status["outstanding"].update(targets)
+        for client_id in targets:
+            self._tasks[client_id][request_id] = task
+            self._enqueued[client_id][request_id] = (priority, now)
+            self._queues[client_id][priority].append(request_id)
+            self._events[client_id].set()
+        return admission_report([client_id for client_id in client_ids if client_id not in targets], shed)
+
+    async def _shed_oldest(self, client_id: str, count: int, priority: int) -> List[str]:
+        lanes, shed = self._queues[client_id], []
+        for lane in lanes[:priority + 1]:
+            while lane and len(shed) < count:
+                request_id = lane.popleft()
+                self._drop(client_id, request_id)
+                shed.append(request_id)
+        self._counters["shed"] += len(shed)
+        return shed
+
+    def _drop(self, client_id: str, request_id: str) -> None:
+        """Forgets a task that will never be acked, settling the client in the request's status."""
+        self._deliveries[client_id].pop(request_id, None)
+        self._tasks[client_id].pop(request_id, None)
+        self._enqueued[client_id].pop(request_id, None)
+        if request_id in self._status:
+            self._status[request_id]["outstanding"].discard(client_id)
+            self._updates.notify(request_id)
+
+    async def get_node_load(self, client_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return {
+            client_id: {
+                "backlog": sum(map(len, self._queues.get(client_id, ()))) + len(self._inflight.get(client_id, ())),
+                "ack_rate": self._ack_rates.rate(client_id),
+            }
+            for client_id in client_ids
+        }
+
+    async def add_group_members(self, group: str, client_ids: List[str]) -> int:
+        members = self._groups[group]
+        added = len(set(client_ids) - members)
+        members.update(client_ids)
+        return added
+
+    async def remove_group_members(self, group: str, client_ids: List[str]) -> int:
+        members = self._groups.get(group, set())
+        removed = len(members & set(client_ids))
+        members.difference_update(client_ids)
+        if not members:
+            self._groups.pop(group, None)
+        return removed
+
+    async def get_group_members(self, group: str) -> List[str]:
+        return sorted(self._groups.get(group, ()))
+
+    async def list_groups(self) -> Dict[str, int]:
+        return {group: len(members) for group, members in sorted(self._groups.items())}
+
+    async def dequeue_queries(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                              wait_timeout: float = 0.0) -> List[Dict[str, Any]]:
+        """Pops up to max_batch tasks; if none are pending, waits up to wait_timeout seconds for one."""
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            tasks = self._pop(client_id, max_batch)
+            remaining = deadline - time.monotonic()
+            if tasks or remaining <= 0:
+                return tasks
+            # The prune sweep keeps the event of a client with waiting pollers
+            self._waiting[client_id] += 1
+            try:
+                await asyncio.wait_for(self._events[client_id].wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return []
+            finally:
+                self._waiting[client_id] -= 1
+                if not self._waiting[client_id]:
+                    del self._waiting[client_id]
+
+    def _pop(self, client_id: str, max_batch: int) -> List[Dict[str, Any]]:
+        lanes, tasks, enqueued = self._queues[client_id], self._tasks[client_id], self._enqueued[client_id]
+        now = time.time()
+        lease_deadline = now + self.visibility_timeout
+
+        def head_priority(priority: int) -> float:
+            _, since = enqueued.get(lanes[priority][0], (priority, now))
+            return effective_priority(priority, now - since, self.priority_aging)
+
+        batch = []
+        while len(batch) < max_batch:
+            # max() keeps the first of equal candidates, so the highest lane wins ties
+            candidates = [priority for priority in reversed(range(PRIORITY_LEVELS)) if lanes[priority]]
+            if not candidates:
+                break
+            priority = max(candidates, key=head_priority)
+            request_id = lanes[priority].popleft()
+            task = tasks.get(request_id)
+            if task is None:
+                continue
+            self._inflight[client_id][request_id] = lease_deadline
+            deliveries = self._deliveries[client_id]
+            deliveries[request_id] = deliveries.get(request_id, 0) + 1
+            if deliveries[request_id] == 1 and request_id in enqueued:
+                self._latency[priority].append((now - enqueued[request_id][1]) * 1000)
+            batch.append(task)
+        if not any(lanes):
+            self._events[client_id].clear()
+        return batch
+
+    async def ack(self, client_id: str, request_id: str) -> None:
+        if self._inflight[client_id].pop(request_id, None) is not None:
+            self._ack_rates.record(client_id)
+        self._deliveries[client_id].pop(request_id, None)
+        self._tasks[client_id].pop(request_id, None)
+        self._enqueued[client_id].pop(request_id, None)
+        status = self._status.get(request_id)
+        if status is not None and client_id in status["outstanding"]:
+            status["outstanding"].discard(client_id)
+            status["acks"] += 1
+            self._updates.notify(request_id)
+
+    async def save_insight(self, request_id: str, client_id: str, insight: str) -> None:
+        # Keyed by client, so a re-submission replaces the node's previous insight
+        self._insights[request_id][client_id] = insight
+        self._insight_times[request_id] = time.time()
+        self._updates.notify(request_id)
+
+    async def get_consensus(self, request_id: str) -> List[Dict[str, Any]]:
+        return [{"client_id": client_id, "insight": insight}
+                for client_id, insight in self._insights.get(request_id, {}).items()]
+
+    async def get_status(self, request_id: str) -> Dict[str, Any]:
+        status, insights = self._status.get(request_id), len(self._insights.get(request_id, {}))
+        if status is None:
+            return consensus_status(None, insights, 0, 0)
+        return consensus_status(status["expected"], insights, status["acks"], len(status["outstanding"]))
+
+    def subscribe_updates(self, request_id: str) -> UpdateSubscription:
+        return self._updates.subscribe(request_id)
+
+    async def _reaper_loop(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            try:
+                await self.reap_expired_leases()
+                if time.monotonic() - last_prune >= self.prune_interval:
+                    last_prune = time.monotonic()
+                    pruned = await self.prune_expired()
+                    if any(pruned.values()):
+                        logger.info(f"Retention sweep: {pruned}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lease reaper failed: {e}")
+            await asyncio.sleep(self.reap_interval)
+
+    async def reap_expired_leases(self) -> Dict[str, int]:
+        """Re-queues (at the head of its priority lane) or dead-letters every expired lease."""
+        totals = {"redelivered": 0, "dead_lettered": 0}
+        now = time.time()
+        for client_id, inflight in self._inflight.items():
+            expired = [request_id for request_id, deadline in inflight.items() if deadline <= now]
+            for request_id in expired:
+                del inflight[request_id]
+                if self._deliveries[client_id].get(request_id, 0) >= self.max_deliveries:
+                    self._drop(client_id, request_id)
+                    self._deadletter[client_id].append((request_id, now))
+                    totals["dead_lettered"] += 1
+                else:
+                    priority, _ = self._enqueued[client_id].get(request_id, (PRIORITY_ROUTINE, now))
+                    self._queues[client_id][priority].appendleft(request_id)
+                    self._events[client_id].set()
+                    totals["redelivered"] += 1
+        for name, count in totals.items():
+            self._counters[name] += count
+        return totals
+
+    async def prune_expired(self) -> Dict[str, int]:
+        """Forgets the requests, dead letters and idle clients past their retention (see insight_ttl)."""
+        now = time.time()
+        pruned = {"insights": 0, "requests": 0, "deadletter": 0, "clients": 0}
+        if self.insight_ttl is not None:
+            cutoff = now - self.insight_ttl
+            # A request's insights go together, insight_ttl after the last one (as its Redis hash)
+            for request_id in [request_id for request_id, at in self._insight_times.items() if at < cutoff]:
+                del self._insight_times[request_id]
+                pruned["insights"] += len(self._insights.pop(request_id, {}))
+            for request_id in [request_id for request_id, status in self._status.items()
+                               if status["created"] < cutoff and not status["outstanding"]
+                               and request_id not in self._insights]:
+                del self._status[request_id]
+                pruned["requests"] += 1
+        for client_id, dead in list(self._deadletter.items()):
+            if self.metadata_ttl is not None:
+                while dead and dead[0][1] < now - self.metadata_ttl:
+                    dead.popleft()
+                    pruned["deadletter"] += 1
+            if not dead:
+                del self._deadletter[client_id]
+        # Polling or acking any client_id creates its entries; idle ones are dropped until it has work again
+        clients = self._queues.keys() | self._tasks.keys() | self._inflight.keys() | self._events.keys()
+        for client_id in clients:
+            if self._tasks.get(client_id) or self._inflight.get(client_id) or client_id in self._waiting:
+                continue
+            for state in (self._queues, self._tasks, self._enqueued, self._inflight, self._deliveries, self._events):
+                state.pop(client_id, None)
+            pruned["clients"] += 1
+        return pruned
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        deadlines = [deadline for inflight in self._inflight.values() for deadline in inflight.values()]
+        oldest_lease_age = max(0.0, now - (min(deadlines) - self.visibility_timeout)) if deadlines else 0.0
+        return {
+            "redelivered_total": self._counters["redelivered"],
+            "dead_lettered_total": self._counters["dead_lettered"],
+            "shed_total": self._counters["shed"],
+            "in_flight": len(deadlines),
+            "oldest_lease_age_s": round(oldest_lease_age, 3),
+            "visibility_timeout_s": self.visibility_timeout,
+            "queued": {
+                name: sum(len(lanes[priority]) for lanes in self._queues.values())
+                for priority, name in enumerate(PRIORITY_NAMES)
+            },
+            "pickup_latency": {
+                name: latency_summary(list(samples)) for name, samples in zip(PRIORITY_NAMES, self._latency)
+            },
+        }
@@ -1,53 +1,801 @@
+import asyncio
 import json
-from typing import List, Dict, Any
-from aethelgard.core.broker import BaseTaskBroker
+import time
+from typing import List, Dict, Any, Tuple
+from aethelgard.core.broker import (
+    ACK_RATE_WINDOW, AdmissionControl, BaseTaskBroker, BrokerCapacityError, DEFAULT_MAX_BATCH,
+    DEFAULT_PRIORITY_AGING, LATENCY_SAMPLES, PRIORITY_LEVELS, PRIORITY_NAMES, PRIORITY_ROUTINE, UpdateSubscription,
+    admission_report, consensus_status, decayed_ack_count, latency_summary, validate_priority
+)
 import redis.asyncio as redis
 
+from aethelgard.core.codec import TaskCodec, JsonTaskCodec
 from aethelgard.core.config import get_logger
 
 logger = get_logger(__name__)
 
+# Placeholder stored in tasks:{client_id} when the task body lives once under request:{request_id}:payload
+PAYLOAD_REF = "@"
+
+# Moves up to ARGV[2] request_ids from the client's priority lanes into its in-flight set in one call,
+# leasing each one until ARGV[1] and counting the delivery, and returns their task bodies
+# (ids whose task body is gone are dropped).
+# KEYS: tasks, inflight, deliveries, enqueued, wake, then the ARGV[8] lanes and their pickup-latency
+# lists, lowest priority first. Each pop takes the lane whose head has the highest effective
+# priority: its level plus one per ARGV[6] ms waited (anti-starvation aging), ties to the higher lane.
+# First deliveries sample their pickup latency (ARGV[5] now - enqueue time, ms), keeping ARGV[7]
+# (the client's latency lists expire with its tasks, after ARGV[4] s). The wake list keeps one token while any lane is non-empty, so that long polls can block on it.
+# Fan-out references are resolved against request:{request_id}:payload (mirrors _payload_key).
+# Entries written by the older list-only layout carry the full JSON task instead of an id;
+# they are indexed on the fly so that they can be acked like any other task.
+DEQUEUE_SCRIPT = """
+local levels = tonumber(ARGV[8])
+local now, aging = tonumber(ARGV[5]), tonumber(ARGV[6])
+local function enqueued_at(request_id)
+    local meta = redis.call('HGET', KEYS[4], request_id)
+    return meta and tonumber(string.match(meta, ':(%d+)$'))
+end
+local function head_score(lane)
+    local entry = redis.call('LINDEX', KEYS[5 + lane], -1)
+    if not entry then
+        return nil
+    end
+    local score = lane - 1
+    local since = aging > 0 and string.sub(entry, 1, 1) ~= '{' and enqueued_at(entry)
+    if since then
+        score = score + (now - since) / aging
+    end
+    return score
+end
+local scores = {}
+for lane = 1, levels do
+    scores[lane] = head_score(lane)
+end
+local tasks = {}
+while #tasks < tonumber(ARGV[2]) do
+    local best
+    for lane = levels, 1, -1 do
+        if scores[lane] and (not best or scores[lane] > scores[best]) then
+            best = lane
+        end
+    end
+    if not best then
+        break
+    end
+    local entry = redis.call('RPOP', KEYS[5 + best])
+    scores[best] = head_score(best)
+    local request_id, task = entry, nil
+    if string.sub(entry, 1, 1) == '{' then
+        request_id, task = cjson.decode(entry)['request_id'], entry
+        redis.call('HSET', KEYS[1], request_id, entry)
+    else
+        task = redis.call('HGET', KEYS[1], entry)
+        if task == ARGV[3] then
+            task = redis.call('GET', 'request:' .. entry .. ':payload')
+        end
+    end
+    if task then
+        redis.call('ZADD', KEYS[2], ARGV[1], request_id)
+        if redis.call('HINCRBY', KEYS[3], request_id, 1) == 1 then
+            local since = enqueued_at(request_id)
+            if since then
+                local latency_key = KEYS[5 + levels + best]
+                redis.call('LPUSH', latency_key, now - since)
+                redis.call('LTRIM', latency_key, 0, tonumber(ARGV[7]) - 1)
+                if tonumber(ARGV[4]) > 0 then
+                    redis.call('EXPIRE', latency_key, ARGV[4])
+                end
+            end
+        end
+        table.insert(tasks, task)
+    end
+end
+local ttl = tonumber(ARGV[4])
+if next(scores) then
+    redis.call('LPUSH', KEYS[5], 1)
+    redis.call('LTRIM', KEYS[5], 0, 0)
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[5], ttl)
+    end
+else
+    redis.call('DEL', KEYS[5])
+end
+if #tasks > 0 and ttl > 0 then
+    redis.call('EXPIRE', KEYS[2], ttl)
+    redis.call('EXPIRE', KEYS[3], ttl)
+end
+return tasks
+"""
+
+# Lua helper shared by the ack scripts: decays the ack count in HASH `key` (count, last ack in ms)
+# by e^(-elapsed / window) and adds this ack (mirrors core.broker.decayed_ack_count). The hash
+# expires after ten windows, when the decayed count is negligible anyway.
+RECORD_ACK_LUA = """
+local function record_ack(key, now, window)
+    local acks = redis.call('HMGET', key, 'count', 'last')
+    local count = 0
+    if acks[1] and acks[2] then
+        count = tonumber(acks[1]) * math.exp(-math.max(0, now - tonumber(acks[2])) / window)
+    end
+    redis.call('HSET', key, 'count', tostring(count + 1), 'last', now)
+    redis.call('PEXPIRE', key, 10 * window)
+end
+"""
+
+# Clears the in-flight entry and counts the client's first ack toward the request status;
+# a fan-out reference also releases its share of the payload, which is deleted once the
+# last target client has acked. Acks of leased tasks feed the client's ack rate (KEYS[9],
+# ARGV[5] now and ARGV[6] window in ms).
+ACK_SCRIPT = RECORD_ACK_LUA + """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    record_ack(KEYS[9], tonumber(ARGV[5]), tonumber(ARGV[6]))
+end
+redis.call('HDEL', KEYS[5], ARGV[1])
+redis.call('HDEL', KEYS[8], ARGV[1])
+if redis.call('SREM', KEYS[7], ARGV[3]) == 1 then
+    redis.call('HINCRBY', KEYS[6], 'acks', 1)
+    redis.call('PUBLISH', ARGV[4], 'ack')
+end
+local task = redis.call('HGET', KEYS[2], ARGV[1])
+if not task then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+if task == ARGV[2] then
+    if redis.call('DECR', KEYS[3]) <= 0 then
+        redis.call('DEL', KEYS[3], KEYS[4])
+    end
+end
+return 1
+"""
+
+# Handles leases that expired before ARGV[1]: re-queued at the head of their priority lane, or moved
+# to the client's dead-letter list once delivered ARGV[2] times (releasing any fan-out payload
+# reference and settling the client in the request's outstanding set).
+# KEYS: inflight, queue (routine lane), tasks, deliveries, deadletter, metrics, enqueued, wake,
+# then the higher priority lanes. ARGV[7] is the task TTL applied to the wake token.
+# Returns {requeued, dead_lettered}.
+REAP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+local requeued, dead = 0, 0
+for _, request_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], request_id)
+    local deliveries = tonumber(redis.call('HGET', KEYS[4], request_id) or '0')
+    if deliveries >= tonumber(ARGV[2]) then
+        local task = redis.call('HGET', KEYS[3], request_id)
+        redis.call('HDEL', KEYS[3], request_id)
+        redis.call('HDEL', KEYS[4], request_id)
+        redis.call('HDEL', KEYS[7], request_id)
+        redis.call('LPUSH', KEYS[5], request_id)
+        if redis.call('SREM', 'request:' .. request_id .. ':outstanding', ARGV[6]) == 1 then
+            redis.call('PUBLISH', 'request:' .. request_id .. ':updates', 'dead_lettered')
+        end
+        if tonumber(ARGV[5]) > 0 then
+            redis.call('EXPIRE', KEYS[5], ARGV[5])
+        end
+        if task == ARGV[4] then
+            local refs_key = 'request:' .. request_id .. ':refs'
+            if redis.call('DECR', refs_key) <= 0 then
+                redis.call('DEL', refs_key, 'request:' .. request_id .. ':payload')
+            end
+        end
+        dead = dead + 1
+    else
+        local meta = redis.call('HGET', KEYS[7], request_id)
+        local priority = meta and tonumber(string.match(meta, '^(%d+):')) or 0
+        redis.call('RPUSH', priority > 0 and KEYS[8 + priority] or KEYS[2], request_id)
+        requeued = requeued + 1
+    end
+end
+if requeued > 0 then
+    redis.call('HINCRBY', KEYS[6], 'redelivered', requeued)
+    redis.call('LPUSH', KEYS[8], 1)
+    redis.call('LTRIM', KEYS[8], 0, 0)
+    if tonumber(ARGV[7]) > 0 then
+        redis.call('EXPIRE', KEYS[8], ARGV[7])
+    end
+end
+if dead > 0 then
+    redis.call('HINCRBY', KEYS[6], 'dead_lettered', dead)
+end
+return {requeued, dead}
+"""
+
+# Drops up to ARGV[1] of the client's oldest queued tasks (admission control, shed_oldest policy),
+# releasing fan-out payload references and settling the client in each request's outstanding set.
+# KEYS: tasks, enqueued, deliveries, metrics, then the lanes to shed from, lowest priority first.
+# In-flight tasks are never shed. Returns the shed request_ids.
+SHED_SCRIPT = """
+local limit, shed = tonumber(ARGV[1]), {}
+for lane = 5, #KEYS do
+    while #shed < limit do
+        local entry = redis.call('RPOP', KEYS[lane])
+        if not entry then
+            break
+        end
+        local request_id, task = entry, nil
+        if string.sub(entry, 1, 1) == '{' then
+            request_id, task = cjson.decode(entry)['request_id'], entry
+        else
+            task = redis.call('HGET', KEYS[1], request_id)
+        end
+        -- Ids whose task is gone were already acked or dead-lettered
+        if task then
+            redis.call('HDEL', KEYS[1], request_id)
+            redis.call('HDEL', KEYS[2], request_id)
+            redis.call('HDEL', KEYS[3], request_id)
+            if task == ARGV[2] then
+                local refs_key = 'request:' .. request_id .. ':refs'
+                if redis.call('DECR', refs_key) <= 0 then
+                    redis.call('DEL', refs_key, 'request:' .. request_id .. ':payload')
+                end
+            end
+            if redis.call('SREM', 'request:' .. request_id .. ':outstanding', ARGV[3]) == 1 then
+                redis.call('PUBLISH', 'request:' .. request_id .. ':updates', 'shed')
+            end
+            table.insert(shed, request_id)
+        end
+    end
+end
+if #shed > 0 then
+    redis.call('HINCRBY', KEYS[4], 'shed', #shed)
+end
+return shed
+"""
+
+
+class RedisUpdateSubscription(UpdateSubscription):
+    """UpdateSubscription fed by a Redis pub/sub channel (one dedicated connection per subscriber)."""
+
+    def __init__(self, client: redis.Redis, channel: str):
+        super().__init__(recheck_interval=None)
+        self.channel = channel
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+
+    async def __aenter__(self) -> "RedisUpdateSubscription":
+        await self._pubsub.subscribe(self.channel)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._pubsub.aclose()
+
+    async def wait(self, timeout: float) -> None:
+        if await self._pubsub.get_message(timeout=timeout) is None:
+            return
+        # Coalesce a burst of notifications into a single wake-up
+        while await self._pubsub.get_message(timeout=0) is not None:
+            pass
+
+
 class RedisBroker(BaseTaskBroker):
-    """Production broker using Redis for distributed state management."""
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
-        self.redis = redis.from_url(redis_url, decode_responses=True)
-        logger.info("starting redis broker")
+    """
+    Production broker using Redis for distributed state management.
+    Per client it keeps:
+      - queue:{client_id}     LIST of pending routine request_ids (FIFO); urgent and stat tasks
+                              wait in queue:{client_id}:p1 and queue:{client_id}:p2
+      - tasks:{client_id}     HASH request_id -> task JSON
+      - enqueued:{client_id}  HASH request_id -> "priority:enqueued_at_ms"
+      - inflight:{client_id}  ZSET request_id scored by lease deadline
+      - deliveries:{client_id} HASH request_id -> delivery count
+      - wake:{client_id}      LIST holding one token while the client has pending tasks
+    so that ack is a constant-cost HDEL + ZREM regardless of queue depth.
+
+    A dequeue serves the highest priority lane first. To keep routine work from starving under a
+    sustained urgent load, a waiting task gains one priority level per `priority_aging` seconds.
+    Pickup latencies (enqueue -> first delivery) are sampled per client and priority under
+    metrics:pickup:{client_id}:{priority}; get_metrics() reports their p50/p99 over all clients.
+
+    A dequeued task is leased for `visibility_timeout` seconds. The background reaper
+    (see start()) re-queues expired leases, or moves them to deadletter:{client_id}
+    after `max_deliveries` attempts, so a node crashing mid-task never strands work.
+
+    With `fanout=True` a broadcast stores the task body once under request:{request_id}:payload
+    and every target client only gets a lightweight reference, resolved server-side at poll time.
+    The payload is reference-counted (request:{request_id}:refs) and deleted after the last ack.
+
+    Insights are stored in request:{request_id}:results, a HASH client_id -> insight, so a retried
+    submission or a redelivered task overwrites the node's entry instead of duplicating it and
+    a consensus read is bounded by the number of target nodes.
+
+    Every broadcast also records its completion counters (request:{request_id}:status HASH with
+    expected / acks) and the target clients still to ack (request:{request_id}:outstanding
+    SET), updated atomically by enqueue, save_insight, ack and the reaper; see get_status().
+    Each of those changes is also published on the request:{request_id}:updates channel, so
+    requesters can be pushed updates instead of polling (see subscribe_updates()).
+
+    Nothing is kept forever: per-client task keys and fan-out payloads expire `task_ttl` seconds
+    after the last write, insights `insight_ttl` seconds after the last insight, and
+    dead-letter lists `metadata_ttl` seconds after the last entry (None disables a TTL).
+    Task bodies are serialised with `codec` (JSON by default; Float32TaskCodec stores the
+    vector as packed float32, ~5x smaller). Any codec reads bodies written by any other,
+    so switching codecs on a live deployment is safe.
+
+    With `max_memory_bytes` set, broadcasts are rejected with BrokerCapacityError once Redis
+    `used_memory` reaches the budget, i.e. before maxmemory eviction or swapping kicks in.
+    Broadcasts to saturated nodes are handled by `admission` (see AdmissionControl), from each
+    node's backlog and its ack rate, kept in ackrate:{client_id} by the ack script.
+
+    Node groups are SETs group:{group} of client_ids, registered in the `groups` SET. A group
+    broadcast reads the members in one round trip, then goes through enqueue_many(), so that
+    admission control and the memory budget see every target (see resolve_targets()).
+    """
+    CLIENTS_KEY = "clients"
+    GROUPS_KEY = "groups"
+    serialised_tasks = True
+    multiprocess_safe = True
+    # save_results() queues its insights and ack scripts on one MULTI/EXEC pipeline
+    PIPELINED_RESULTS = True
+    METRICS_KEY = "metrics:leases"
+
+    def __init__(self, redis_url: str = "redis://localhost:6379", fanout: bool = False,
+                 visibility_timeout: float = 300.0, max_deliveries: int = 5, reap_interval: float = 15.0,
+                 task_ttl: int | None = 86_400, insight_ttl: int | None = 7 * 86_400,
+                 metadata_ttl: int | None = 7 * 86_400, max_memory_bytes: int | None = None,
+                 report_interval: float = 300.0, codec: TaskCodec | None = None,
+                 priority_aging: float = DEFAULT_PRIORITY_AGING, admission: AdmissionControl | None = None):
+        self.redis = self._connect(redis_url, decode_responses=True)
+        # Task bodies may be binary, so they are read through a non-decoding connection pool
+        self._raw_redis = self._connect(redis_url, decode_responses=False)
+        self.codec = codec or JsonTaskCodec()
+        self.fanout = fanout
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.reap_interval = reap_interval
+        self.task_ttl = task_ttl
+        self.insight_ttl = insight_ttl
+        self.metadata_ttl = metadata_ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.report_interval = report_interval
+        self.priority_aging = priority_aging
+        self.admission = admission
+        self._used_memory: tuple[float, int] = (0.0, 0)  # (sampled_at, bytes)
+        self._reaper: asyncio.Task | None = None
+        self._dequeue_script = self._raw_redis.register_script(DEQUEUE_SCRIPT)
+        self._ack_script = self.redis.register_script(ACK_SCRIPT)
+        self._reap_script = self.redis.register_script(REAP_SCRIPT)
+        self._shed_script = self.redis.register_script(SHED_SCRIPT)
+        logger.info(f"starting redis broker (fanout={fanout}, codec={self.codec.name}, "
+                    f"visibility_timeout={visibility_timeout}s)")
+
+    @staticmethod
+    def _connect(redis_url: str, decode_responses: bool) -> redis.Redis:
+        return redis.from_url(redis_url, decode_responses=decode_responses)
+
+    def _atomic_pipeline(self):
+        """Pipeline for writes (or reads) that belong together, applied as one MULTI/EXEC transaction."""
+        return self.redis.pipeline(transaction=True)
+
+    async def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._maintenance_loop())
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        await self.redis.aclose()
+        await self._raw_redis.aclose()
+
+    @staticmethod
+    def _queue_key(client_id: str, priority: int = PRIORITY_ROUTINE) -> str:
+        # The routine lane keeps the original key, so queues written before priorities existed still drain
+        return f"queue:{client_id}" if priority == PRIORITY_ROUTINE else f"queue:{client_id}:p{priority}"
+
+    def _lane_keys(self, client_id: str) -> List[str]:
+        """Queue keys of every priority lane, lowest priority first."""
+        return [self._queue_key(client_id, priority) for priority in range(PRIORITY_LEVELS)]
+
+    @staticmethod
+    def _enqueued_key(client_id: str) -> str:
+        return f"enqueued:{client_id}"
+
+    @staticmethod
+    def _wake_key(client_id: str) -> str:
+        return f"wake:{client_id}"
+
+    @staticmethod
+    def _latency_keys(client_id: str) -> List[str]:
+        """Pickup-latency lists sampled by the client's dequeues, lowest priority first."""
+        return [f"metrics:pickup:{client_id}:{name}" for name in PRIORITY_NAMES]
+
+    @staticmethod
+    def _ack_rate_key(client_id: str) -> str:
+        return f"ackrate:{client_id}"
+
+    @staticmethod
+    def _tasks_key(client_id: str) -> str:
+        return f"tasks:{client_id}"
+
+    @staticmethod
+    def _inflight_key(client_id: str) -> str:
+        return f"inflight:{client_id}"
+
+    @staticmethod
+    def _deliveries_key(client_id: str) -> str:
+        return f"deliveries:{client_id}"
+
+    @staticmethod
+    def _deadletter_key(client_id: str) -> str:
+        return f"deadletter:{client_id}"
+
+    @staticmethod
+    def _group_key(group: str) -> str:
+        return f"group:{group}"
 
-    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float]) -> None:
-        task = {"request_id": request_id, "query_vector": query_vector}
-        await self.redis.lpush(f"queue:{client_id}", json.dumps(task))
+    @staticmethod
+    def _payload_key(request_id: str) -> str:
+        return f"request:{request_id}:payload"
 
-    async def dequeue_queries(self, client_id: str) -> List[Dict[str, Any]]:
-        tasks = []
-        source_queue = f"queue:{client_id}"
-        processing_queue = f"processing:{client_id}"
+    @staticmethod
+    def _refs_key(request_id: str) -> str:
+        return f"request:{request_id}:refs"
 
+    @staticmethod
+    def _results_key(request_id: str) -> str:
+        return f"request:{request_id}:results"
+
+    @staticmethod
+    def _insights_key(request_id: str) -> str:
+        # Append-only list written before insights were keyed by client; read until it expires
+        return f"request:{request_id}:insights"
+
+    @staticmethod
+    def _status_key(request_id: str) -> str:
+        return f"request:{request_id}:status"
+
+    @staticmethod
+    def _outstanding_key(request_id: str) -> str:
+        return f"request:{request_id}:outstanding"
+
+    @staticmethod
+    def _updates_channel(request_id: str) -> str:
+        return f"request:{request_id}:updates"
+
+    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float],
+                            priority: int = PRIORITY_ROUTINE) -> None:
+        await self.enqueue_many(request_id, [client_id], query_vector, priority)
+
+    async def enqueue_many(self, request_id: str, client_ids: List[str], query_vector: List[float],
+                           priority: int = PRIORITY_ROUTINE) -> Dict[str, Any]:
+        """Fans one task out to all admitted clients in a single MULTI/EXEC round trip, serialising it once."""
+        validate_priority(priority)
+        targets, shed_counts = await self._admit(client_ids)
+        shed = {client_id: await self._shed_oldest(client_id, count, priority) for client_id, count in shed_counts.items()}
+        report = admission_report([client_id for client_id in client_ids if client_id not in targets], shed)
+        if not targets:
+            return report
+        enqueued = f"{priority}:{int(time.time() * 1000)}"
+        task = self.codec.encode(request_id, query_vector)
+        copies = 1 if self.fanout else len(targets)
+        await self._check_memory_budget(len(task) * copies)
+
+        async with self._atomic_pipeline() as pipe:
+            if self.fanout:
+                # First broadcast stores the body; every target holds one reference to it
+                pipe.set(self._payload_key(request_id), task, nx=True, ex=self.task_ttl)
+                pipe.incrby(self._refs_key(request_id), len(targets))
+                if self.task_ttl:
+                    pipe.expire(self._refs_key(request_id), self.task_ttl)
+                task = PAYLOAD_REF
+            for client_id in targets:
+                lane = self._queue_key(client_id, priority)
+                pipe.hset(self._tasks_key(client_id), request_id, task)
+                pipe.hset(self._enqueued_key(client_id), request_id, enqueued)
+                pipe.lpush(lane, request_id)
+                pipe.lpush(self._wake_key(client_id), 1)
+                pipe.ltrim(self._wake_key(client_id), 0, 0)
+                if self.task_ttl:
+                    for key in (self._tasks_key(client_id), self._enqueued_key(client_id), lane,
+                                self._wake_key(client_id)):
+                        pipe.expire(key, self.task_ttl)
+            # Registry of clients the reaper has to visit
+            pipe.sadd(self.CLIENTS_KEY, *targets)
+            self._track_broadcast(pipe, request_id, targets)
+            await pipe.execute()
+        return report
+
+    async def resolve_targets(self, groups: List[str], client_ids: List[str] = ()) -> List[str]:
+        """client_ids followed by the members of each group, without duplicates; one pipelined round trip."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for group in groups:
+                pipe.smembers(self._group_key(group))
+            members = await pipe.execute()
+        return list(dict.fromkeys([*client_ids, *(client_id for group in members for client_id in sorted(group))]))
+
+    async def add_group_members(self, group: str, client_ids: List[str]) -> int:
+        async with self._atomic_pipeline() as pipe:
+            pipe.sadd(self._group_key(group), *client_ids)
+            pipe.sadd(self.GROUPS_KEY, group)
+            added, _ = await pipe.execute()
+        return added
+
+    async def remove_group_members(self, group: str, client_ids: List[str]) -> int:
+        async with self._atomic_pipeline() as pipe:
+            pipe.srem(self._group_key(group), *client_ids)
+            pipe.scard(self._group_key(group))
+            removed, size = await pipe.execute()
+        if size == 0:
+            await self.redis.srem(self.GROUPS_KEY, group)
+        return removed
+
+    async def get_group_members(self, group: str) -> List[str]:
+        return sorted(await self.redis.smembers(self._group_key(group)))
+
+    async def list_groups(self) -> Dict[str, int]:
+        groups = sorted(await self.redis.smembers(self.GROUPS_KEY))
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for group in groups:
+                pipe.scard(self._group_key(group))
+            sizes = await pipe.execute()
+        return {group: size for group, size in zip(groups, sizes) if size}
+
+    async def _shed_oldest(self, client_id: str, count: int, priority: int) -> List[str]:
+        keys = [self._tasks_key(client_id), self._enqueued_key(client_id), self._deliveries_key(client_id),
+                self.METRICS_KEY, *self._lane_keys(client_id)[:priority + 1]]
+        return await self._shed_script(keys=keys, args=[count, PAYLOAD_REF, client_id])
+
+    def _queue_backlog(self, pipe, client_id: str) -> int:
+        """Queues the reads summing to the client's backlog on pipe; returns how many were queued."""
+        for lane in self._lane_keys(client_id):
+            pipe.llen(lane)
+        pipe.zcard(self._inflight_key(client_id))
+        return PRIORITY_LEVELS + 1
+
+    async def get_node_load(self, client_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Backlog read from the client's keys; ack rate decayed from ackrate:{client_id} (acks per second)."""
+        reads = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for client_id in client_ids:
+                reads.append(self._queue_backlog(pipe, client_id))
+                pipe.hmget(self._ack_rate_key(client_id), "count", "last")
+            results = await pipe.execute()
+
+        now_ms, window_ms, load = time.time() * 1000, ACK_RATE_WINDOW * 1000, {}
+        for client_id, count in zip(client_ids, reads):
+            backlog, (acks, last_ack) = results[:count], results[count]
+            results = results[count + 1:]
+            ack_rate = None
+            if acks is not None and last_ack is not None:
+                ack_rate = decayed_ack_count(float(acks), float(last_ack), now_ms, window_ms) / ACK_RATE_WINDOW
+            load[client_id] = {"backlog": sum(backlog), "ack_rate": ack_rate}
+        return load
+
+    def _track_broadcast(self, pipe, request_id: str, client_ids: List[str]) -> None:
+        """Queues the writes recording the expected target set of a broadcast."""
+        pipe.sadd(self._outstanding_key(request_id), *client_ids)
+        pipe.hincrby(self._status_key(request_id), "expected", len(client_ids))
+        if self.task_ttl:
+            # Past this point every undelivered task has expired, so the request can never complete
+            pipe.hsetnx(self._status_key(request_id), "deadline", time.time() + self.task_ttl)
+        if self.insight_ttl:
+            pipe.expire(self._outstanding_key(request_id), self.insight_ttl)
+            pipe.expire(self._status_key(request_id), self.insight_ttl)
+
+    async def dequeue_queries(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                              wait_timeout: float = 0.0) -> List[Dict[str, Any]]:
+        return [self.codec.decode(task) for task in await self._dequeue_bodies(client_id, max_batch, wait_timeout)]
+
+    async def dequeue_raw(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                          wait_timeout: float = 0.0) -> List[bytes]:
+        return [self.codec.to_json(task) for task in await self._dequeue_bodies(client_id, max_batch, wait_timeout)]
+
+    async def _dequeue_bodies(self, client_id: str, max_batch: int, wait_timeout: float) -> List[bytes]:
+        """Leases up to max_batch tasks (long polling up to wait_timeout) and returns their stored bodies."""
+        keys = [self._tasks_key(client_id), self._inflight_key(client_id), self._deliveries_key(client_id),
+                self._enqueued_key(client_id), self._wake_key(client_id), *self._lane_keys(client_id),
+                *self._latency_keys(client_id)]
+        deadline = time.monotonic() + wait_timeout
         while True:
-            # Atomically move from main queue to processing queue
-            task_data = await self.redis.lmove(source_queue, processing_queue, "RIGHT", "LEFT")
-            if not task_data:
-                break
-            tasks.append(json.loads(task_data))
-        return tasks
+            now = time.time()
+            # Atomically move up to max_batch tasks from the lanes to the in-flight set (single round trip)
+            raw_tasks = await self._dequeue_script(keys=keys, args=[
+                now + self.visibility_timeout, max_batch, PAYLOAD_REF, self.task_ttl or 0, int(now * 1000),
+                int(self.priority_aging * 1000), LATENCY_SAMPLES, PRIORITY_LEVELS
+            ])
+            remaining = deadline - time.monotonic()
+            if raw_tasks or remaining <= 0:
+                return raw_tasks
+            # Park on the wake list, which holds a token while any lane has tasks. The token is only
+            # a hint: another poller may win the race, then we simply wait again for the remaining time.
+            if not await self.redis.brpop([self._wake_key(client_id)], remaining):
+                return []
+
+    def _ack_call(self, client_id: str, request_id: str, client=None):
+        """The ack script call of one task; awaited directly, or queued on the pipeline `client`."""
+        keys = [self._inflight_key(client_id), self._tasks_key(client_id),
+                self._refs_key(request_id), self._payload_key(request_id), self._deliveries_key(client_id),
+                self._status_key(request_id), self._outstanding_key(request_id), self._enqueued_key(client_id),
+                self._ack_rate_key(client_id)]
+        return self._ack_script(keys=keys, args=[request_id, PAYLOAD_REF, client_id, self._updates_channel(request_id),
+                                                 int(time.time() * 1000), int(ACK_RATE_WINDOW * 1000)], client=client)
 
     async def ack(self, client_id: str, request_id: str) -> None:
-        """Removes the task from the processing queue once explicitly acknowledged."""
-        processing_queue = f"processing:{client_id}"
-
-        # We need to find and remove the specific task.
-        # In a high-throughput system, Redis Streams (XACK) is better,
-        # but for this list-based architecture, LREM works perfectly.
-        tasks = await self.redis.lrange(processing_queue, 0, -1)
-        for task_data in tasks:
-            task = json.loads(task_data)
-            if task["request_id"] == request_id:
-                await self.redis.lrem(processing_queue, 1, task_data)
-                break
+        """Removes the task from the in-flight set once explicitly acknowledged."""
+        await self._ack_call(client_id, request_id)
+
+    def _queue_insight(self, pipe, request_id: str, client_id: str, insight: str) -> None:
+        pipe.hset(self._results_key(request_id), client_id, insight)
+        if self.insight_ttl:
+            pipe.expire(self._results_key(request_id), self.insight_ttl)
+            pipe.expire(self._status_key(request_id), self.insight_ttl)
+            pipe.expire(self._outstanding_key(request_id), self.insight_ttl)
+        pipe.publish(self._updates_channel(request_id), "insight")
 
     async def save_insight(self, request_id: str, client_id: str, insight: str) -> None:
-        payload = {"client_id": client_id, "insight": insight}
-        await self.redis.lpush(f"request:{request_id}:insights", json.dumps(payload))
+        """Idempotent: a node re-submitting (retry, redelivery) replaces its previous insight."""
+        async with self._atomic_pipeline() as pipe:
+            self._queue_insight(pipe, request_id, client_id, insight)
+            await pipe.execute()
+
+    async def save_results(self, client_id: str, results: List[Tuple[str, str | None]]) -> None:
+        """Saves the insights and runs the ack scripts of the whole batch in one MULTI/EXEC transaction."""
+        if not self.PIPELINED_RESULTS:
+            return await super().save_results(client_id, results)
+        async with self._atomic_pipeline() as pipe:
+            for request_id, insight in results:
+                if insight is not None:
+                    self._queue_insight(pipe, request_id, client_id, insight)
+                await self._ack_call(client_id, request_id, client=pipe)
+            await pipe.execute()
+
+    def subscribe_updates(self, request_id: str) -> UpdateSubscription:
+        """Pub/sub subscription to request:{request_id}:updates, published by save_insight, ack and the reaper."""
+        return RedisUpdateSubscription(self.redis, self._updates_channel(request_id))
 
     async def get_consensus(self, request_id: str) -> List[Dict[str, Any]]:
-        raw_insights = await self.redis.lrange(f"request:{request_id}:insights", 0, -1)
-        return [json.loads(i) for i in raw_insights]
\ No newline at end of file
+        """One entry per node that submitted an insight."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._results_key(request_id))
+            pipe.lrange(self._insights_key(request_id), 0, -1)
+            results, legacy = await pipe.execute()
+        # Legacy list entries are newest first; keep one per client, never overriding the hash
+        for raw in legacy:
+            item = json.loads(raw)
+            results.setdefault(item["client_id"], item["insight"])
+        return [{"client_id": client_id, "insight": insight} for client_id, insight in results.items()]
+
+    async def get_status(self, request_id: str) -> Dict[str, Any]:
+        async with self._atomic_pipeline() as pipe:
+            pipe.hgetall(self._status_key(request_id))
+            pipe.scard(self._outstanding_key(request_id))
+            pipe.hlen(self._results_key(request_id))
+            counters, outstanding, insights = await pipe.execute()
+        expected = int(counters["expected"]) if "expected" in counters else None
+        deadline = float(counters["deadline"]) if "deadline" in counters else None
+        return consensus_status(expected, insights, int(counters.get("acks", 0)), outstanding, deadline)
+
+    async def _maintenance_loop(self) -> None:
+        last_report = time.monotonic()
+        while True:
+            try:
+                await self.reap_expired_leases()
+                if time.monotonic() - last_report >= self.report_interval:
+                    last_report = time.monotonic()
+                    report = await self.compact()
+                    logger.info(f"Compaction report: {report}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broker maintenance failed: {e}")
+            await asyncio.sleep(self.reap_interval)
+
+    async def _check_memory_budget(self, incoming_bytes: int) -> None:
+        """Raises BrokerCapacityError if writing incoming_bytes would exceed max_memory_bytes."""
+        if self.max_memory_bytes is None:
+            return
+        sampled_at, used = self._used_memory
+        # INFO is cheap but not free; one sample per second is plenty for admission control
+        if time.monotonic() - sampled_at > 1.0:
+            used = await self._sample_used_memory()
+            self._used_memory = (time.monotonic(), used)
+        if used + incoming_bytes > self.max_memory_bytes:
+            raise BrokerCapacityError(
+                f"Redis memory budget exhausted: {used + incoming_bytes} > {self.max_memory_bytes} bytes"
+            )
+
+    async def _sample_used_memory(self) -> int:
+        return (await self.redis.info("memory"))["used_memory"]
+
+    def _client_keys(self, client_id: str) -> List[str]:
+        """Keys that hold queued or in-flight work for a client."""
+        return [*self._lane_keys(client_id), self._tasks_key(client_id), self._inflight_key(client_id)]
+
+    async def compact(self) -> Dict[str, Any]:
+        """Drops clients whose task keys have all expired from the registry and reports memory usage."""
+        pruned = 0
+        async for client_id in self.redis.sscan_iter(self.CLIENTS_KEY):
+            if not await self.redis.exists(*self._client_keys(client_id)):
+                await self.redis.srem(self.CLIENTS_KEY, client_id)
+                pruned += 1
+        report = await self.memory_report()
+        report["pruned_clients"] = pruned
+        return report
+
+    async def memory_report(self) -> Dict[str, Any]:
+        """Redis memory usage, eviction/expiry counters and budget headroom."""
+        memory = await self.redis.info("memory")
+        stats = await self.redis.info("stats")
+        report = {
+            "used_memory": memory["used_memory"],
+            "used_memory_peak": memory["used_memory_peak"],
+            "maxmemory": memory.get("maxmemory", 0),
+            "maxmemory_policy": memory.get("maxmemory_policy"),
+            "fragmentation_ratio": memory.get("mem_fragmentation_ratio"),
+            "expired_keys": stats.get("expired_keys", 0),
+            "evicted_keys": stats.get("evicted_keys", 0),
+            "keys": await self.redis.dbsize(),
+            "clients": await self.redis.scard(self.CLIENTS_KEY),
+            "max_memory_bytes": self.max_memory_bytes,
+        }
+        if self.max_memory_bytes:
+            report["budget_used_ratio"] = round(memory["used_memory"] / self.max_memory_bytes, 4)
+        return report
+
+    async def reap_expired_leases(self, batch: int = 1000) -> Dict[str, int]:
+        """Re-queues or dead-letters every in-flight task whose lease has expired."""
+        totals = {"redelivered": 0, "dead_lettered": 0}
+        now = time.time()
+        async for client_id in self.redis.sscan_iter(self.CLIENTS_KEY):
+            lanes = self._lane_keys(client_id)
+            keys = [self._inflight_key(client_id), lanes[0], self._tasks_key(client_id),
+                    self._deliveries_key(client_id), self._deadletter_key(client_id), self.METRICS_KEY,
+                    self._enqueued_key(client_id), self._wake_key(client_id), *lanes[1:]]
+            requeued, dead = await self._reap_script(
+                keys=keys,
+                args=[now, self.max_deliveries, batch, PAYLOAD_REF, self.metadata_ttl or 0, client_id, self.task_ttl or 0]
+            )
+            if requeued or dead:
+                logger.warning(f"Lease expired for {client_id}: {requeued} re-queued, {dead} dead-lettered.")
+            totals["redelivered"] += requeued
+            totals["dead_lettered"] += dead
+        return totals
+
+    async def pickup_latency(self) -> Dict[str, Dict[str, Any]]:
+        """p50/p99 of every client's most recent pickup latencies (enqueue -> first delivery), per priority."""
+        clients = [client_id async for client_id in self.redis.sscan_iter(self.CLIENTS_KEY)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for client_id in clients:
+                for key in self._latency_keys(client_id):
+                    pipe.lrange(key, 0, -1)
+            samples = await pipe.execute()
+        return {
+            name: latency_summary([float(sample) for lane_samples in samples[priority::PRIORITY_LEVELS]
+                                   for sample in lane_samples])
+            for priority, name in enumerate(PRIORITY_NAMES)
+        }
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """
+        Lifetime redelivery counters, current in-flight count and oldest lease age, queue depth
+        per priority and the p50/p99 pickup latency per priority.
+        """
+        counters = await self.redis.hgetall(self.METRICS_KEY)
+        clients = [client_id async for client_id in self.redis.sscan_iter(self.CLIENTS_KEY)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for client_id in clients:
+                pipe.zcard(self._inflight_key(client_id))
+                pipe.zrange(self._inflight_key(client_id), 0, 0, withscores=True)
+                for lane in self._lane_keys(client_id):
+                    pipe.llen(lane)
+            results = await pipe.execute()
+
+        per_client = 2 + PRIORITY_LEVELS
+        in_flight = sum(results[0::per_client])
+        deadlines = [oldest[0][1] for oldest in results[1::per_client] if oldest]
+        queued = [sum(results[2 + priority::per_client]) for priority in range(PRIORITY_LEVELS)]
+        oldest_deadline = min(deadlines, default=None)
+
+        oldest_lease_age = 0.0
+        if oldest_deadline is not None:
+            oldest_lease_age = max(0.0, time.time() - (oldest_deadline - self.visibility_timeout))
+        return {
+            "redelivered_total": int(counters.get("redelivered", 0)),
+            "dead_lettered_total": int(counters.get("dead_lettered", 0)),
+            "shed_total": int(counters.get("shed", 0)),
+            "in_flight": in_flight,
+            "oldest_lease_age_s": round(oldest_lease_age, 3),
+            "visibility_timeout_s": self.visibility_timeout,
+            "queued": dict(zip(PRIORITY_NAMES, queued)),
+            "pickup_latency": await self.pickup_latency(),
+            "memory": await self.memory_report(),
+        }
@@ -0,0 +1,285 @@
+import time
+from typing import List, Dict, Any
+
+import redis.asyncio as redis
+from redis.asyncio.cluster import RedisCluster
+
+from aethelgard.brokers.redis_broker import RECORD_ACK_LUA, RedisBroker, RedisUpdateSubscription
+from aethelgard.core.broker import ACK_RATE_WINDOW, PRIORITY_NAMES, PRIORITY_ROUTINE, UpdateSubscription
+from aethelgard.core.config import get_logger
+
+logger = get_logger(__name__)
+
+# Client half of an ack: clears the lease, delivery count and task body; acking a leased task feeds
+# the client's ack rate. KEYS: inflight, tasks, deliveries, enqueued, ack rate (one {client_id} slot).
+# ARGV: request_id, now and ack-rate window in ms. Returns 1 if the task was still held.
+CLIENT_ACK_SCRIPT = RECORD_ACK_LUA + """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    record_ack(KEYS[5], tonumber(ARGV[2]), tonumber(ARGV[3]))
+end
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+return redis.call('HDEL', KEYS[2], ARGV[1])
+"""
+
+# Request half of an ack, dead-letter or shed: settles client ARGV[1] in the request's outstanding
+# set, counting an ack if ARGV[4] is '1', and publishes ARGV[3] on channel ARGV[2]. Idempotent.
+# KEYS: status, outstanding (one {request_id} slot). Returns 1 if the client was outstanding.
+SETTLE_SCRIPT = """
+if redis.call('SREM', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+if ARGV[4] == '1' then
+    redis.call('HINCRBY', KEYS[1], 'acks', 1)
+end
+redis.call('PUBLISH', ARGV[2], ARGV[3])
+return 1
+"""
+
+# Client half of the reaper (see REAP_SCRIPT): re-queues expired leases at the head of their
+# priority lane, or dead-letters them after ARGV[2] deliveries.
+# KEYS: inflight, tasks, deliveries, deadletter, enqueued, wake, then the lanes, lowest priority first.
+# ARGV: now, max_deliveries, limit, metadata_ttl, task_ttl.
+# Returns {requeued, dead-lettered request_id...}; the caller settles those requests.
+CLIENT_REAP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+local requeued, dead = 0, {}
+for _, request_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], request_id)
+    local deliveries = tonumber(redis.call('HGET', KEYS[3], request_id) or '0')
+    if deliveries >= tonumber(ARGV[2]) then
+        redis.call('HDEL', KEYS[2], request_id)
+        redis.call('HDEL', KEYS[3], request_id)
+        redis.call('HDEL', KEYS[5], request_id)
+        redis.call('LPUSH', KEYS[4], request_id)
+        table.insert(dead, request_id)
+    else
+        local meta = redis.call('HGET', KEYS[5], request_id)
+        local priority = meta and tonumber(string.match(meta, '^(%d+):')) or 0
+        redis.call('RPUSH', KEYS[7 + priority], request_id)
+        requeued = requeued + 1
+    end
+end
+if #dead > 0 and tonumber(ARGV[4]) > 0 then
+    redis.call('EXPIRE', KEYS[4], ARGV[4])
+end
+if requeued > 0 then
+    redis.call('LPUSH', KEYS[6], 1)
+    redis.call('LTRIM', KEYS[6], 0, 0)
+    if tonumber(ARGV[5]) > 0 then
+        redis.call('EXPIRE', KEYS[6], ARGV[5])
+    end
+end
+table.insert(dead, 1, requeued)
+return dead
+"""
+
+# Client half of shedding (see SHED_SCRIPT): drops up to ARGV[1] of the oldest queued tasks.
+# KEYS: tasks, enqueued, deliveries, then the lanes to shed from, lowest priority first.
+# Returns the shed request_ids; the caller settles those requests.
+CLIENT_SHED_SCRIPT = """
+local limit, shed = tonumber(ARGV[1]), {}
+for lane = 4, #KEYS do
+    while #shed < limit do
+        local request_id = redis.call('RPOP', KEYS[lane])
+        if not request_id then
+            break
+        end
+        if redis.call('HDEL', KEYS[1], request_id) == 1 then
+            redis.call('HDEL', KEYS[2], request_id)
+            redis.call('HDEL', KEYS[3], request_id)
+            table.insert(shed, request_id)
+        end
+    end
+end
+return shed
+"""
+
+
+class RedisClusterBroker(RedisBroker):
+    """
+    RedisBroker on a sharded Redis Cluster (redis.asyncio.cluster), so that throughput and memory
+    scale with the number of primaries. Every key carries a hash tag: a client's keys share the
+    {client_id} slot (queue:{client_id}, tasks:{client_id}, ...) and a request's keys share the
+    {request_id} slot (request:{request_id}:results, ...). Dequeue stays one atomic Lua script on
+    the client's slot; ack, dead-lettering and shedding touch both slots, so they run as a client
+    script followed by an idempotent request script (a retried ack completes a half-applied one).
+
+    Differences from RedisBroker:
+      - a broadcast is pipelined slot by slot rather than applied as one MULTI/EXEC
+      - `fanout` is not supported: a task body shared by all targets would span slots
+      - update subscriptions connect to the seed node of `redis_url`; cluster PUBLISH reaches
+        every node
+      - `max_memory_bytes` is a per-primary budget, checked against the fullest primary
+      - save_results() saves and acks task by task rather than in one MULTI/EXEC
+    """
+    # An ack also settles the request in its own slot (see _settle()), so results are applied one by one
+    PIPELINED_RESULTS = False
+
+    def __init__(self, redis_url: str = "redis://localhost:7000", **kwargs):
+        if kwargs.get("fanout"):
+            raise ValueError("RedisClusterBroker does not support fanout: a shared task body would span slots")
+        super().__init__(redis_url, **kwargs)
+        # Plain connection to the seed node for pub/sub
+        self._subscriber = redis.from_url(redis_url, decode_responses=True)
+        self._client_ack_script = self.redis.register_script(CLIENT_ACK_SCRIPT)
+        self._settle_script = self.redis.register_script(SETTLE_SCRIPT)
+        self._client_reap_script = self.redis.register_script(CLIENT_REAP_SCRIPT)
+        self._client_shed_script = self.redis.register_script(CLIENT_SHED_SCRIPT)
+
+    @staticmethod
+    def _connect(redis_url: str, decode_responses: bool) -> RedisCluster:
+        return RedisCluster.from_url(redis_url, decode_responses=decode_responses)
+
+    def _atomic_pipeline(self):
+        # MULTI/EXEC cannot span slots; the cluster pipeline groups commands per node instead
+        return self.redis.pipeline()
+
+    async def close(self) -> None:
+        await super().close()
+        await self._subscriber.aclose()
+
+    @staticmethod
+    def _queue_key(client_id: str, priority: int = PRIORITY_ROUTINE) -> str:
+        return f"queue:{{{client_id}}}" if priority == PRIORITY_ROUTINE else f"queue:{{{client_id}}}:p{priority}"
+
+    @staticmethod
+    def _enqueued_key(client_id: str) -> str:
+        return f"enqueued:{{{client_id}}}"
+
+    @staticmethod
+    def _wake_key(client_id: str) -> str:
+        return f"wake:{{{client_id}}}"
+
+    @staticmethod
+    def _latency_keys(client_id: str) -> List[str]:
+        return [f"metrics:pickup:{{{client_id}}}:{name}" for name in PRIORITY_NAMES]
+
+    @staticmethod
+    def _ack_rate_key(client_id: str) -> str:
+        return f"ackrate:{{{client_id}}}"
+
+    @staticmethod
+    def _tasks_key(client_id: str) -> str:
+        return f"tasks:{{{client_id}}}"
+
+    @staticmethod
+    def _inflight_key(client_id: str) -> str:
+        return f"inflight:{{{client_id}}}"
+
+    @staticmethod
+    def _deliveries_key(client_id: str) -> str:
+        return f"deliveries:{{{client_id}}}"
+
+    @staticmethod
+    def _deadletter_key(client_id: str) -> str:
+        return f"deadletter:{{{client_id}}}"
+
+    @staticmethod
+    def _group_key(group: str) -> str:
+        return f"group:{{{group}}}"
+
+    @staticmethod
+    def _payload_key(request_id: str) -> str:
+        return f"request:{{{request_id}}}:payload"
+
+    @staticmethod
+    def _refs_key(request_id: str) -> str:
+        return f"request:{{{request_id}}}:refs"
+
+    @staticmethod
+    def _results_key(request_id: str) -> str:
+        return f"request:{{{request_id}}}:results"
+
+    @staticmethod
+    def _insights_key(request_id: str) -> str:
+        return f"request:{{{request_id}}}:insights"
+
+    @staticmethod
+    def _status_key(request_id: str) -> str:
+        return f"request:{{{request_id}}}:status"
+
+    @staticmethod
+    def _outstanding_key(request_id: str) -> str:
+        return f"request:{{{request_id}}}:outstanding"
+
+    @staticmethod
+    def _updates_channel(request_id: str) -> str:
+        return f"request:{{{request_id}}}:updates"
+
+    async def _settle(self, request_id: str, client_id: str, event: str, acked: bool = False) -> int:
+        return await self._settle_script(
+            keys=[self._status_key(request_id), self._outstanding_key(request_id)],
+            args=[client_id, self._updates_channel(request_id), event, int(acked)]
+        )
+
+    async def ack(self, client_id: str, request_id: str) -> None:
+        await self._client_ack_script(
+            keys=[self._inflight_key(client_id), self._tasks_key(client_id), self._deliveries_key(client_id),
+                  self._enqueued_key(client_id), self._ack_rate_key(client_id)],
+            args=[request_id, int(time.time() * 1000), int(ACK_RATE_WINDOW * 1000)]
+        )
+        await self._settle(request_id, client_id, "ack", acked=True)
+
+    async def _shed_oldest(self, client_id: str, count: int, priority: int) -> List[str]:
+        keys = [self._tasks_key(client_id), self._enqueued_key(client_id), self._deliveries_key(client_id),
+                *self._lane_keys(client_id)[:priority + 1]]
+        shed = await self._client_shed_script(keys=keys, args=[count])
+        for request_id in shed:
+            await self._settle(request_id, client_id, "shed")
+        if shed:
+            await self.redis.hincrby(self.METRICS_KEY, "shed", len(shed))
+        return shed
+
+    def subscribe_updates(self, request_id: str) -> UpdateSubscription:
+        return RedisUpdateSubscription(self._subscriber, self._updates_channel(request_id))
+
+    async def reap_expired_leases(self, batch: int = 1000) -> Dict[str, int]:
+        """Re-queues or dead-letters every in-flight task whose lease has expired, client by client."""
+        totals = {"redelivered": 0, "dead_lettered": 0}
+        now = time.time()
+        async for client_id in self.redis.sscan_iter(self.CLIENTS_KEY):
+            keys = [self._inflight_key(client_id), self._tasks_key(client_id), self._deliveries_key(client_id),
+                    self._deadletter_key(client_id), self._enqueued_key(client_id), self._wake_key(client_id),
+                    *self._lane_keys(client_id)]
+            requeued, *dead = await self._client_reap_script(
+                keys=keys, args=[now, self.max_deliveries, batch, self.metadata_ttl or 0, self.task_ttl or 0]
+            )
+            for request_id in dead:
+                await self._settle(request_id, client_id, "dead_lettered")
+            if requeued or dead:
+                logger.warning(f"Lease expired for {client_id}: {requeued} re-queued, {len(dead)} dead-lettered.")
+            totals["redelivered"] += requeued
+            totals["dead_lettered"] += len(dead)
+        for name, count in totals.items():
+            if count:
+                await self.redis.hincrby(self.METRICS_KEY, name, count)
+        return totals
+
+    async def _primaries_info(self, section: str) -> List[Dict[str, Any]]:
+        await self.redis.initialize()
+        return [await self.redis.info(section, target_nodes=node) for node in self.redis.get_primaries()]
+
+    async def _sample_used_memory(self) -> int:
+        return max(info["used_memory"] for info in await self._primaries_info("memory"))
+
+    async def memory_report(self) -> Dict[str, Any]:
+        """Memory usage and eviction/expiry counters summed over the primaries; budget headroom of the fullest one."""
+        memory, stats = await self._primaries_info("memory"), await self._primaries_info("stats")
+        used = [info["used_memory"] for info in memory]
+        report = {
+            "primaries": len(memory),
+            "used_memory": sum(used),
+            "used_memory_peak": sum(info["used_memory_peak"] for info in memory),
+            "maxmemory": sum(info.get("maxmemory", 0) for info in memory),
+            "maxmemory_policy": memory[0].get("maxmemory_policy") if memory else None,
+            "fragmentation_ratio": max((info.get("mem_fragmentation_ratio", 0) for info in memory), default=None),
+            "expired_keys": sum(info.get("expired_keys", 0) for info in stats),
+            "evicted_keys": sum(info.get("evicted_keys", 0) for info in stats),
+            "keys": await self.redis.dbsize(),
+            "clients": await self.redis.scard(self.CLIENTS_KEY),
+            "max_memory_bytes": self.max_memory_bytes,
+        }
+        if self.max_memory_bytes and used:
+            report["budget_used_ratio"] = round(max(used) / self.max_memory_bytes, 4)
+        return report
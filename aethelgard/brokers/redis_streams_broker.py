@@ -0,0 +1,447 @@
+import time
+from typing import List, Dict, Any
+
+from redis.exceptions import ResponseError
+
+from aethelgard.brokers.redis_broker import RECORD_ACK_LUA, RedisBroker
+from aethelgard.core.broker import (
+    ACK_RATE_WINDOW, DEFAULT_MAX_BATCH, LATENCY_SAMPLES, PRIORITY_LEVELS, PRIORITY_NAMES, PRIORITY_ROUTINE,
+    admission_report, validate_priority
+)
+from aethelgard.core.config import get_logger
+
+logger = get_logger(__name__)
+
+# XADD + index the server-assigned entry id by request_id, in one server-side step.
+ENQUEUE_SCRIPT = """
+local entry_id = redis.call('XADD', KEYS[1], '*', 'request_id', ARGV[1], 'task', ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], entry_id)
+return entry_id
+"""
+
+# Lua helper shared by the dequeue and shed scripts: the group's last-delivered id on a stream,
+# read with XINFO GROUPS. A stream that expired (task_ttl), or was recreated by XADD without the
+# group, gets the group back from id 0, so that no entry is skipped.
+GROUP_CURSOR_LUA = """
+local function group_cursor(stream, group)
+    local groups = redis.pcall('XINFO', 'GROUPS', stream)
+    if not groups.err then
+        for _, info in ipairs(groups) do
+            local name, cursor
+            for i = 1, #info, 2 do
+                if info[i] == 'name' then
+                    name = info[i + 1]
+                elseif info[i] == 'last-delivered-id' then
+                    cursor = info[i + 1]
+                end
+            end
+            if name == group then
+                return cursor
+            end
+        end
+    end
+    redis.call('XGROUP', 'CREATE', stream, group, '0', 'MKSTREAM')
+    return '0-0'
+end
+"""
+
+# Delivers up to ARGV[3] tasks to consumer ARGV[2] of group ARGV[1].
+# KEYS: metrics, wake, dead-letter list, then the ARGV[8] lane streams, their pickup-latency lists
+# and their indexes, lowest priority first.
+# 1. Entries left pending longer than ARGV[4] ms are reclaimed (XAUTOCLAIM), highest lane first.
+#    A reclaimed entry that would exceed ARGV[10] deliveries (XPENDING count) is dead-lettered
+#    instead: XACK + XDEL + HDEL, its request_id pushed on the dead-letter list (TTL ARGV[11]).
+# 2. The batch is filled with new entries, one XREADGROUP at a time from the lane whose next entry
+#    (after the group's last-delivered id) has the highest effective priority: its level plus one
+#    per ARGV[6] ms waited (the entry id carries its enqueue time).
+# New deliveries sample their pickup latency (ARGV[5] now - entry time, ms), keeping ARGV[7]
+# (TTL ARGV[9], as the wake list).
+# The wake list keeps one token (TTL ARGV[9]) while any lane has undelivered entries.
+# Returns {reclaimed count, dead-lettered count, dead-lettered request_id..., task...}; the caller
+# settles the dead-lettered requests.
+DEQUEUE_SCRIPT = GROUP_CURSOR_LUA + """
+local group, consumer = ARGV[1], ARGV[2]
+local limit, levels = tonumber(ARGV[3]), tonumber(ARGV[8])
+local now, aging = tonumber(ARGV[5]), tonumber(ARGV[6])
+local max_deliveries, metadata_ttl = tonumber(ARGV[10]), tonumber(ARGV[11])
+local function field(fields, name)
+    for i = 1, #fields, 2 do
+        if fields[i] == name then
+            return fields[i + 1]
+        end
+    end
+end
+local function entry_time(entry_id)
+    return tonumber(string.match(entry_id, '^(%d+)'))
+end
+local cursors = {}
+for lane = 1, levels do
+    cursors[lane] = group_cursor(KEYS[3 + lane], group)
+end
+local tasks, dead = {}, {}
+for lane = levels, 1, -1 do
+    if #tasks >= limit then
+        break
+    end
+    local stream = KEYS[3 + lane]
+    local reply = redis.call('XAUTOCLAIM', stream, group, consumer, ARGV[4], '0-0', 'COUNT', limit - #tasks)
+    for _, entry in ipairs(reply[2]) do
+        -- Entries deleted while pending come back without fields
+        if entry[2] then
+            -- XAUTOCLAIM has counted this delivery already
+            local pending = redis.call('XPENDING', stream, group, entry[1], entry[1], 1)
+            if pending[1] and tonumber(pending[1][4]) > max_deliveries then
+                local request_id = field(entry[2], 'request_id')
+                redis.call('XACK', stream, group, entry[1])
+                redis.call('XDEL', stream, entry[1])
+                redis.call('HDEL', KEYS[3 + 2 * levels + lane], request_id)
+                redis.call('LPUSH', KEYS[3], request_id)
+                table.insert(dead, request_id)
+            else
+                table.insert(tasks, field(entry[2], 'task'))
+            end
+        end
+    end
+end
+local reclaimed = #tasks
+if reclaimed > 0 then
+    redis.call('HINCRBY', KEYS[1], 'redelivered', reclaimed)
+end
+if #dead > 0 then
+    redis.call('HINCRBY', KEYS[1], 'dead_lettered', #dead)
+    if metadata_ttl > 0 then
+        redis.call('EXPIRE', KEYS[3], metadata_ttl)
+    end
+end
+local heads = {}
+local function peek(lane, after)
+    local entries = redis.call('XRANGE', KEYS[3 + lane], '(' .. after, '+', 'COUNT', 1)
+    heads[lane] = nil
+    if entries[1] then
+        heads[lane] = lane - 1
+        if aging > 0 then
+            heads[lane] = heads[lane] + (now - entry_time(entries[1][1])) / aging
+        end
+    end
+end
+for lane = 1, levels do
+    peek(lane, cursors[lane])
+end
+while #tasks < limit do
+    local best
+    for lane = levels, 1, -1 do
+        if heads[lane] and (not best or heads[lane] > heads[best]) then
+            best = lane
+        end
+    end
+    if not best then
+        break
+    end
+    local reply = redis.call('XREADGROUP', 'GROUP', group, consumer, 'COUNT', 1, 'STREAMS', KEYS[3 + best], '>')
+    if reply then
+        local entry = reply[1][2][1]
+        table.insert(tasks, field(entry[2], 'task'))
+        local latency_key = KEYS[3 + levels + best]
+        redis.call('LPUSH', latency_key, now - entry_time(entry[1]))
+        redis.call('LTRIM', latency_key, 0, tonumber(ARGV[7]) - 1)
+        if tonumber(ARGV[9]) > 0 then
+            redis.call('EXPIRE', latency_key, ARGV[9])
+        end
+        peek(best, entry[1])
+    else
+        heads[best] = nil
+    end
+end
+if next(heads) then
+    redis.call('LPUSH', KEYS[2], 1)
+    redis.call('LTRIM', KEYS[2], 0, 0)
+    if tonumber(ARGV[9]) > 0 then
+        redis.call('EXPIRE', KEYS[2], ARGV[9])
+    end
+else
+    redis.call('DEL', KEYS[2])
+end
+local reply = {reclaimed, #dead}
+for _, request_id in ipairs(dead) do
+    table.insert(reply, request_id)
+end
+for _, task in ipairs(tasks) do
+    table.insert(reply, task)
+end
+return reply
+"""
+
+# Counts the client's first ack toward the request status, then finds the lane whose index holds
+# the request, and XACK + XDEL + HDEL its entry; acking a pending entry feeds the client's ack rate.
+# KEYS: status, outstanding, ack rate, then (stream, index) for each lane.
+# ARGV: group, request_id, client_id, updates channel, now and ack-rate window in ms.
+ACK_SCRIPT = RECORD_ACK_LUA + """
+if redis.call('SREM', KEYS[2], ARGV[3]) == 1 then
+    redis.call('HINCRBY', KEYS[1], 'acks', 1)
+    redis.call('PUBLISH', ARGV[4], 'ack')
+end
+for i = 4, #KEYS, 2 do
+    local entry_id = redis.call('HGET', KEYS[i + 1], ARGV[2])
+    if entry_id then
+        if redis.call('XACK', KEYS[i], ARGV[1], entry_id) == 1 then
+            record_ack(KEYS[3], tonumber(ARGV[5]), tonumber(ARGV[6]))
+        end
+        redis.call('XDEL', KEYS[i], entry_id)
+        redis.call('HDEL', KEYS[i + 1], ARGV[2])
+        return 1
+    end
+end
+return 0
+"""
+
+# Drops up to ARGV[1] of the client's oldest undelivered entries (admission control, shed_oldest
+# policy) and settles the client ARGV[2] in each request's outstanding set.
+# KEYS: metrics, then (stream, index) for each lane to shed from, lowest priority first.
+# Only entries after group ARGV[3]'s last-delivered id are shed, never pending ones.
+# Returns the shed request_ids.
+SHED_SCRIPT = GROUP_CURSOR_LUA + """
+local limit, shed = tonumber(ARGV[1]), {}
+for i = 2, #KEYS, 2 do
+    if #shed >= limit then
+        break
+    end
+    local cursor = group_cursor(KEYS[i], ARGV[3])
+    local entries = redis.call('XRANGE', KEYS[i], '(' .. cursor, '+', 'COUNT', limit - #shed)
+    for _, entry in ipairs(entries) do
+        local request_id
+        for f = 1, #entry[2], 2 do
+            if entry[2][f] == 'request_id' then
+                request_id = entry[2][f + 1]
+            end
+        end
+        redis.call('XDEL', KEYS[i], entry[1])
+        redis.call('HDEL', KEYS[i + 1], request_id)
+        if redis.call('SREM', 'request:' .. request_id .. ':outstanding', ARGV[2]) == 1 then
+            redis.call('PUBLISH', 'request:' .. request_id .. ':updates', 'shed')
+        end
+        table.insert(shed, request_id)
+    end
+end
+if #shed > 0 then
+    redis.call('HINCRBY', KEYS[1], 'shed', #shed)
+end
+return shed
+"""
+
+
+class RedisStreamsBroker(RedisBroker):
+    """
+    Redis Streams broker using consumer groups.
+    Each client owns one stream per priority lane (stream:{client_id} for routine tasks,
+    stream:{client_id}:p1 and :p2 for urgent and stat ones); in-flight tasks live in the group's
+    Pending Entries List and are acknowledged with XACK. Entries left pending longer than
+    `visibility_timeout` (e.g. the node crashed mid-task) are redelivered via XAUTOCLAIM on the
+    next poll, or dead-lettered there once delivered `max_deliveries` times; the reaper dead-letters
+    the exhausted entries that no poll reclaims.
+    New entries are delivered highest lane first, with the same `priority_aging` as RedisBroker.
+    Insights, consensus, TTLs, the memory budget and admission control behave exactly as in RedisBroker,
+    whose keyword arguments are accepted as well (`fanout` has no effect here).
+    """
+
+    def __init__(self, redis_url: str = "redis://localhost:6379", group: str = "aethelgard", **kwargs):
+        super().__init__(redis_url, **kwargs)
+        self.group = group
+        self._known_groups: set[str] = set()
+        self._enqueue_script = self.redis.register_script(ENQUEUE_SCRIPT)
+        self._streams_dequeue_script = self._raw_redis.register_script(DEQUEUE_SCRIPT)
+        self._ack_script = self.redis.register_script(ACK_SCRIPT)
+        self._shed_script = self.redis.register_script(SHED_SCRIPT)
+
+    @staticmethod
+    def _stream_key(client_id: str, priority: int = PRIORITY_ROUTINE) -> str:
+        return f"stream:{client_id}" if priority == PRIORITY_ROUTINE else f"stream:{client_id}:p{priority}"
+
+    @classmethod
+    def _index_key(cls, client_id: str, priority: int = PRIORITY_ROUTINE) -> str:
+        return f"{cls._stream_key(client_id, priority)}:index"
+
+    def _stream_keys(self, client_id: str) -> List[str]:
+        """Streams of every priority lane, lowest priority first."""
+        return [self._stream_key(client_id, priority) for priority in range(PRIORITY_LEVELS)]
+
+    async def _ensure_groups(self, streams: List[str]) -> None:
+        missing = [stream for stream in dict.fromkeys(streams) if stream not in self._known_groups]
+        if not missing:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for stream in missing:
+                # id=0 so that entries added before the group existed are still delivered
+                pipe.xgroup_create(stream, self.group, id="0", mkstream=True)
+            results = await pipe.execute(raise_on_error=False)
+        for stream, result in zip(missing, results):
+            if isinstance(result, ResponseError) and "BUSYGROUP" not in str(result):
+                raise result
+            self._known_groups.add(stream)
+
+    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float],
+                            priority: int = PRIORITY_ROUTINE) -> None:
+        await self.enqueue_many(request_id, [client_id], query_vector, priority)
+
+    async def enqueue_many(self, request_id: str, client_ids: List[str], query_vector: List[float],
+                           priority: int = PRIORITY_ROUTINE) -> Dict[str, Any]:
+        validate_priority(priority)
+        targets, shed_counts = await self._admit(client_ids)
+        shed = {client_id: await self._shed_oldest(client_id, count, priority) for client_id, count in shed_counts.items()}
+        report = admission_report([client_id for client_id in client_ids if client_id not in targets], shed)
+        if not targets:
+            return report
+        await self._ensure_groups([self._stream_key(client_id, priority) for client_id in targets])
+
+        task = self.codec.encode(request_id, query_vector)
+        await self._check_memory_budget(len(task) * len(targets))
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for client_id in targets:
+                stream, index = self._stream_key(client_id, priority), self._index_key(client_id, priority)
+                await self._enqueue_script(keys=[stream, index], args=[request_id, task], client=pipe)
+                pipe.lpush(self._wake_key(client_id), 1)
+                pipe.ltrim(self._wake_key(client_id), 0, 0)
+                if self.task_ttl:
+                    for key in (stream, index, self._wake_key(client_id)):
+                        pipe.expire(key, self.task_ttl)
+            pipe.sadd(self.CLIENTS_KEY, *targets)
+            self._track_broadcast(pipe, request_id, targets)
+            await pipe.execute()
+        return report
+
+    async def _shed_oldest(self, client_id: str, count: int, priority: int) -> List[str]:
+        streams = self._stream_keys(client_id)[:priority + 1]
+        keys = [self.METRICS_KEY]
+        for stream in streams:
+            keys += [stream, f"{stream}:index"]
+        return await self._shed_script(keys=keys, args=[count, client_id, self.group])
+
+    def _queue_backlog(self, pipe, client_id: str) -> int:
+        # Entries stay indexed until acked or dead-lettered, so the indexes count queued + pending entries
+        for stream in self._stream_keys(client_id):
+            pipe.hlen(f"{stream}:index")
+        return PRIORITY_LEVELS
+
+    def _client_keys(self, client_id: str) -> List[str]:
+        streams = self._stream_keys(client_id)
+        return streams + [f"{stream}:index" for stream in streams]
+
+    async def _dequeue_bodies(self, client_id: str, max_batch: int, wait_timeout: float) -> List[bytes]:
+        streams = self._stream_keys(client_id)
+        keys = [self.METRICS_KEY, self._wake_key(client_id), self._deadletter_key(client_id), *streams,
+                *self._latency_keys(client_id), *(f"{stream}:index" for stream in streams)]
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            # One round trip: the script reads the group cursors itself (see GROUP_CURSOR_LUA)
+            reclaimed, dead_lettered, *raw_tasks = await self._streams_dequeue_script(keys=keys, args=[
+                self.group, client_id, max_batch, int(self.visibility_timeout * 1000), int(time.time() * 1000),
+                int(self.priority_aging * 1000), LATENCY_SAMPLES, PRIORITY_LEVELS, self.task_ttl or 0,
+                self.max_deliveries, self.metadata_ttl or 0
+            ])
+            if reclaimed:
+                logger.warning(f"Redelivering {reclaimed} stale tasks to {client_id}.")
+            if dead_lettered:
+                request_ids = [request_id.decode() for request_id in raw_tasks[:dead_lettered]]
+                raw_tasks = raw_tasks[dead_lettered:]
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    self._settle_dead_lettered(pipe, client_id, request_ids)
+                    await pipe.execute()
+                logger.warning(f"Dead-lettered {dead_lettered} tasks for {client_id}.")
+            remaining = deadline - time.monotonic()
+            if raw_tasks or remaining <= 0:
+                return raw_tasks
+            if not await self.redis.brpop([self._wake_key(client_id)], remaining):
+                return []
+
+    def _ack_call(self, client_id: str, request_id: str, client=None):
+        """XACKs and deletes the stream entry holding this request, whichever lane it is in."""
+        keys = [self._status_key(request_id), self._outstanding_key(request_id), self._ack_rate_key(client_id)]
+        for priority in range(PRIORITY_LEVELS):
+            keys += [self._stream_key(client_id, priority), self._index_key(client_id, priority)]
+        return self._ack_script(keys=keys, args=[self.group, request_id, client_id, self._updates_channel(request_id),
+                                                 int(time.time() * 1000), int(ACK_RATE_WINDOW * 1000)], client=client)
+
+    async def reap_expired_leases(self, batch: int = 1000) -> Dict[str, int]:
+        """Dead-letters pending entries that exhausted max_deliveries; redelivery itself happens at poll time."""
+        totals = {"redelivered": 0, "dead_lettered": 0}
+        async for client_id in self.redis.sscan_iter(self.CLIENTS_KEY):
+            for priority in range(PRIORITY_LEVELS):
+                totals["dead_lettered"] += await self._dead_letter_exhausted(client_id, priority, batch)
+        return totals
+
+    async def _dead_letter_exhausted(self, client_id: str, priority: int, batch: int) -> int:
+        stream, index = self._stream_key(client_id, priority), self._index_key(client_id, priority)
+        try:
+            pending = await self.redis.xpending_range(
+                stream, self.group, "-", "+", batch, idle=int(self.visibility_timeout * 1000)
+            )
+        except ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            self._known_groups.discard(stream)  # expired stream: nothing is pending
+            return 0
+        exhausted = [p["message_id"] for p in pending if p["times_delivered"] >= self.max_deliveries]
+        if not exhausted:
+            return 0
+
+        async with self._raw_redis.pipeline(transaction=False) as pipe:
+            for entry_id in exhausted:
+                pipe.xrange(stream, entry_id, entry_id)
+            entries = await pipe.execute()
+        request_ids = [entry[0][1][b"request_id"].decode() for entry in entries if entry]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(stream, self.group, *exhausted)
+            pipe.xdel(stream, *exhausted)
+            if request_ids:
+                pipe.hdel(index, *request_ids)
+                pipe.lpush(self._deadletter_key(client_id), *request_ids)
+                self._settle_dead_lettered(pipe, client_id, request_ids)
+                if self.metadata_ttl:
+                    pipe.expire(self._deadletter_key(client_id), self.metadata_ttl)
+            pipe.hincrby(self.METRICS_KEY, "dead_lettered", len(exhausted))
+            await pipe.execute()
+        logger.warning(f"Dead-lettered {len(exhausted)} tasks for {client_id}.")
+        return len(exhausted)
+
+    def _settle_dead_lettered(self, pipe, client_id: str, request_ids: List[str]) -> None:
+        """Queues the removal of the client from the requests' outstanding sets, and notifies them."""
+        for request_id in request_ids:
+            pipe.srem(self._outstanding_key(request_id), client_id)
+            pipe.publish(self._updates_channel(request_id), "dead_lettered")
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """
+        Lifetime redelivery counters plus current pending-entry count, oldest idle time, queue depth
+        per priority and pickup latency.
+        """
+        counters = await self.redis.hgetall(self.METRICS_KEY)
+        # Lanes of each client, lowest priority first (see _stream_keys())
+        streams = [stream async for client_id in self.redis.sscan_iter(self.CLIENTS_KEY)
+                   for stream in self._stream_keys(client_id)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for stream in streams:
+                # Entries are ordered by id, so the first pending entry is the oldest lease
+                pipe.xpending_range(stream, self.group, "-", "+", 1)
+                pipe.xpending(stream, self.group)
+                pipe.xlen(stream)
+            results = await pipe.execute(raise_on_error=False)
+
+        in_flight, oldest_idle_ms, queued = 0, 0, [0] * PRIORITY_LEVELS
+        for i, (oldest, summary, length) in enumerate(zip(results[0::3], results[1::3], results[2::3])):
+            # Without a group (NOGROUP) nothing was delivered yet
+            pending = 0 if isinstance(summary, Exception) else summary["pending"]
+            # Acked and dead-lettered entries are deleted: the rest of the stream awaits delivery
+            queued[i % PRIORITY_LEVELS] += max(0, length - pending)
+            in_flight += pending
+            if pending and oldest and not isinstance(oldest, Exception):
+                oldest_idle_ms = max(oldest_idle_ms, oldest[0]["time_since_delivered"])
+        return {
+            "redelivered_total": int(counters.get("redelivered", 0)),
+            "dead_lettered_total": int(counters.get("dead_lettered", 0)),
+            "shed_total": int(counters.get("shed", 0)),
+            "in_flight": in_flight,
+            "oldest_lease_age_s": round(oldest_idle_ms / 1000, 3),
+            "visibility_timeout_s": self.visibility_timeout,
+            "queued": dict(zip(PRIORITY_NAMES, queued)),
+            "pickup_latency": await self.pickup_latency(),
+            "memory": await self.memory_report(),
+        }
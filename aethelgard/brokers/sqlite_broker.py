@@ -0,0 +1,552 @@
+import asyncio
+import sqlite3
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Tuple
+
+from aethelgard.core.broker import (
+    AckRateTracker, AdmissionControl, BaseTaskBroker, DEFAULT_MAX_BATCH, DEFAULT_PRIORITY_AGING, LATENCY_SAMPLES,
+    PRIORITY_LEVELS, PRIORITY_NAMES, PRIORITY_ROUTINE, LocalUpdateHub, UpdateSubscription, admission_report,
+    consensus_status, effective_priority, latency_summary, validate_priority
+)
+from aethelgard.core.codec import TaskCodec, JsonTaskCodec
+from aethelgard.core.config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SQLITE_BROKER_DB = "./broker_state.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payloads (
+    request_id TEXT PRIMARY KEY,
+    task BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id TEXT NOT NULL,
+    request_id TEXT NOT NULL,
+    lease_deadline REAL,
+    deliveries INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL,
+    UNIQUE (client_id, request_id)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_leases ON tasks (lease_deadline) WHERE lease_deadline IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_tasks_request ON tasks (request_id);
+CREATE TABLE IF NOT EXISTS deadletter (
+    client_id TEXT NOT NULL,
+    request_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS insights (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    insight TEXT NOT NULL,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS requests (
+    request_id TEXT PRIMARY KEY,
+    expected INTEGER NOT NULL DEFAULT 0,
+    acks INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_name TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    PRIMARY KEY (group_name, client_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteBroker(BaseTaskBroker):
+    """
+    Durable single-file broker for orchestrators without Redis.
+
+    Tables:
+      - payloads    one row per broadcast (the task body, encoded with `codec`, is stored once
+                    whatever the fan-out)
+      - tasks       one row per (client_id, request_id); pending while lease_deadline IS NULL,
+                    in flight until lease_deadline; deleted on ack. A poll reads the head of
+                    each priority lane and serves the highest, aged by `priority_aging` as in
+                    RedisBroker
+      - insights    one row per (request_id, client_id); a re-submission replaces the node's insight
+                    and its created_at
+      - requests    completion counters per broadcast (expected targets, acks);
+                    targets still outstanding are the request's remaining tasks rows
+      - deadletter  tasks that exhausted max_deliveries
+      - group_members  named node groups; a group broadcast resolves its members and inserts
+                    their tasks rows in the same transaction
+
+    The database runs in WAL mode, so readers never block the writer and commits are a
+    sequential log append. All SQLite calls go through one dedicated thread (sqlite3
+    connections are not thread-safe, and a single writer avoids lock contention), keeping
+    the FastAPI event loop free; each broker operation is a single transaction, and a
+    broadcast inserts every target row with one executemany().
+
+    Broadcasts to saturated nodes are handled by `admission` (see AdmissionControl); shed tasks
+    are deleted like acked ones. Ack rates, like pickup latencies, are measured per process.
+
+    Retention mirrors RedisBroker's TTLs: every `prune_interval` seconds the reaper drops a request's
+    insights `insight_ttl` seconds after its last insight, its requests row once it is that old and
+    neither insights nor tasks remain, and dead-letter rows older than `metadata_ttl` (None keeps them).
+
+    A task round trip (enqueue -> dequeue -> insight -> ack) is three or four transactions on the
+    single writer thread; measure its throughput on the target host with
+    `python benchmarks/bench_suite.py --brokers sqlite`.
+    """
+
+    serialised_tasks = True
+    # Processes share the database file; waits and leases are re-checked against it (see wait_recheck_interval)
+    multiprocess_safe = True
+
+    def __init__(self, db_path: str = DEFAULT_SQLITE_BROKER_DB, visibility_timeout: float = 300.0,
+                 max_deliveries: int = 5, reap_interval: float = 15.0, codec: TaskCodec | None = None,
+                 wait_recheck_interval: float = 1.0, priority_aging: float = DEFAULT_PRIORITY_AGING,
+                 admission: AdmissionControl | None = None, insight_ttl: int | None = 7 * 86_400,
+                 metadata_ttl: int | None = 7 * 86_400, prune_interval: float = 300.0):
+        self.db_path = db_path
+        self.insight_ttl = insight_ttl
+        self.metadata_ttl = metadata_ttl
+        self.prune_interval = prune_interval
+        self.priority_aging = priority_aging
+        self.admission = admission
+        # Pickup latencies (ms) of the tasks delivered by this process, and the ack rates it saw
+        self._latency = [deque(maxlen=LATENCY_SAMPLES) for _ in range(PRIORITY_LEVELS)]
+        self._ack_rates = AckRateTracker()
+        self.wait_recheck_interval = wait_recheck_interval
+        self._events: Dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        # Other processes sharing the file cannot notify us, hence the periodic re-check
+        self._updates = LocalUpdateHub(recheck_interval=wait_recheck_interval)
+        self.codec = codec or JsonTaskCodec()
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.reap_interval = reap_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-broker")
+        self._reaper: asyncio.Task | None = None
+        self.conn: sqlite3.Connection = self._executor.submit(self._connect).result()
+        logger.info(f"starting sqlite broker at {db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable against application crashes in WAL mode; only an OS crash can lose the last commits
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        if "priority" not in columns:
+            # Databases created before priority lanes: existing tasks become routine
+            conn.execute("ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE tasks ADD COLUMN enqueued_at REAL")
+            conn.execute("DROP INDEX IF EXISTS idx_tasks_queue")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_lanes ON tasks (client_id, priority, lease_deadline, seq)")
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_insights_client'").fetchone():
+            # Databases created before insights were keyed by client may hold duplicates: keep the latest
+            conn.execute(
+                "DELETE FROM insights WHERE id NOT IN (SELECT MAX(id) FROM insights GROUP BY request_id, client_id)"
+            )
+            conn.execute("CREATE UNIQUE INDEX idx_insights_client ON insights (request_id, client_id)")
+            conn.execute("DROP INDEX IF EXISTS idx_insights_request")
+        if "created_at" not in {row[1] for row in conn.execute("PRAGMA table_info(insights)")}:
+            # Databases created before retention: existing insights start their insight_ttl now
+            conn.execute("ALTER TABLE insights ADD COLUMN created_at REAL")
+            conn.execute("UPDATE insights SET created_at = ?", (time.time(),))
+        return conn
+
+    async def _run(self, fn: Callable, *args):
+        """Runs fn(conn, *args) inside one transaction on the broker thread."""
+        def transaction():
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn, *args)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+        return await asyncio.get_running_loop().run_in_executor(self._executor, transaction)
+
+    async def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reaper_loop())
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.conn.close)
+        self._executor.shutdown(wait=False)
+
+    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float],
+                            priority: int = PRIORITY_ROUTINE) -> None:
+        await self.enqueue_many(request_id, [client_id], query_vector, priority)
+
+    async def enqueue_many(self, request_id: str, client_ids: List[str], query_vector: List[float],
+                           priority: int = PRIORITY_ROUTINE) -> Dict[str, Any]:
+        validate_priority(priority)
+        targets, shed_counts = await self._admit(client_ids)
+        task = self.codec.encode(request_id, query_vector)
+        now = time.time()
+
+        def write(conn: sqlite3.Connection):
+            shed = {client_id: self._shed(conn, client_id, count, priority) for client_id, count in shed_counts.items()}
+            self._insert_tasks(conn, request_id, targets, task, priority, now)
+            return shed
+        shed = await self._run(write)
+        for client_id in targets:
+            self._events[client_id].set()
+        for request_id in {request_id for request_ids in shed.values() for request_id in request_ids}:
+            self._updates.notify(request_id)
+        return admission_report([client_id for client_id in client_ids if client_id not in targets], shed)
+
+    @staticmethod
+    def _insert_tasks(conn: sqlite3.Connection, request_id: str, client_ids: List[str], task: bytes | str,
+                      priority: int, now: float) -> None:
+        if not client_ids:
+            return
+        conn.execute("INSERT OR IGNORE INTO payloads (request_id, task) VALUES (?, ?)", (request_id, task))
+        added = conn.executemany(
+            "INSERT OR IGNORE INTO tasks (client_id, request_id, priority, enqueued_at) VALUES (?, ?, ?, ?)",
+            [(client_id, request_id, priority, now) for client_id in client_ids]
+        ).rowcount
+        conn.execute(
+            "INSERT INTO requests (request_id, expected, created_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (request_id) DO UPDATE SET expected = expected + excluded.expected",
+            (request_id, added, time.time())
+        )
+
+    async def enqueue_groups(self, request_id: str, groups: List[str], query_vector: List[float],
+                             priority: int = PRIORITY_ROUTINE, client_ids: List[str] = ()) -> Dict[str, Any]:
+        """Resolves the members and inserts their tasks in one transaction (admission control needs two)."""
+        if self.admission is not None:
+            return await super().enqueue_groups(request_id, groups, query_vector, priority, client_ids)
+        validate_priority(priority)
+        task = self.codec.encode(request_id, query_vector)
+        now = time.time()
+
+        def write(conn: sqlite3.Connection):
+            targets = list(dict.fromkeys([*client_ids, *self._members(conn, groups)]))
+            self._insert_tasks(conn, request_id, targets, task, priority, now)
+            return targets
+        targets = await self._run(write)
+        for client_id in targets:
+            self._events[client_id].set()
+        return {**admission_report(), "targets": len(targets)}
+
+    @staticmethod
+    def _members(conn: sqlite3.Connection, groups: List[str]) -> List[str]:
+        if not groups:
+            return []
+        return [client_id for client_id, in conn.execute(
+            f"SELECT DISTINCT client_id FROM group_members WHERE group_name IN ({', '.join('?' * len(groups))}) "
+            "ORDER BY client_id", list(groups)
+        )]
+
+    async def add_group_members(self, group: str, client_ids: List[str]) -> int:
+        def write(conn: sqlite3.Connection):
+            return conn.executemany(
+                "INSERT OR IGNORE INTO group_members (group_name, client_id) VALUES (?, ?)",
+                [(group, client_id) for client_id in client_ids]
+            ).rowcount
+        return await self._run(write)
+
+    async def remove_group_members(self, group: str, client_ids: List[str]) -> int:
+        def write(conn: sqlite3.Connection):
+            return conn.executemany(
+                "DELETE FROM group_members WHERE group_name = ? AND client_id = ?",
+                [(group, client_id) for client_id in client_ids]
+            ).rowcount
+        return await self._run(write)
+
+    async def get_group_members(self, group: str) -> List[str]:
+        return await self._run(self._members, [group])
+
+    async def list_groups(self) -> Dict[str, int]:
+        def read(conn: sqlite3.Connection):
+            return dict(conn.execute(
+                "SELECT group_name, COUNT(*) FROM group_members GROUP BY group_name ORDER BY group_name"
+            ).fetchall())
+        return await self._run(read)
+
+    @staticmethod
+    def _shed(conn: sqlite3.Connection, client_id: str, count: int, priority: int) -> List[str]:
+        """Deletes up to count pending rows of the client, lowest priority and oldest first."""
+        rows = conn.execute(
+            "SELECT seq, request_id FROM tasks WHERE client_id = ? AND priority <= ? AND lease_deadline IS NULL "
+            "ORDER BY priority, seq LIMIT ?", (client_id, priority, count)
+        ).fetchall()
+        conn.executemany("DELETE FROM tasks WHERE seq = ?", [(seq,) for seq, _ in rows])
+        conn.executemany(
+            "DELETE FROM payloads WHERE request_id = ? AND NOT EXISTS (SELECT 1 FROM tasks WHERE request_id = ?)",
+            [(request_id, request_id) for _, request_id in rows]
+        )
+        if rows:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('shed', ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (len(rows),)
+            )
+        return [request_id for _, request_id in rows]
+
+    async def get_node_load(self, client_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        def read(conn: sqlite3.Connection):
+            return dict(conn.execute(
+                f"SELECT client_id, COUNT(*) FROM tasks WHERE client_id IN ({', '.join('?' * len(client_ids))}) "
+                "GROUP BY client_id", client_ids
+            ).fetchall())
+
+        backlog = await self._run(read) if client_ids else {}
+        return {
+            client_id: {"backlog": backlog.get(client_id, 0), "ack_rate": self._ack_rates.rate(client_id)}
+            for client_id in client_ids
+        }
+
+    async def dequeue_queries(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                              wait_timeout: float = 0.0) -> List[Dict[str, Any]]:
+        return [self.codec.decode(task) for task in await self._dequeue_bodies(client_id, max_batch, wait_timeout)]
+
+    async def dequeue_raw(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                          wait_timeout: float = 0.0) -> List[bytes]:
+        return [self.codec.to_json(task) for task in await self._dequeue_bodies(client_id, max_batch, wait_timeout)]
+
+    async def _dequeue_bodies(self, client_id: str, max_batch: int, wait_timeout: float) -> List[bytes]:
+        """Leases up to max_batch tasks (long polling up to wait_timeout) and returns their stored bodies."""
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            # Cleared before reading so that an enqueue racing with the read still wakes us
+            event = self._events[client_id]
+            event.clear()
+            tasks = await self._lease(client_id, max_batch)
+            remaining = deadline - time.monotonic()
+            if tasks or remaining <= 0:
+                return tasks
+            # Woken immediately by enqueues in this process; the periodic re-check picks up
+            # rows written by other processes sharing the database file
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, self.wait_recheck_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _lease(self, client_id: str, max_batch: int) -> List[bytes]:
+        now = time.time()
+        lease_deadline = now + self.visibility_timeout
+
+        def lease(conn: sqlite3.Connection):
+            # Up to max_batch pending rows per lane, oldest first (one index range scan each)
+            lanes = [
+                conn.execute(
+                    "SELECT t.seq, t.enqueued_at, t.deliveries, p.task FROM tasks t "
+                    "JOIN payloads p ON p.request_id = t.request_id "
+                    "WHERE t.client_id = ? AND t.priority = ? AND t.lease_deadline IS NULL ORDER BY t.seq LIMIT ?",
+                    (client_id, priority, max_batch)
+                ).fetchall()[::-1]
+                for priority in range(PRIORITY_LEVELS)
+            ]
+
+            def head_priority(priority: int) -> float:
+                enqueued_at = lanes[priority][-1][1]
+                return effective_priority(priority, now - (enqueued_at or now), self.priority_aging)
+
+            picked = []
+            while len(picked) < max_batch:
+                # max() keeps the first of equal candidates, so the highest lane wins ties
+                candidates = [priority for priority in reversed(range(PRIORITY_LEVELS)) if lanes[priority]]
+                if not candidates:
+                    break
+                priority = max(candidates, key=head_priority)
+                picked.append((priority, *lanes[priority].pop()))
+            conn.executemany(
+                "UPDATE tasks SET lease_deadline = ?, deliveries = deliveries + 1 WHERE seq = ?",
+                [(lease_deadline, seq) for _, seq, _, _, _ in picked]
+            )
+            return picked
+
+        tasks = []
+        for priority, _, enqueued_at, deliveries, task in await self._run(lease):
+            if deliveries == 0 and enqueued_at is not None:
+                self._latency[priority].append((now - enqueued_at) * 1000)
+            tasks.append(task)
+        return tasks
+
+    @staticmethod
+    def _delete_task(conn: sqlite3.Connection, client_id: str, request_id: str) -> bool:
+        deleted = conn.execute(
+            "DELETE FROM tasks WHERE client_id = ? AND request_id = ?", (client_id, request_id)
+        ).rowcount
+        if deleted:
+            conn.execute("UPDATE requests SET acks = acks + 1 WHERE request_id = ?", (request_id,))
+        # Drop the payload once no target holds it any more
+        conn.execute(
+            "DELETE FROM payloads WHERE request_id = ? "
+            "AND NOT EXISTS (SELECT 1 FROM tasks WHERE request_id = ?)", (request_id, request_id)
+        )
+        return bool(deleted)
+
+    @staticmethod
+    def _upsert_insight(conn: sqlite3.Connection, request_id: str, client_id: str, insight: str) -> None:
+        conn.execute(
+            "INSERT INTO insights (request_id, client_id, insight, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (request_id, client_id) DO UPDATE SET insight = excluded.insight, "
+            "created_at = excluded.created_at",
+            (request_id, client_id, insight, time.time())
+        )
+
+    async def ack(self, client_id: str, request_id: str) -> None:
+        if await self._run(self._delete_task, client_id, request_id):
+            self._ack_rates.record(client_id)
+            self._updates.notify(request_id)
+
+    async def save_insight(self, request_id: str, client_id: str, insight: str) -> None:
+        await self._run(self._upsert_insight, request_id, client_id, insight)
+        self._updates.notify(request_id)
+
+    async def save_results(self, client_id: str, results: List[Tuple[str, str | None]]) -> None:
+        """Saves the insights and deletes the acked tasks in a single transaction."""
+        def apply(conn: sqlite3.Connection):
+            acked = []
+            for request_id, insight in results:
+                if insight is not None:
+                    self._upsert_insight(conn, request_id, client_id, insight)
+                acked.append(self._delete_task(conn, client_id, request_id))
+            return acked
+
+        for (request_id, insight), deleted in zip(results, await self._run(apply)):
+            if deleted:
+                self._ack_rates.record(client_id)
+            if deleted or insight is not None:
+                self._updates.notify(request_id)
+
+    async def get_consensus(self, request_id: str) -> List[Dict[str, Any]]:
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT client_id, insight FROM insights WHERE request_id = ? ORDER BY id DESC", (request_id,)
+        ).fetchall())
+        return [{"client_id": client_id, "insight": insight} for client_id, insight in rows]
+
+    async def get_status(self, request_id: str) -> Dict[str, Any]:
+        def read(conn: sqlite3.Connection):
+            counters = conn.execute("SELECT expected, acks FROM requests WHERE request_id = ?", (request_id,)).fetchone()
+            insights = conn.execute("SELECT COUNT(*) FROM insights WHERE request_id = ?", (request_id,)).fetchone()[0]
+            outstanding = conn.execute("SELECT COUNT(*) FROM tasks WHERE request_id = ?", (request_id,)).fetchone()[0]
+            return counters, insights, outstanding
+
+        counters, insights, outstanding = await self._run(read)
+        if counters is None:
+            return consensus_status(None, insights, 0, outstanding)
+        expected, acks = counters
+        return consensus_status(expected, insights, acks, outstanding)
+
+    def subscribe_updates(self, request_id: str) -> UpdateSubscription:
+        return self._updates.subscribe(request_id)
+
+    async def _reaper_loop(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            try:
+                await self.reap_expired_leases()
+                if time.monotonic() - last_prune >= self.prune_interval:
+                    last_prune = time.monotonic()
+                    pruned = await self.prune_expired()
+                    if any(pruned.values()):
+                        logger.info(f"Retention sweep: {pruned}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lease reaper failed: {e}")
+            await asyncio.sleep(self.reap_interval)
+
+    async def reap_expired_leases(self) -> Dict[str, int]:
+        """Re-queues or dead-letters every in-flight task whose lease has expired."""
+        now = time.time()
+
+        def reap(conn: sqlite3.Connection):
+            dead = conn.execute(
+                "SELECT client_id, request_id FROM tasks WHERE lease_deadline <= ? AND deliveries >= ?",
+                (now, self.max_deliveries)
+            ).fetchall()
+            conn.executemany(
+                "INSERT INTO deadletter (client_id, request_id, created_at) VALUES (?, ?, ?)",
+                [(client_id, request_id, now) for client_id, request_id in dead]
+            )
+            conn.execute("DELETE FROM tasks WHERE lease_deadline <= ? AND deliveries >= ?", (now, self.max_deliveries))
+            conn.executemany(
+                "DELETE FROM payloads WHERE request_id = ? AND NOT EXISTS (SELECT 1 FROM tasks WHERE request_id = ?)",
+                [(request_id, request_id) for _, request_id in dead]
+            )
+            # Clearing the lease puts the task back in the queue; its original seq keeps it at the head
+            requeued = conn.execute("UPDATE tasks SET lease_deadline = NULL WHERE lease_deadline <= ?", (now,)).rowcount
+            totals = {"redelivered": requeued, "dead_lettered": len(dead)}
+            conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                [(name, count) for name, count in totals.items() if count]
+            )
+            return totals, {request_id for _, request_id in dead}
+
+        totals, settled = await self._run(reap)
+        for request_id in settled:
+            self._updates.notify(request_id)
+        if totals["redelivered"]:
+            for event in self._events.values():
+                event.set()
+        if any(totals.values()):
+            logger.warning(f"Leases expired: {totals['redelivered']} re-queued, {totals['dead_lettered']} dead-lettered.")
+        return totals
+
+    async def prune_expired(self) -> Dict[str, int]:
+        """Deletes the insights, requests and dead-letter rows past their retention (see insight_ttl)."""
+        now = time.time()
+
+        def prune(conn: sqlite3.Connection):
+            pruned = {"insights": 0, "requests": 0, "deadletter": 0}
+            if self.insight_ttl is not None:
+                cutoff = now - self.insight_ttl
+                # A request's insights go together, insight_ttl after the last one (as its Redis hash)
+                pruned["insights"] = conn.execute(
+                    "DELETE FROM insights WHERE request_id IN "
+                    "(SELECT request_id FROM insights GROUP BY request_id HAVING MAX(created_at) < ?)", (cutoff,)
+                ).rowcount
+                pruned["requests"] = conn.execute(
+                    "DELETE FROM requests WHERE created_at < ? "
+                    "AND NOT EXISTS (SELECT 1 FROM insights WHERE insights.request_id = requests.request_id) "
+                    "AND NOT EXISTS (SELECT 1 FROM tasks WHERE tasks.request_id = requests.request_id)", (cutoff,)
+                ).rowcount
+            if self.metadata_ttl is not None:
+                pruned["deadletter"] = conn.execute(
+                    "DELETE FROM deadletter WHERE created_at < ?", (now - self.metadata_ttl,)
+                ).rowcount
+            return pruned
+
+        return await self._run(prune)
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        def read(conn: sqlite3.Connection):
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            in_flight, oldest_deadline = conn.execute(
+                "SELECT COUNT(*), MIN(lease_deadline) FROM tasks WHERE lease_deadline IS NOT NULL"
+            ).fetchone()
+            queued = dict(conn.execute(
+                "SELECT priority, COUNT(*) FROM tasks WHERE lease_deadline IS NULL GROUP BY priority"
+            ).fetchall())
+            return counters, in_flight, oldest_deadline, queued
+
+        counters, in_flight, oldest_deadline, queued = await self._run(read)
+        oldest_lease_age = 0.0
+        if oldest_deadline is not None:
+            oldest_lease_age = max(0.0, time.time() - (oldest_deadline - self.visibility_timeout))
+        return {
+            "redelivered_total": counters.get("redelivered", 0),
+            "dead_lettered_total": counters.get("dead_lettered", 0),
+            "shed_total": counters.get("shed", 0),
+            "in_flight": in_flight,
+            "oldest_lease_age_s": round(oldest_lease_age, 3),
+            "visibility_timeout_s": self.visibility_timeout,
+            "queued": {name: queued.get(priority, 0) for priority, name in enumerate(PRIORITY_NAMES)},
+            "pickup_latency": {
+                name: latency_summary(list(samples)) for name, samples in zip(PRIORITY_NAMES, self._latency)
+            },
+        }
@@ -1,20 +1,339 @@
 import abc
-from typing import List, Dict, Any
+import asyncio
+import json
+import math
+import time
+from collections import defaultdict
+from typing import List, Dict, Any, Callable, Tuple
+
+# Upper bound on tasks handed out by a single dequeue, keeping one poll bounded in latency and size
+DEFAULT_MAX_BATCH = 100
+# Upper bound on a long-poll wait, kept below common proxy idle timeouts (60 s)
+MAX_WAIT_TIMEOUT = 30.0
+
+# Query priority lanes, dequeued highest first
+PRIORITY_ROUTINE, PRIORITY_URGENT, PRIORITY_STAT = 0, 1, 2
+PRIORITY_NAMES = ("routine", "urgent", "stat")
+PRIORITY_LEVELS = len(PRIORITY_NAMES)
+# Anti-starvation: a task that has waited this many seconds competes with fresh tasks one level up
+DEFAULT_PRIORITY_AGING = 30.0
+# Most recent pickup latencies (enqueue -> first delivery) kept per priority for the metrics
+LATENCY_SAMPLES = 1000
+# Time constant (seconds) of the per-node ack rate: an exponentially decayed count of acks
+ACK_RATE_WINDOW = 60.0
+
+# What a broadcast does about saturated targets, see AdmissionControl
+ADMISSION_REJECT, ADMISSION_SKIP, ADMISSION_SHED_OLDEST = "reject", "skip", "shed_oldest"
+ADMISSION_POLICIES = (ADMISSION_REJECT, ADMISSION_SKIP, ADMISSION_SHED_OLDEST)
+
+
+def effective_priority(priority: int, waited: float, aging: float) -> float:
+    """Priority of a queued task after aging: +1 level per `aging` seconds waited (strict priority if aging <= 0)."""
+    return priority + waited / aging if aging > 0 else priority
+
+
+def validate_priority(priority: int) -> int:
+    if priority not in range(PRIORITY_LEVELS):
+        raise ValueError(f"Invalid priority {priority}, expected 0..{PRIORITY_LEVELS - 1} ({', '.join(PRIORITY_NAMES)})")
+    return priority
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, Any]:
+    """Nearest-rank p50/p99 of pickup-latency samples, in milliseconds."""
+    ordered = sorted(samples_ms)
+
+    def percentile(q: float) -> float | None:
+        return round(ordered[max(0, math.ceil(q * len(ordered)) - 1)], 1) if ordered else None
+
+    return {"samples": len(ordered), "p50_ms": percentile(0.50), "p99_ms": percentile(0.99)}
+
+
+def decayed_ack_count(count: float, last_ack: float, now: float, window: float = ACK_RATE_WINDOW) -> float:
+    """Ack count decayed by e^(-elapsed / window); divided by window it estimates the recent acks per second."""
+    return count * math.exp(-max(0.0, now - last_ack) / window)
+
+
+class AckRateTracker:
+    """In-process per-client ack rate, for brokers whose state lives in this process."""
+
+    def __init__(self, window: float = ACK_RATE_WINDOW):
+        self.window = window
+        self._acks: Dict[str, tuple[float, float]] = {}  # client -> (decayed count, last ack time)
+
+    def record(self, client_id: str) -> None:
+        now = time.time()
+        count, last_ack = self._acks.get(client_id, (0.0, now))
+        self._acks[client_id] = (decayed_ack_count(count, last_ack, now, self.window) + 1, now)
+
+    def rate(self, client_id: str) -> float | None:
+        """Recent acks per second, None if the client has not acked yet."""
+        if client_id not in self._acks:
+            return None
+        count, last_ack = self._acks[client_id]
+        return decayed_ack_count(count, last_ack, time.time(), self.window) / self.window
+
+
+class AdmissionControl:
+    """
+    Per-node backpressure for broadcasts. A target is saturated when one more task would push its
+    backlog (queued + in-flight tasks) past `max_queue_depth`, or past what it clears in
+    `max_backlog_seconds` at its recent ack rate (only known once the node has acked). A node
+    with an empty backlog always accepts a task. `policy` decides what a broadcast does then:
+      - reject:      the whole broadcast is refused with NodeSaturatedError
+      - skip:        saturated targets are left out and reported
+      - shed_oldest: the task is enqueued anyway and the target's oldest queued tasks of the
+                     same or a lower priority are dropped to make room (in-flight work is kept)
+    """
+
+    def __init__(self, max_queue_depth: int | None = None, max_backlog_seconds: float | None = None,
+                 policy: str = ADMISSION_REJECT):
+        if policy not in ADMISSION_POLICIES:
+            raise ValueError(f"Unknown admission policy '{policy}', expected one of {ADMISSION_POLICIES}")
+        self.max_queue_depth = max_queue_depth
+        self.max_backlog_seconds = max_backlog_seconds
+        self.policy = policy
+
+    def capacity(self, ack_rate: float | None) -> float:
+        """Largest backlog the node may hold."""
+        limits = [math.inf]
+        if self.max_queue_depth is not None:
+            limits.append(self.max_queue_depth)
+        if self.max_backlog_seconds is not None and ack_rate is not None:
+            limits.append(ack_rate * self.max_backlog_seconds)
+        return max(1.0, min(limits))
+
+    def excess(self, load: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+        """Saturated targets of a broadcast, with the number of tasks each holds over its capacity."""
+        excess = {}
+        for client_id, node in load.items():
+            over = math.ceil(node["backlog"] + 1 - self.capacity(node["ack_rate"]))
+            if over > 0:
+                excess[client_id] = over
+        return excess
+
+
+def admission_report(skipped: List[str] | None = None, shed: Dict[str, List[str]] | None = None) -> Dict[str, Any]:
+    """Outcome of enqueue_many: targets left out, and the request_ids dropped from each shedding target."""
+    return {"skipped": skipped or [], "shed": shed or {}}
+
+
+def consensus_status(expected: int | None, insights: int, acks: int, outstanding: int,
+                     deadline: float | None = None) -> Dict[str, Any]:
+    """
+    Builds the completion status of a broadcast from its counters:
+      - pending:  no target has acked or answered yet
+      - partial:  some targets acked or answered
+      - complete: every target acked (insights are submitted before the ack)
+      - expired:  the request is unknown or no longer tracked, every target settled but some were
+                  dead-lettered instead of acking, or its deadline passed unfinished
+    """
+    if expected is None:
+        status = "expired"
+    elif outstanding == 0:
+        status = "complete" if acks >= expected else "expired"
+    elif deadline is not None and time.time() > deadline:
+        status = "expired"
+    elif acks or insights:
+        status = "partial"
+    else:
+        status = "pending"
+    return {
+        "status": status,
+        "expected": expected or 0,
+        "insights_received": insights,
+        "acks_received": acks,
+        "nodes_outstanding": outstanding,
+    }
+
+
+class UpdateSubscription:
+    """
+    Wakes a waiter when a request's insights or status change. Use as an async context manager:
+    subscribe first, then read the current state, then wait(), so no update is missed in between.
+    Notified in-process through notify(); wait() also returns after `recheck_interval` seconds
+    (None: never), letting callers pick up changes made by processes that cannot notify us.
+    """
+
+    def __init__(self, recheck_interval: float | None = 1.0, on_close: Callable | None = None):
+        self.recheck_interval = recheck_interval
+        self._on_close = on_close
+        self._event = asyncio.Event()
+
+    async def __aenter__(self) -> "UpdateSubscription":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._on_close is not None:
+            self._on_close(self)
+
+    def notify(self) -> None:
+        self._event.set()
+
+    async def wait(self, timeout: float) -> None:
+        """Returns once notified, or after timeout (capped by recheck_interval) seconds."""
+        if self.recheck_interval is not None:
+            timeout = min(timeout, self.recheck_interval)
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+
+class LocalUpdateHub:
+    """Registry of in-process UpdateSubscriptions keyed by request_id, for brokers without pub/sub."""
+
+    def __init__(self, recheck_interval: float | None = None):
+        self.recheck_interval = recheck_interval
+        self._subscribers: Dict[str, set] = defaultdict(set)
+
+    def subscribe(self, request_id: str) -> UpdateSubscription:
+        subscribers = self._subscribers[request_id]
+
+        def unsubscribe(subscription: UpdateSubscription):
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(request_id, None)
+
+        subscription = UpdateSubscription(self.recheck_interval, on_close=unsubscribe)
+        subscribers.add(subscription)
+        return subscription
+
+    def notify(self, request_id: str) -> None:
+        for subscription in self._subscribers.get(request_id, ()):
+            subscription.notify()
+
+
+class BrokerCapacityError(Exception):
+    """Raised when the broker refuses new work to stay within its resource budget."""
+    pass
+
+
+class NodeSaturatedError(BrokerCapacityError):
+    """Raised when a broadcast is rejected because some targets are saturated (see AdmissionControl)."""
+
+    def __init__(self, nodes: List[str]):
+        self.nodes = nodes
+        super().__init__(f"Target nodes saturated: {', '.join(nodes)}")
 
 
 class BaseTaskBroker(abc.ABC):
     """Abstract interface for managing the state of queries and insights."""
+    # Backpressure applied by enqueue_many; None admits every broadcast
+    admission: AdmissionControl | None = None
+    # True if task bodies are stored serialised, so that dequeue_raw() returns them without decoding
+    serialised_tasks: bool = False
+    # True if several processes may share the broker's state (see run_workers()); in-process state may not
+    multiprocess_safe: bool = False
+
+    async def start(self) -> None:
+        """Starts background maintenance (e.g. lease reaping). Called once the event loop is running."""
+        pass
+
+    async def close(self) -> None:
+        """Stops background maintenance and releases connections."""
+        pass
 
     @abc.abstractmethod
-    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float]) -> None:
-        """Pushes a task to a specific client's queue."""
+    async def enqueue_query(self, client_id: str, request_id: str, query_vector: List[float],
+                            priority: int = PRIORITY_ROUTINE) -> None:
+        """
+        Pushes a task to a specific client's queue, in the lane of the given priority. The vector may
+        also be a float32 array (a decoded query_vector_b64), which brokers store via their TaskCodec.
+        """
         pass
 
+    async def enqueue_many(self, request_id: str, client_ids: List[str], query_vector: List[float],
+                           priority: int = PRIORITY_ROUTINE) -> Dict[str, Any]:
+        """
+        Pushes the same task to several clients' queues, subject to the admission policy, and returns
+        the admission_report. Brokers should override this with a bulk write.
+        """
+        targets, shed_counts = await self._admit(client_ids)
+        shed = {client_id: await self._shed_oldest(client_id, count, priority) for client_id, count in shed_counts.items()}
+        for client_id in targets:
+            await self.enqueue_query(client_id, request_id, query_vector, priority)
+        return admission_report([c for c in client_ids if c not in targets], shed)
+
+    async def enqueue_groups(self, request_id: str, groups: List[str], query_vector: List[float],
+                             priority: int = PRIORITY_ROUTINE, client_ids: List[str] = ()) -> Dict[str, Any]:
+        """
+        Broadcasts to every member of the named groups, plus client_ids, as one broker operation.
+        Returns the admission_report with `targets`, the number of clients the task was queued for.
+        Brokers should override this to resolve the members where they are stored.
+        """
+        targets = await self.resolve_targets(groups, client_ids)
+        report = await self.enqueue_many(request_id, targets, query_vector, priority) if targets else admission_report()
+        return {**report, "targets": len(targets) - len(report["skipped"])}
+
+    async def resolve_targets(self, groups: List[str], client_ids: List[str] = ()) -> List[str]:
+        """client_ids followed by the members of each group, without duplicates."""
+        targets = list(client_ids)
+        for group in groups:
+            targets += await self.get_group_members(group)
+        return list(dict.fromkeys(targets))
+
+    async def add_group_members(self, group: str, client_ids: List[str]) -> int:
+        """Adds clients to a named group (e.g. `region:eu`), creating it; returns how many were not members yet."""
+        raise NotImplementedError(f"{type(self).__name__} does not support node groups")
+
+    async def remove_group_members(self, group: str, client_ids: List[str]) -> int:
+        """Removes clients from a group, which disappears once empty; returns how many were members."""
+        raise NotImplementedError(f"{type(self).__name__} does not support node groups")
+
+    async def get_group_members(self, group: str) -> List[str]:
+        """Members of a group, sorted; empty for an unknown group."""
+        raise NotImplementedError(f"{type(self).__name__} does not support node groups")
+
+    async def list_groups(self) -> Dict[str, int]:
+        """Every non-empty group with its member count."""
+        raise NotImplementedError(f"{type(self).__name__} does not support node groups")
+
+    async def _admit(self, client_ids: List[str]) -> tuple[List[str], Dict[str, int]]:
+        """
+        Applies the admission policy to a broadcast: returns the targets to enqueue and, for
+        shed_oldest, how many queued tasks to drop per saturated target. Raises NodeSaturatedError
+        under the reject policy.
+        """
+        if self.admission is None or not client_ids:
+            return client_ids, {}
+        excess = self.admission.excess(await self.get_node_load(client_ids))
+        if not excess:
+            return client_ids, {}
+        if self.admission.policy == ADMISSION_REJECT:
+            raise NodeSaturatedError(list(excess))
+        if self.admission.policy == ADMISSION_SKIP:
+            return [client_id for client_id in client_ids if client_id not in excess], {}
+        return client_ids, excess
+
+    async def _shed_oldest(self, client_id: str, count: int, priority: int) -> List[str]:
+        """Drops up to count of the client's oldest queued tasks at or below priority; returns their request_ids."""
+        raise NotImplementedError(f"{type(self).__name__} does not support the shed_oldest admission policy")
+
+    async def get_node_load(self, client_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Per client: backlog (queued + in-flight tasks) and ack_rate (recent acks per second, None
+        until the client acks). Needed by admission control; empty if not supported.
+        """
+        return {}
+
     @abc.abstractmethod
-    async def dequeue_queries(self, client_id: str) -> List[Dict[str, Any]]:
-        """Pops all pending tasks for a specific client."""
+    async def dequeue_queries(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                              wait_timeout: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Pops up to max_batch pending tasks for a specific client, highest (aged) priority first,
+        oldest first within a priority. If none are pending, blocks for up to wait_timeout seconds until one arrives (long poll).
+        """
         pass
 
+    async def dequeue_raw(self, client_id: str, max_batch: int = DEFAULT_MAX_BATCH,
+                          wait_timeout: float = 0.0) -> List[bytes]:
+        """
+        dequeue_queries() returning each task as serialised JSON, for responses that embed them
+        as is. Brokers storing encoded bodies override this to pass JSON bodies through untouched.
+        """
+        return [json.dumps(task).encode() for task in await self.dequeue_queries(client_id, max_batch, wait_timeout)]
+
     @abc.abstractmethod
     async def save_insight(self, request_id: str, client_id: str, insight: str) -> None:
         """Saves a computed insight toward the global consensus."""
@@ -25,7 +344,38 @@ class BaseTaskBroker(abc.ABC):
         """Acknowledges that a task was successfully processed, removing it from the queue."""
         pass
 
+    async def save_results(self, client_id: str, results: List[Tuple[str, str | None]]) -> None:
+        """
+        Saves the insights of a node's finished tasks and acks them: (request_id, insight or None)
+        pairs, applied in order. Brokers override this to apply the batch in one round trip.
+        """
+        for request_id, insight in results:
+            if insight is not None:
+                await self.save_insight(request_id, client_id, insight)
+            await self.ack(client_id, request_id)
+
     @abc.abstractmethod
     async def get_consensus(self, request_id: str) -> List[Dict[str, Any]]:
         """Retrieves all aggregated insights for a specific query."""
-        pass
\ No newline at end of file
+        pass
+
+    async def get_status(self, request_id: str) -> Dict[str, Any]:
+        """
+        Completion status of a broadcast (see consensus_status). Brokers that track the expected
+        target set override this; the fallback can only tell whether any insight arrived.
+        """
+        insights = len(await self.get_consensus(request_id))
+        status = consensus_status(None, insights, 0, 0)
+        status["status"] = "partial" if insights else "pending"
+        return status
+
+    def subscribe_updates(self, request_id: str) -> UpdateSubscription:
+        """
+        Subscription woken on every insight or status change of request_id. The fallback cannot be
+        notified and simply wakes up every second so that callers re-read the state (polling).
+        """
+        return UpdateSubscription()
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Returns broker health metrics (redeliveries, lease ages, ...). Empty if not supported."""
+        return {}
@@ -0,0 +1,111 @@
+import abc
+import base64
+import json
+import struct
+import sys
+from array import array
+from typing import List, Dict, Any
+
+# Header of a binary task: magic, request_id length (uint16), vector dimension (uint32), little-endian
+FLOAT32_MAGIC = b"AEF1"
+_HEADER = struct.Struct("<4sHI")
+# Media type negotiating base64 packed float32 vectors (`query_vector_b64`) in API bodies
+VECTOR_B64_MEDIA_TYPE = "application/vnd.aethelgard.f32b64+json"
+
+
+class TaskCodec(abc.ABC):
+    """
+    Serialises broker tasks ({"request_id", "query_vector"}) for storage.
+    Decoding sniffs the format, so every codec reads entries written by any other codec
+    (including plain JSON written before codecs existed) and codecs can be switched in place.
+    `query_vector` may also be a float32 array, as decoded from `query_vector_b64`.
+    """
+    name: str
+
+    @abc.abstractmethod
+    def encode(self, request_id: str, query_vector: List[float] | array) -> bytes:
+        pass
+
+    def decode(self, data: bytes | str | memoryview) -> Dict[str, Any]:
+        """Accepts a memoryview too (e.g. over an mmap), so that float32 vectors are copied only once."""
+        if isinstance(data, (bytes, memoryview)) and data[:4] == FLOAT32_MAGIC:
+            return _decode_float32(data)
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+    def to_json(self, data: bytes | str | memoryview) -> bytes:
+        """The stored task as JSON bytes; JSON bodies are passed through without a decode/encode round trip."""
+        if isinstance(data, (bytes, memoryview)) and data[:4] == FLOAT32_MAGIC:
+            return json.dumps(_decode_float32(data)).encode()
+        return data.encode() if isinstance(data, str) else bytes(data)
+
+
+class JsonTaskCodec(TaskCodec):
+    """Human-readable JSON (~20 bytes per dimension). Lossless for float64 vectors."""
+    name = "json"
+
+    def encode(self, request_id: str, query_vector: List[float] | array) -> bytes:
+        if isinstance(query_vector, array):
+            query_vector = query_vector.tolist()
+        return json.dumps({"request_id": request_id, "query_vector": query_vector}).encode()
+
+
+class Float32TaskCodec(TaskCodec):
+    """
+    Packed little-endian float32 vector behind a small header (4 bytes per dimension).
+    Embeddings are produced in float32, so the down-cast is lossless for real queries;
+    float64 inputs are rounded to the nearest float32.
+    """
+    name = "float32"
+
+    def encode(self, request_id: str, query_vector: List[float] | array) -> bytes:
+        vector = _float32_le(query_vector)
+        request_id_bytes = request_id.encode()
+        return _HEADER.pack(FLOAT32_MAGIC, len(request_id_bytes), len(vector)) + request_id_bytes + vector.tobytes()
+
+
+def _float32_le(query_vector: List[float] | array) -> array:
+    """The vector as little-endian float32; a float32 array on a little-endian host is used as is."""
+    if isinstance(query_vector, array) and query_vector.typecode == "f" and sys.byteorder == "little":
+        return query_vector
+    vector = array("f", query_vector)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector
+
+
+def _decode_float32(data: bytes | memoryview) -> Dict[str, Any]:
+    _, id_length, dim = _HEADER.unpack_from(data)
+    offset = _HEADER.size + id_length
+    vector = array("f")
+    vector.frombytes(data[offset:offset + 4 * dim])
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return {"request_id": str(data[_HEADER.size:offset], "utf-8"), "query_vector": vector.tolist()}
+
+
+def pack_vector_b64(query_vector: List[float] | array) -> str:
+    """Base64 of the vector as packed little-endian float32 (~5.3 characters per dimension)."""
+    return base64.b64encode(_float32_le(query_vector).tobytes()).decode("ascii")
+
+
+def unpack_vector_b64(data: str | bytes) -> array:
+    """Decodes pack_vector_b64() output straight into a float32 array; raises ValueError if malformed."""
+    raw = base64.b64decode(data, validate=True)
+    if not raw or len(raw) % 4:
+        raise ValueError(f"a float32 vector needs a positive multiple of 4 bytes, got {len(raw)}")
+    vector = array("f")
+    vector.frombytes(raw)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector
+
+
+CODECS = {codec.name: codec for codec in (JsonTaskCodec, Float32TaskCodec)}
+
+
+def get_codec(name: str) -> TaskCodec:
+    """Returns a codec instance by name ("json" or "float32")."""
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown task codec '{name}', expected one of {sorted(CODECS)}")
@@ -1,4 +1,6 @@
 import abc
+from typing import List, Tuple
+
 from aethelgard.core.broker import BaseTaskBroker
 
 class BaseServerTransport(abc.ABC):
@@ -14,13 +16,23 @@ class BaseServerTransport(abc.ABC):
 class BaseClientTransport(abc.ABC):
     """Abstract interface for the client-side outbound poller."""
     @abc.abstractmethod
-    async def poll_tasks(self, client_id: str) -> list:
+    async def poll_tasks(self, client_id: str, wait: float = 0.0) -> list:
+        """Pulls pending tasks; with wait > 0 the server may hold the poll open that long (long poll)."""
         pass
 
     @abc.abstractmethod
-    async def submit_insight(self, client_id: str, request_id: str, insight: str) -> None:
+    async def submit_insight(self, client_id: str, request_id: str, insight: str, ack: bool = False) -> None:
+        """Uploads a task's insight; with `ack` the task is acknowledged by the same request."""
         pass
 
     @abc.abstractmethod
     async def ack(self, client_id: str, request_id: str) -> None:
-        pass
\ No newline at end of file
+        pass
+
+    async def submit_results(self, client_id: str, results: List[Tuple[str, str | None]]) -> None:
+        """Submits the insights of finished tasks, (request_id, insight or None), and acks them."""
+        for request_id, insight in results:
+            if insight is not None:
+                await self.submit_insight(client_id, request_id, insight, ack=True)
+            else:
+                await self.ack(client_id, request_id)
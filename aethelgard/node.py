@@ -1,4 +1,5 @@
 import asyncio
+import time
 from typing import Callable, Awaitable, Any
 
 from aethelgard.core.config import get_logger
@@ -9,16 +10,23 @@ logger = get_logger(__name__)
 class Node:
     """The localized edge node. Wakes up, works, sleeps."""
 
-    def __init__(self, client_id: str, transport: BaseClientTransport, search_fn: Callable[[list], Awaitable[str | None]]):
+    def __init__(self, client_id: str, transport: BaseClientTransport, search_fn: Callable[[list], Awaitable[str | None]],
+                 long_poll_timeout: float = 25.0, results_flush_interval: float = 5.0):
         self.client_id = client_id
         self.transport = transport
         self.search_fn = search_fn  # Dependency Injection of the specific Local ML logic
         self.polling_interval = 5
+        # The orchestrator holds each poll open until a task arrives (0 disables long polling)
+        self.long_poll_timeout = long_poll_timeout
+        # Finished tasks are submitted (and acked) together, at least this often (seconds) within a batch
+        self.results_flush_interval = results_flush_interval
 
     async def heartbeat_loop(self):
         logger.info(f"[{self.client_id}] Started secure outbound heartbeat...")
         while True:
-            tasks = await self.transport.poll_tasks(self.client_id)
+            poll_started = time.monotonic()
+            tasks = await self.transport.poll_tasks(self.client_id, wait=self.long_poll_timeout)
+            results, last_flush = [], time.monotonic()
             for task in tasks:
                 req_id = task['request_id']
                 logger.info(f"[{self.client_id}] Processing Task: {req_id}")
@@ -26,20 +34,37 @@ class Node:
                 try:
                     # Execute the Semantic Firewall
                     insight = await self.search_fn(task['query_vector'])
-
-                    if insight is not None:
-                        await self.transport.submit_insight(self.client_id, req_id, insight)
-                        logger.info(f"[{self.client_id}] ✅ Insight securely uploaded.")
-                    else:
-                        logger.info(f"[{self.client_id}] ⚪ No relevant data found.")
-
                 except Exception as e:
                     logger.error(f"[{self.client_id}] ❌ Error processing task {req_id}: {e}")
-                    continue  # Do NOT ack if processing catastrophically failed
+                    continue  # Do NOT ack if processing catastrophically failed: the lease expires and it is redelivered
+
+                if insight is not None:
+                    logger.info(f"[{self.client_id}] ✅ Insight ready for {req_id}.")
+                else:
+                    logger.info(f"[{self.client_id}] ⚪ No relevant data found.")
+                # ALWAYS explicitly ACK after successful processing (even if no insight found)
+                results.append((req_id, insight))
+
+                # Slow tasks must not hold finished ones back until their leases expire
+                if time.monotonic() - last_flush >= self.results_flush_interval:
+                    await self._submit_results(results)
+                    results, last_flush = [], time.monotonic()
+            await self._submit_results(results)
 
-                finally:
-                    # ALWAYS explicitly ACK after successful processing (even if no insight found)
-                    await self.transport.ack(self.client_id, req_id)
-                    logger.info(f"[{self.client_id}] 🔒 Task {req_id} acknowledged.")
+            # Without long polling, sleep between heartbeats. A long poll that came back empty early
+            # means the orchestrator is unreachable (or does not hold polls open): back off too.
+            poll_duration = time.monotonic() - poll_started
+            if self.long_poll_timeout <= 0 or (not tasks and poll_duration < self.long_poll_timeout / 2):
+                await asyncio.sleep(self.polling_interval)
 
-            await asyncio.sleep(self.polling_interval)
\ No newline at end of file
+    async def _submit_results(self, results: list) -> None:
+        """Uploads the insights and acks the tasks of one batch in a single request."""
+        if not results:
+            return
+        try:
+            await self.transport.submit_results(self.client_id, results)
+        except Exception as e:
+            # Unacked tasks are redelivered once their leases expire
+            logger.error(f"[{self.client_id}] ❌ Failed to submit {len(results)} results: {e}")
+            return
+        logger.info(f"[{self.client_id}] 🔒 {len(results)} tasks uploaded and acknowledged.")
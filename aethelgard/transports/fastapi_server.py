@@ -1,35 +1,105 @@
+import json
+import time
 import uuid
-from typing import List
+from array import array
+from contextlib import asynccontextmanager
+from typing import List, AsyncIterator
 
 import uvicorn
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 
-from aethelgard.core.broker import BaseTaskBroker
+from aethelgard.core.broker import (
+    BaseTaskBroker, BrokerCapacityError, DEFAULT_MAX_BATCH, MAX_WAIT_TIMEOUT, NodeSaturatedError, PRIORITY_NAMES,
+    PRIORITY_ROUTINE, PRIORITY_STAT
+)
+from aethelgard.core.codec import VECTOR_B64_MEDIA_TYPE, pack_vector_b64, unpack_vector_b64
 from aethelgard.core.config import get_logger
 
+try:
+    import orjson
+except ImportError:  # optional: responses fall back to the stdlib encoder
+    orjson = None
+
 # Configure module-level logger
 logger = get_logger(__name__)
 
+# An SSE comment is sent after this many idle seconds so that proxies keep the stream open
+SSE_KEEPALIVE_INTERVAL = 15.0
+
 
 # ==========================================
 # 1. Pydantic Data Models
 # ==========================================
 class ClinicalQuery(BaseModel):
     query_text: str = Field(..., description="Human-readable text of the query")
-    query_vector: List[float] = Field(..., description="Fused embedding vector (e.g., text + image)")
-    target_clients: List[str] = Field(..., description="List of hospital client IDs to poll this query")
+    query_vector: List[float] | None = Field(None, description="Fused embedding vector (e.g., text + image)")
+    query_vector_b64: str | None = Field(None, description="The same vector as base64 packed little-endian float32, "
+                                                           "decoded without per-float validation")
+    target_clients: List[str] = Field(default_factory=list, description="List of hospital client IDs to poll this query")
+    target_groups: List[str] = Field(default_factory=list,
+                                     description="Node groups (e.g. region:eu) whose members also receive the query")
+    priority: int = Field(PRIORITY_ROUTINE, ge=PRIORITY_ROUTINE, le=PRIORITY_STAT,
+                          description="0 routine, 1 urgent, 2 stat; higher priorities are picked up first")
+
+    @model_validator(mode="after")
+    def _has_targets(self) -> "ClinicalQuery":
+        if not self.target_clients and not self.target_groups:
+            raise ValueError("target_clients or target_groups is required")
+        return self
+
+    _vector: List[float] | array = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def _decode_vector(self) -> "ClinicalQuery":
+        if (self.query_vector is None) == (self.query_vector_b64 is None):
+            raise ValueError("exactly one of query_vector or query_vector_b64 is required")
+        if self.query_vector_b64 is not None:
+            self._vector = unpack_vector_b64(self.query_vector_b64)
+        else:
+            self._vector = self.query_vector
+        return self
+
+    @property
+    def vector(self) -> List[float] | array:
+        """The query vector; a packed one stays a float32 array, which the float32 codec stores without a copy."""
+        return self._vector
 
 
 class InsightSubmission(BaseModel):
     client_id: str
     sanitized_insight: str = Field(..., description="The JSON string sanitized by the local Semantic Firewall")
+    ack: bool = Field(False, description="Also ack the task, in the same broker transaction as the insight")
 
 
 class AckSubmission(BaseModel):
     client_id: str = Field(..., description="The ID of the node acknowledging the task")
 
 
+class TaskResult(BaseModel):
+    request_id: str
+    insight: str | None = Field(None, description="The sanitized insight, omitted if the task produced none")
+
+
+class ResultsSubmission(BaseModel):
+    results: List[TaskResult] = Field(..., min_length=1, max_length=1000,
+                                      description="Finished tasks to ack, with their insights")
+
+
+class GroupMembers(BaseModel):
+    client_ids: List[str] = Field(..., min_length=1, description="Client IDs to add to the group")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed (several times faster on float-heavy bodies)."""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
 # ==========================================
 # 2. Unified FastAPI Orchestrator Server
 # ==========================================
@@ -37,45 +107,109 @@ class FastAPIServer:
     """
     Unified Orchestrator and REST API transport.
     Replaces both BaseServerTransport and FedRagOrchestrator.
+
+    `response_class` renders every JSON response (FastJSONResponse: orjson if installed). The
+    hot routes return it directly, skipping FastAPI's jsonable_encoder pass, and polls embed the
+    task bodies of brokers storing them serialised (dequeue_raw) without decoding them.
     """
 
-    def __init__(self, broker: BaseTaskBroker):
+    def __init__(self, broker: BaseTaskBroker, response_class: type[JSONResponse] = FastJSONResponse):
         self.broker = broker
+        self.response_class = response_class
         self.app = FastAPI(
             title="Aethelgard SuperLink Orchestrator",
             version="0.2.0",
-            description="Federated RAG centralized routing and consensus API."
+            description="Federated RAG centralized routing and consensus API.",
+            lifespan=self._lifespan,
+            default_response_class=response_class
         )
         self._setup_routes()
 
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """Runs the broker's background maintenance (lease reaping, ...) for the lifetime of the app."""
+        await self.broker.start()
+        yield
+        await self.broker.close()
+
     def _setup_routes(self):
         """Maps HTTP endpoints to the underlying Broker logic."""
 
         @self.app.post("/api/v1/query/broadcast", status_code=202)
         async def broadcast_query(query: ClinicalQuery):
-            """1. Drops a new query into the target clients' queues."""
+            """
+            1. Drops a new query into the target clients' queues. Saturated targets are handled by the
+            broker's admission policy: the 503 (reject) or the 202 (skipped / shed) lists the affected nodes.
+            """
             request_id = str(uuid.uuid4())
-            logger.info(f"Broadcasting query {request_id} to {len(query.target_clients)} clients.")
+            # Duplicate targets would receive the task twice
+            targets = list(dict.fromkeys(query.target_clients))
+            groups = list(dict.fromkeys(query.target_groups))
+            logger.info(f"Broadcasting {PRIORITY_NAMES[query.priority]} query {request_id} to {len(targets)} clients"
+                        f"{f' and groups {groups}' if groups else ''}.")
 
-            for client in query.target_clients:
-                await self.broker.enqueue_query(client, request_id, query.query_vector)
+            try:
+                if groups:
+                    report = await self.broker.enqueue_groups(request_id, groups, query.vector, query.priority,
+                                                              client_ids=targets)
+                else:
+                    report = await self.broker.enqueue_many(request_id, targets, query.vector, query.priority)
+            except NodeSaturatedError as e:
+                logger.warning(f"Rejected query {request_id}: {e}")
+                raise HTTPException(status_code=503, detail={"message": str(e), "saturated_nodes": e.nodes},
+                                    headers={"Retry-After": "30"})
+            except BrokerCapacityError as e:
+                logger.warning(f"Rejected query {request_id}: {e}")
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
 
-            return {"message": "Query broadcast initiated", "request_id": request_id}
+            if report["skipped"] or report["shed"]:
+                logger.warning(f"Query {request_id}: skipped saturated nodes {report['skipped']}, "
+                               f"shed tasks on {list(report['shed'])}.")
+            if groups and not report["targets"] and not report["skipped"]:
+                raise HTTPException(status_code=404, detail=f"No members in target groups {groups}")
+            return {
+                "message": "Query broadcast initiated", "request_id": request_id,
+                "target_count": report.get("targets", len(targets) - len(report["skipped"])),
+                "skipped_nodes": report["skipped"], "shed_tasks": report["shed"]
+            }
 
         @self.app.get("/api/v1/client/{client_id}/poll")
-        async def poll_tasks(client_id: str):
-            """2. Client nodes poll this endpoint to pull pending tasks."""
-            tasks = await self.broker.dequeue_queries(client_id)
+        async def poll_tasks(client_id: str, request: Request,
+                             max_batch: int = Query(DEFAULT_MAX_BATCH, ge=1, le=1000),
+                             wait: float = Query(0.0, ge=0.0, le=MAX_WAIT_TIMEOUT)):
+            """
+            2. Client nodes poll this endpoint to pull pending tasks (at most max_batch per poll).
+            With wait > 0 the request is held open until a task arrives or `wait` seconds pass (long poll).
+            Clients accepting VECTOR_B64_MEDIA_TYPE get each vector as `query_vector_b64` instead.
+            """
+            packed = VECTOR_B64_MEDIA_TYPE in request.headers.get("accept", "")
+            if self.broker.serialised_tasks and not packed:
+                raw_tasks = await self.broker.dequeue_raw(client_id, max_batch, wait_timeout=wait)
+                if raw_tasks:
+                    logger.info(f"Client {client_id} pulled {len(raw_tasks)} tasks.")
+                # The tasks are already JSON: splice them into the envelope instead of re-encoding them
+                return Response(b'{"pending_tasks":[' + b",".join(raw_tasks) + b"]}", media_type="application/json")
+
+            tasks = await self.broker.dequeue_queries(client_id, max_batch, wait_timeout=wait)
             if tasks:
                 logger.info(f"Client {client_id} pulled {len(tasks)} tasks.")
-            return {"pending_tasks": tasks}
+            if packed:
+                return self.response_class({"pending_tasks": [_pack_task(task) for task in tasks]},
+                                           media_type=VECTOR_B64_MEDIA_TYPE)
+            return self.response_class({"pending_tasks": tasks})
 
         @self.app.post("/api/v1/query/{request_id}/insight")
         async def submit_insight(request_id: str, submission: InsightSubmission):
-            """3. Client nodes push successfully sanitized insights here[cite: 157]."""
+            """
+            3. Client nodes push successfully sanitized insights here[cite: 157]. With `ack` the task is
+            acked along with it (save_results), sparing the round trip to 4.
+            """
             logger.info(f"Received insight for {request_id} from {submission.client_id}.")
-            await self.broker.save_insight(request_id, submission.client_id, submission.sanitized_insight)
-            return {"status": "success"}
+            if submission.ack:
+                await self.broker.save_results(submission.client_id, [(request_id, submission.sanitized_insight)])
+            else:
+                await self.broker.save_insight(request_id, submission.client_id, submission.sanitized_insight)
+            return {"status": "success", "acked": submission.ack}
 
         @self.app.post("/api/v1/query/{request_id}/ack")
         async def ack_task(request_id: str, submission: AckSubmission):
@@ -84,11 +218,101 @@ class FastAPIServer:
             await self.broker.ack(submission.client_id, request_id)
             return {"status": "success", "message": "ACK"}
 
+        @self.app.post("/api/v1/client/{client_id}/results")
+        async def submit_results(client_id: str, submission: ResultsSubmission):
+            """3+4. Batched alternative: saves the insights of a node's finished tasks and acks them all at once."""
+            results = [(item.request_id, item.insight) for item in submission.results]
+            insights = sum(insight is not None for _, insight in results)
+            logger.info(f"Received {len(results)} results ({insights} insights) from {client_id}.")
+            await self.broker.save_results(client_id, results)
+            return {"status": "success", "acked": len(results), "insights": insights}
+
         @self.app.get("/api/v1/query/{request_id}/consensus")
         async def get_consensus(request_id: str):
-            """5. Requesters hit this to retrieve the aggregated insights."""
+            """5. Requesters hit this to retrieve the aggregated insights and the completion status."""
             insights = await self.broker.get_consensus(request_id)
-            return {"request_id": request_id, "consensus_data": insights}
+            status = await self.broker.get_status(request_id)
+            return self.response_class({"request_id": request_id, **status, "consensus_data": insights})
+
+        @self.app.get("/api/v1/query/{request_id}/stream")
+        async def stream_consensus(request_id: str, timeout: float = Query(300.0, gt=0.0, le=3600.0)):
+            """
+            5b. Server-Sent Events alternative to polling the consensus: an `insight` event per insight
+            as it arrives, a `status` event on every status change, and a final `complete` event
+            (status complete or expired) before the stream closes. Ends after `timeout` seconds anyway.
+            """
+            return StreamingResponse(
+                self._consensus_events(request_id, timeout), media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        @self.app.get("/api/v1/metrics")
+        async def get_metrics():
+            """6. Broker health: redeliveries, dead letters, in-flight leases, pickup latency per priority."""
+            return self.response_class(await self.broker.get_metrics())
+
+        @self.app.get("/api/v1/groups")
+        async def list_groups():
+            """7. Node groups addressable by `target_groups`, with their member counts."""
+            return {"groups": await self._group_call(self.broker.list_groups)}
+
+        @self.app.get("/api/v1/groups/{group}/members")
+        async def get_group_members(group: str):
+            """7b. Members of a node group."""
+            return {"group": group, "members": await self._group_call(self.broker.get_group_members, group)}
+
+        @self.app.post("/api/v1/groups/{group}/members")
+        async def add_group_members(group: str, members: GroupMembers):
+            """7c. Adds client nodes to a group, creating it if needed."""
+            added = await self._group_call(self.broker.add_group_members, group, list(dict.fromkeys(members.client_ids)))
+            logger.info(f"Added {added} clients to group {group}.")
+            return {"group": group, "added": added}
+
+        @self.app.delete("/api/v1/groups/{group}/members/{client_id}")
+        async def remove_group_member(group: str, client_id: str):
+            """7d. Removes a client node from a group; the group disappears with its last member."""
+            removed = await self._group_call(self.broker.remove_group_members, group, [client_id])
+            if not removed:
+                raise HTTPException(status_code=404, detail=f"{client_id} is not a member of {group}")
+            return {"group": group, "removed": removed}
+
+    @staticmethod
+    async def _group_call(method, *args):
+        """Calls a group-management broker method, answering 501 if the broker has no node groups."""
+        try:
+            return await method(*args)
+        except NotImplementedError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+
+    async def _consensus_events(self, request_id: str, timeout: float) -> AsyncIterator[str]:
+        """Yields SSE frames for request_id until it completes, expires or `timeout` elapses."""
+        deadline = time.monotonic() + timeout
+        sent, last_status, last_frame = set(), None, time.monotonic()
+        # Subscribing before the first read guarantees that no update falls in between
+        async with self.broker.subscribe_updates(request_id) as subscription:
+            while True:
+                for item in reversed(await self.broker.get_consensus(request_id)):
+                    key = (item["client_id"], item["insight"])
+                    if key not in sent:
+                        sent.add(key)
+                        last_frame = time.monotonic()
+                        yield _sse_frame("insight", item)
+
+                status = await self.broker.get_status(request_id)
+                if status["status"] in ("complete", "expired"):
+                    yield _sse_frame("complete", status)
+                    return
+                if status != last_status:
+                    last_status, last_frame = status, time.monotonic()
+                    yield _sse_frame("status", status)
+
+                now = time.monotonic()
+                if now >= deadline:
+                    return
+                if now - last_frame >= SSE_KEEPALIVE_INTERVAL:
+                    last_frame = now
+                    yield ": keepalive\n\n"
+                await subscription.wait(min(deadline - now, SSE_KEEPALIVE_INTERVAL))
 
     async def run(self, host: str = "0.0.0.0", port: int = 8010):
         """Starts the Uvicorn web server."""
@@ -100,4 +324,14 @@ class FastAPIServer:
             ).serve()
         except Exception as e:
             logger.critical(f"Server encountered a fatal error: {e}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
+
+
+def _pack_task(task: dict) -> dict:
+    packed = {key: value for key, value in task.items() if key != "query_vector"}
+    packed["query_vector_b64"] = pack_vector_b64(task["query_vector"])
+    return packed
+
+
+def _sse_frame(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
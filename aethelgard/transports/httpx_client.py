@@ -1,25 +1,48 @@
+from typing import List, Tuple
+
 import httpx
+from aethelgard.core.codec import VECTOR_B64_MEDIA_TYPE, unpack_vector_b64
 from aethelgard.core.transport import BaseClientTransport
 
 class HttpxClientTransport(BaseClientTransport):
-    """Asynchronous HTTP Client for Hospital Outbound Polling."""
-    def __init__(self, server_url: str):
+    """
+    Asynchronous HTTP Client for Hospital Outbound Polling.
+    With `binary_vectors` (default) polls ask for base64 packed float32 vectors, ~4x smaller than
+    JSON floats; servers that do not support it answer plain JSON, which is read as before.
+    Results are submitted in one request per batch, or per task to servers without the batch endpoint.
+    """
+    def __init__(self, server_url: str, binary_vectors: bool = True):
         self.server_url = server_url.rstrip("/")
-        self.http_client = httpx.AsyncClient(timeout=10.0)
+        headers = {"Accept": f"{VECTOR_B64_MEDIA_TYPE}, application/json;q=0.9"} if binary_vectors else {}
+        self.http_client = httpx.AsyncClient(timeout=10.0, headers=headers)
+        # Cleared once the server turns out not to have /results
+        self.batch_results = True
 
-    async def poll_tasks(self, client_id: str) -> list:
+    async def poll_tasks(self, client_id: str, wait: float = 0.0) -> list:
         try:
             url = f"{self.server_url}/api/v1/client/{client_id}/poll"
-            response = await self.http_client.get(url)
+            # The read timeout must outlast the time the server may hold a long poll open
+            response = await self.http_client.get(url, params={"wait": wait}, timeout=10.0 + wait)
             response.raise_for_status()
-            return response.json().get("pending_tasks", [])
+            tasks = response.json().get("pending_tasks", [])
+            for task in tasks:
+                if "query_vector_b64" in task:
+                    task["query_vector"] = unpack_vector_b64(task.pop("query_vector_b64")).tolist()
+            return tasks
         except httpx.RequestError as e:
             return []
 
-    async def submit_insight(self, client_id: str, request_id: str, insight: str) -> None:
+    async def submit_insight(self, client_id: str, request_id: str, insight: str, ack: bool = False) -> None:
         url = f"{self.server_url}/api/v1/query/{request_id}/insight"
         payload = {"client_id": client_id, "sanitized_insight": insight}
-        await self.http_client.post(url, json=payload)
+        if not ack:
+            await self.http_client.post(url, json=payload)
+            return
+        response = await self.http_client.post(url, json={**payload, "ack": True})
+        response.raise_for_status()
+        if not response.json().get("acked"):
+            # Orchestrator predating the flag: it only saved the insight
+            await self.ack(client_id, request_id)
 
     async def ack(self, client_id: str, request_id: str) -> None:
         url = f"{self.server_url}/api/v1/query/{request_id}/ack"
@@ -27,4 +50,17 @@ class HttpxClientTransport(BaseClientTransport):
         try:
             await self.http_client.post(url, json=payload)
         except httpx.RequestError as e:
-            print(f"Failed to send ACK for {request_id}: {e}")
\ No newline at end of file
+            print(f"Failed to send ACK for {request_id}: {e}")
+
+    async def submit_results(self, client_id: str, results: List[Tuple[str, str | None]]) -> None:
+        if self.batch_results:
+            url = f"{self.server_url}/api/v1/client/{client_id}/results"
+            payload = {"results": [{"request_id": request_id, **({"insight": insight} if insight is not None else {})}
+                                   for request_id, insight in results]}
+            response = await self.http_client.post(url, json=payload)
+            if response.status_code not in (404, 405):
+                response.raise_for_status()
+                return
+            # Orchestrator predating the batch endpoint: fall back to the per-task endpoints from now on
+            self.batch_results = False
+        await super().submit_results(client_id, results)
@@ -0,0 +1,47 @@
+import os
+
+import uvicorn
+from fastapi import FastAPI
+
+from aethelgard.brokers.factory import broker_class_from_env, broker_from_env
+from aethelgard.core.broker import MAX_WAIT_TIMEOUT
+from aethelgard.core.config import get_logger
+from aethelgard.transports.fastapi_server import FastAPIServer
+
+logger = get_logger(__name__)
+
+# Import string of the app factory each worker process calls (uvicorn factory=True)
+APP_FACTORY = "aethelgard.transports.runner:create_app"
+
+# Seconds a stopping worker is given to finish in-flight requests; a long poll may wait MAX_WAIT_TIMEOUT
+GRACEFUL_SHUTDOWN_TIMEOUT = MAX_WAIT_TIMEOUT + 5.0
+
+
+def create_app() -> FastAPI:
+    """
+    Builds the orchestrator app of one worker process. The broker, hence its connection pools,
+    is created here from the environment (see broker_from_env), i.e. once per worker.
+    """
+    return FastAPIServer(broker_from_env()).app
+
+
+def run_workers(host: str = "0.0.0.0", port: int = 8010, workers: int | None = None) -> None:
+    """
+    Runs `workers` orchestrator processes (default: one per CPU) accepting on one shared socket.
+
+    All workers serve the same state, so the configured broker must be multiprocess_safe (Redis,
+    SQLite): a broker holding its state in-process would give each worker its own queues.
+    The uvicorn supervisor restarts dead workers; SIGHUP reloads them one by one, each old worker
+    draining its in-flight requests for up to GRACEFUL_SHUTDOWN_TIMEOUT seconds.
+    """
+    workers = workers or os.cpu_count() or 1
+    broker_class = broker_class_from_env()
+    if workers > 1 and not broker_class.multiprocess_safe:
+        raise ValueError(f"{broker_class.__name__} keeps its state in-process and cannot be shared by "
+                         f"{workers} workers; configure a Redis or SQLite broker (BROKER) or run one worker")
+
+    logger.info(f"🛡️ Booting {workers} Aethelgard FastAPI workers on {host}:{port} ({broker_class.__name__})")
+    uvicorn.run(
+        APP_FACTORY, factory=True, host=host, port=port, workers=workers, log_level="info",
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT
+    )
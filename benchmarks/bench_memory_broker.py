@@ -0,0 +1,73 @@
+"""
+Micro-benchmark: InMemoryBroker vs SQLiteBroker vs RedisBroker on the same broadcast/poll/insight/ack workload.
+
+Each round broadcasts one 1920-d query to every client, then every client polls, submits an
+insight and acks, and finally the consensus is read back. Throughput is reported as
+completed task round trips (enqueue -> dequeue -> insight -> ack) per second.
+
+Usage:
+    python benchmarks/bench_memory_broker.py --redis-url redis://localhost:6379 --clients 50 --rounds 200
+
+Pass --skip-redis to benchmark the in-process brokers alone.
+WARNING: the Redis run flushes the selected database. Point it at a scratch instance.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.brokers.redis_broker import RedisBroker
+from aethelgard.brokers.sqlite_broker import SQLiteBroker
+
+
+async def run_workload(broker, clients: list, rounds: int, vector: list) -> dict:
+    start = time.perf_counter()
+    for i in range(rounds):
+        request_id = f"req-{i}"
+        await broker.enqueue_many(request_id, clients, vector)
+        for client_id in clients:
+            for task in await broker.dequeue_queries(client_id):
+                await broker.save_insight(task["request_id"], client_id, '{"summary": "n/a"}')
+                await broker.ack(client_id, task["request_id"])
+        await broker.get_consensus(request_id)
+    elapsed = time.perf_counter() - start
+
+    tasks = rounds * len(clients)
+    return {
+        "broker": type(broker).__name__,
+        "clients": len(clients),
+        "rounds": rounds,
+        "elapsed_s": round(elapsed, 3),
+        "tasks_per_s": round(tasks / elapsed, 1),
+    }
+
+
+async def main(args):
+    vector = [random.uniform(-1.0, 1.0) for _ in range(args.dim)]
+    clients = [f"Hospital_{i}" for i in range(args.clients)]
+
+    brokers = [InMemoryBroker(), SQLiteBroker(args.sqlite_db)]
+    if not args.skip_redis:
+        redis_broker = RedisBroker(args.redis_url)
+        await redis_broker.redis.flushdb()
+        brokers.append(redis_broker)
+
+    for broker in brokers:
+        print(json.dumps(await run_workload(broker, clients, args.rounds, vector)))
+        if isinstance(broker, RedisBroker):
+            await broker.redis.flushdb()
+        await broker.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="InMemoryBroker vs SQLiteBroker vs RedisBroker micro-benchmark")
+    parser.add_argument("--redis-url", type=str, default="redis://localhost:6379")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1920, help="Query vector dimension")
+    parser.add_argument("--sqlite-db", type=str, default="./bench_broker.db", help="Scratch SQLite database file")
+    parser.add_argument("--skip-redis", action="store_true", help="Only run the in-process brokers")
+    args = parser.parse_args()
+    asyncio.run(main(args))
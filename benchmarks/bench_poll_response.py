@@ -0,0 +1,98 @@
+"""
+Times `/poll` responses carrying --batch pending tasks, before and after the fast JSON path.
+
+  - baseline     the route as it used to be: dequeue_queries() dicts returned through FastAPI's
+                 jsonable_encoder and the stdlib JSONResponse
+  - stdlib       the current route with response_class=JSONResponse (raw task passthrough only)
+  - fast         the current route with the default FastJSONResponse (orjson when installed)
+
+Each poll drains exactly --batch tasks, refilled (untimed) between polls, and is served through
+the ASGI app in-process. Reports polls/s and p50/p99 latency in ms per broker and vector dimension.
+
+Usage:
+    python benchmarks/bench_poll_response.py --brokers memory sqlite log --dims 1920 --polls 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi.responses import JSONResponse
+
+from aethelgard.brokers.log_broker import LogBroker
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.brokers.sqlite_broker import SQLiteBroker
+from aethelgard.transports.fastapi_server import FastAPIServer, orjson
+
+CLIENT_ID = "bench_client"
+
+
+def make_broker(name: str, scratch_dir: str):
+    path = os.path.join(scratch_dir, f"bench_{time.monotonic_ns()}")
+    if name == "sqlite":
+        return SQLiteBroker(f"{path}.db")
+    if name == "log":
+        return LogBroker(path)
+    return InMemoryBroker()
+
+
+def build_app(broker, variant: str):
+    server = FastAPIServer(broker, response_class=JSONResponse) if variant == "stdlib" else FastAPIServer(broker)
+    if variant == "baseline":
+        @server.app.get("/baseline/client/{client_id}/poll", response_class=JSONResponse)
+        async def baseline_poll(client_id: str, max_batch: int = 100):
+            return {"pending_tasks": await broker.dequeue_queries(client_id, max_batch)}
+    return server.app
+
+
+async def run(name: str, variant: str, dim: int, args, scratch_dir: str) -> dict:
+    broker = make_broker(name, scratch_dir)
+    app = build_app(broker, variant)
+    path = f"/{'baseline' if variant == 'baseline' else 'api/v1'}/client/{CLIENT_ID}/poll"
+    vector = [random.uniform(-1.0, 1.0) for _ in range(dim)]
+    samples = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for poll in range(args.polls):
+            for i in range(args.batch):
+                await broker.enqueue_query(CLIENT_ID, f"req-{poll}-{i}", vector)
+            start = time.perf_counter()
+            response = await client.get(path, params={"max_batch": args.batch})
+            samples.append(time.perf_counter() - start)
+            assert len(response.json()["pending_tasks"]) == args.batch
+    await broker.close()
+    samples.sort()
+    return {
+        "broker": type(broker).__name__,
+        "variant": variant,
+        "dim": dim,
+        "batch": args.batch,
+        "polls_per_s": round(len(samples) / sum(samples), 1),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+    }
+
+
+async def main(args):
+    print(json.dumps({"orjson": orjson is not None}))
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        for name in args.brokers:
+            for dim in args.dims:
+                for variant in ("baseline", "stdlib", "fast"):
+                    print(json.dumps(await run(name, variant, dim, args, scratch_dir)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/poll response serialisation benchmark")
+    parser.add_argument("--brokers", nargs="+", choices=["memory", "sqlite", "log"], default=["memory", "sqlite"])
+    parser.add_argument("--dims", type=int, nargs="+", default=[1920])
+    parser.add_argument("--batch", type=int, default=100, help="Pending tasks returned by each poll")
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main(args))
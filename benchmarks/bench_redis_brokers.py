@@ -0,0 +1,107 @@
+"""
+Compares RedisBroker and RedisStreamsBroker at increasing queue depths, against ListScanBaseline:
+the original list layout, whose ack scans the processing list (LRANGE + JSON decode + LREM).
+
+For each depth the benchmark enqueues N tasks for one client, drains them with a single
+dequeue_queries(max_batch=depth) call, and then times a sample of acks taken from the end of the
+processing set. That is the worst case for the baseline's scan; RedisBroker (in-flight set indexed
+by request_id) and RedisStreamsBroker (XACK) ack at a cost independent of the depth.
+
+Usage:
+    python benchmarks/bench_redis_brokers.py --redis-url redis://localhost:6379 --depths 1000 10000 100000
+
+At the full 1920-d payload, 100k queued tasks need several GB of Redis memory;
+lower --dim for the largest depth on small machines.
+
+WARNING: the benchmark flushes the selected Redis database. Point it at a scratch instance.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import redis.asyncio as redis
+
+from aethelgard.brokers.redis_broker import RedisBroker
+from aethelgard.brokers.redis_streams_broker import RedisStreamsBroker
+
+CLIENT_ID = "bench_client"
+
+
+class ListScanBaseline:
+    """The list-only layout RedisBroker used before indexing in-flight tasks: full JSON tasks in queue lists."""
+
+    def __init__(self, redis_url: str):
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+
+    async def enqueue_query(self, client_id: str, request_id: str, query_vector: list) -> None:
+        await self.redis.lpush(f"queue:{client_id}", json.dumps({"request_id": request_id, "query_vector": query_vector}))
+
+    async def dequeue_queries(self, client_id: str, max_batch: int) -> list:
+        tasks = []
+        while len(tasks) < max_batch:
+            task_data = await self.redis.lmove(f"queue:{client_id}", f"processing:{client_id}", "RIGHT", "LEFT")
+            if not task_data:
+                break
+            tasks.append(json.loads(task_data))
+        return tasks
+
+    async def ack(self, client_id: str, request_id: str) -> None:
+        processing_queue = f"processing:{client_id}"
+        for task_data in await self.redis.lrange(processing_queue, 0, -1):
+            if json.loads(task_data)["request_id"] == request_id:
+                await self.redis.lrem(processing_queue, 1, task_data)
+                break
+
+
+async def bench_broker(broker, depth: int, dim: int, ack_sample: int) -> dict:
+    await broker.redis.flushdb()
+    vector = [random.uniform(-1.0, 1.0) for _ in range(dim)]
+    request_ids = [f"req-{i}" for i in range(depth)]
+
+    start = time.perf_counter()
+    for request_id in request_ids:
+        await broker.enqueue_query(CLIENT_ID, request_id, vector)
+    enqueue_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tasks = await broker.dequeue_queries(CLIENT_ID, max_batch=depth)
+    dequeue_s = time.perf_counter() - start
+    assert len(tasks) == depth, f"expected {depth} tasks, got {len(tasks)}"
+
+    sample = request_ids[-ack_sample:]
+    start = time.perf_counter()
+    for request_id in sample:
+        await broker.ack(CLIENT_ID, request_id)
+    ack_s = time.perf_counter() - start
+
+    return {
+        "broker": type(broker).__name__,
+        "depth": depth,
+        "enqueue_ops_per_s": round(depth / enqueue_s, 1),
+        "dequeue_total_s": round(dequeue_s, 4),
+        "ack_ms_per_op": round(ack_s / len(sample) * 1000, 3),
+    }
+
+
+async def main(args):
+    results = []
+    for depth in args.depths:
+        for broker in (ListScanBaseline(args.redis_url), RedisBroker(args.redis_url), RedisStreamsBroker(args.redis_url)):
+            result = await bench_broker(broker, depth, args.dim, min(args.ack_sample, depth))
+            print(json.dumps(result))
+            results.append(result)
+            await broker.redis.flushdb()
+            await broker.redis.aclose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RedisBroker vs RedisStreamsBroker vs list-scan baseline benchmark")
+    parser.add_argument("--redis-url", type=str, default="redis://localhost:6379")
+    parser.add_argument("--depths", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=1920, help="Query vector dimension")
+    parser.add_argument("--ack-sample", type=int, default=100, help="Number of acks timed per depth")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,187 @@
+"""
+Broker benchmark suite: per-method throughput and latency of every BaseTaskBroker implementation.
+
+For each combination of client count, queue depth and vector dimension, a fresh broker runs:
+  - enqueue_many     `depth` broadcasts to every client (the queues are filled, not drained, in between)
+  - dequeue_queries  every client drains its queue in polls of --max-batch tasks
+  - save_insight     one insight per delivered task
+  - ack              one ack per delivered task
+  - get_consensus    once per broadcast
+  - get_status       once per broadcast
+  - enqueue_query    `depth` single-client enqueues (then drained and acked, untimed)
+  - get_metrics      --metrics-calls reads
+  - update_push      save_insight -> subscribe_updates() wake-up latency, on up to 50 requests
+Each call is timed separately. Every result row reports calls/s and items/s (tasks or insights
+handled per second; a poll or a broadcast handles several), plus p50/p99 call latency in ms.
+
+Usage:
+    python benchmarks/bench_suite.py --brokers memory sqlite log --clients 1 10 50 --depths 10 100 --dims 1920
+    python benchmarks/bench_suite.py --brokers redis streams --redis-url redis://localhost:6379 --output results.json
+
+`memory`, `sqlite` and `log` run in-process with no external service. Results go to stdout as JSON lines;
+--output also writes them, with the environment, to one JSON document for later comparison.
+WARNING: the redis and streams runs flush the selected database. Point them at a scratch instance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from aethelgard.brokers.log_broker import LogBroker
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.brokers.redis_broker import RedisBroker
+from aethelgard.brokers.redis_streams_broker import RedisStreamsBroker
+from aethelgard.brokers.sqlite_broker import SQLiteBroker
+from aethelgard.core.broker import latency_summary
+
+INSIGHT = json.dumps({"summary": "synthetic insight", "protocol": "n/a"})
+PUSH_SAMPLES = 50
+
+
+async def make_broker(name: str, args, scratch_dir: str):
+    if name == "memory":
+        return InMemoryBroker()
+    if name == "sqlite":
+        return SQLiteBroker(os.path.join(scratch_dir, f"bench_{time.monotonic_ns()}.db"))
+    if name == "log":
+        return LogBroker(os.path.join(scratch_dir, f"bench_{time.monotonic_ns()}"))
+    broker = RedisBroker(args.redis_url) if name == "redis" else RedisStreamsBroker(args.redis_url)
+    await broker.redis.flushdb()
+    return broker
+
+
+class Recorder:
+    """Collects per-call latencies and item counts of each broker method."""
+
+    def __init__(self):
+        self.calls = {}
+
+    def record(self, op: str, duration: float, items: int = 1) -> None:
+        self.calls.setdefault(op, []).append((duration, items))
+
+    async def time(self, op: str, coro, items: int = 1):
+        start = time.perf_counter()
+        result = await coro
+        self.record(op, time.perf_counter() - start, items)
+        return result
+
+    def rows(self, **labels) -> list:
+        rows = []
+        for op, calls in self.calls.items():
+            elapsed = sum(duration for duration, _ in calls)
+            # Summarised in microseconds: in-process calls are well below latency_summary's 0.1 resolution
+            summary = latency_summary([duration * 1e6 for duration, _ in calls])
+            rows.append({
+                **labels,
+                "op": op,
+                "calls": len(calls),
+                "items": sum(items for _, items in calls),
+                "ops_per_s": round(len(calls) / elapsed, 1) if elapsed else None,
+                "items_per_s": round(sum(items for _, items in calls) / elapsed, 1) if elapsed else None,
+                "p50_ms": round(summary["p50_ms"] / 1000, 4),
+                "p99_ms": round(summary["p99_ms"] / 1000, 4),
+            })
+        return rows
+
+
+async def drain(broker, rec: Recorder | None, client_id: str, max_batch: int) -> list:
+    """Polls a client's queue until empty; returns the delivered request_ids."""
+    delivered = []
+    while True:
+        start = time.perf_counter()
+        tasks = await broker.dequeue_queries(client_id, max_batch)
+        if rec is not None:
+            rec.record("dequeue_queries", time.perf_counter() - start, len(tasks))
+        if not tasks:
+            return delivered
+        delivered += [task["request_id"] for task in tasks]
+
+
+async def run_case(broker, clients: list, depth: int, dim: int, args) -> list:
+    rec = Recorder()
+    vector = [random.uniform(-1.0, 1.0) for _ in range(dim)]
+    request_ids = [f"req-{i}" for i in range(depth)]
+
+    for request_id in request_ids:
+        await rec.time("enqueue_many", broker.enqueue_many(request_id, clients, vector), items=len(clients))
+
+    for client_id in clients:
+        for request_id in await drain(broker, rec, client_id, args.max_batch):
+            await rec.time("save_insight", broker.save_insight(request_id, client_id, INSIGHT))
+            await rec.time("ack", broker.ack(client_id, request_id))
+
+    for request_id in request_ids:
+        await rec.time("get_consensus", broker.get_consensus(request_id))
+        await rec.time("get_status", broker.get_status(request_id))
+
+    for request_id in request_ids:
+        await rec.time("enqueue_query", broker.enqueue_query(clients[0], f"single-{request_id}", vector))
+    for request_id in await drain(broker, None, clients[0], args.max_batch):
+        await broker.ack(clients[0], request_id)
+
+    for _ in range(args.metrics_calls):
+        await rec.time("get_metrics", broker.get_metrics())
+
+    for request_id in request_ids[:PUSH_SAMPLES]:
+        async with broker.subscribe_updates(request_id) as subscription:
+            waiter = asyncio.create_task(subscription.wait(5.0))
+            await asyncio.sleep(0)
+            start = time.perf_counter()
+            await broker.save_insight(request_id, clients[0], INSIGHT)
+            await waiter
+            rec.record("update_push", time.perf_counter() - start)
+
+    return rec.rows(broker=type(broker).__name__, clients=len(clients), depth=depth, dim=dim)
+
+
+async def main(args):
+    results = []
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        for name in args.brokers:
+            for client_count in args.clients:
+                clients = [f"Hospital_{i}" for i in range(client_count)]
+                for depth in args.depths:
+                    for dim in args.dims:
+                        broker = await make_broker(name, args, scratch_dir)
+                        try:
+                            rows = await run_case(broker, clients, depth, dim, args)
+                        finally:
+                            if isinstance(broker, RedisBroker):
+                                await broker.redis.flushdb()
+                            await broker.close()
+                        for row in rows:
+                            print(json.dumps(row))
+                        results += rows
+
+    if args.output:
+        environment = {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "args": vars(args),
+        }
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-method throughput/latency benchmark of the task brokers")
+    parser.add_argument("--brokers", nargs="+", choices=["memory", "sqlite", "log", "redis", "streams"],
+                        default=["memory", "sqlite"])
+    parser.add_argument("--redis-url", type=str, default="redis://localhost:6379")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50], help="Target clients per broadcast")
+    parser.add_argument("--depths", type=int, nargs="+", default=[10, 100], help="Broadcasts queued before draining")
+    parser.add_argument("--dims", type=int, nargs="+", default=[1920], help="Query vector dimensions (payload size)")
+    parser.add_argument("--max-batch", type=int, default=100, help="Tasks per dequeue_queries() poll")
+    parser.add_argument("--metrics-calls", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic vectors")
+    parser.add_argument("--output", type=str, default=None, help="Also write all results to this JSON file")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main(args))
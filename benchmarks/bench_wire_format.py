@@ -0,0 +1,100 @@
+"""
+Compares JSON float lists with base64 packed float32 vectors (`query_vector_b64`) on the API.
+
+For each vector dimension it measures:
+  - body_bytes        size of the broadcast request body
+  - parse_us          median time to parse and validate one broadcast body into a ClinicalQuery
+                      (json.loads + model validation, as FastAPI does), in microseconds
+  - broadcast_per_s   broadcasts/s through the full ASGI app (in-memory broker, no network)
+  - poll_per_s        polls/s returning --batch tasks, with and without the packed Accept type,
+                      including the client-side decoding done by HttpxClientTransport
+
+Usage:
+    python benchmarks/bench_wire_format.py --dims 384 1920 4096 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import httpx
+
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.core.codec import VECTOR_B64_MEDIA_TYPE, pack_vector_b64, unpack_vector_b64
+from aethelgard.transports.fastapi_server import ClinicalQuery, FastAPIServer
+
+CLIENT_ID = "bench_client"
+
+
+def body(vector: list, packed: bool) -> bytes:
+    query = {"query_text": "benchmark query", "target_clients": [CLIENT_ID]}
+    if packed:
+        query["query_vector_b64"] = pack_vector_b64(vector)
+    else:
+        query["query_vector"] = vector
+    return json.dumps(query).encode()
+
+
+def parse_us(payload: bytes, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ClinicalQuery.model_validate(json.loads(payload))
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1e6, 1)
+
+
+async def http_rates(vector: list, packed: bool, args) -> dict:
+    app = FastAPIServer(InMemoryBroker()).app
+    headers = {"Accept": VECTOR_B64_MEDIA_TYPE} if packed else {}
+    payload = body(vector, packed)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            response = await client.post("/api/v1/query/broadcast", content=payload,
+                                         headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+        broadcast_s = time.perf_counter() - start
+
+        polls = args.requests // args.batch
+        start = time.perf_counter()
+        for _ in range(polls):
+            response = await client.get(f"/api/v1/client/{CLIENT_ID}/poll", params={"max_batch": args.batch},
+                                        headers=headers)
+            for task in response.json()["pending_tasks"]:
+                if "query_vector_b64" in task:
+                    task["query_vector"] = unpack_vector_b64(task.pop("query_vector_b64")).tolist()
+        poll_s = time.perf_counter() - start
+    return {
+        "broadcast_per_s": round(args.requests / broadcast_s, 1),
+        "poll_per_s": round(polls / poll_s, 1) if polls else None,
+    }
+
+
+async def main(args):
+    for dim in args.dims:
+        vector = [random.uniform(-1.0, 1.0) for _ in range(dim)]
+        for packed in (False, True):
+            payload = body(vector, packed)
+            row = {
+                "format": "float32_b64" if packed else "json",
+                "dim": dim,
+                "body_bytes": len(payload),
+                "parse_us": parse_us(payload, args.parse_repeats),
+                **await http_rates(vector, packed, args),
+            }
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON vs base64 float32 vector wire format benchmark")
+    parser.add_argument("--dims", type=int, nargs="+", default=[384, 1920, 4096])
+    parser.add_argument("--requests", type=int, default=2000, help="Broadcasts per format and dimension")
+    parser.add_argument("--batch", type=int, default=50, help="Tasks per poll")
+    parser.add_argument("--parse-repeats", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main(args))
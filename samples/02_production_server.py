@@ -4,21 +4,27 @@ import os
 
 from dotenv import load_dotenv
 
-from aethelgard.brokers.redis_broker import RedisBroker
+from aethelgard.brokers.factory import broker_from_env
 from aethelgard.transports.fastapi_server import FastAPIServer
+from aethelgard.transports.runner import run_workers
 
-async def main(env_file: str):
-    # Load the specific profile passed via CLI
-    load_dotenv(env_file, override=False)
-    port = int(os.getenv("SERVER_PORT"))
+async def main(host: str, port: int):
+    # BROKER, REDIS_URL, REDIS_CLUSTER, ADMISSION_*, ... select and configure the broker (see broker_from_env)
+    server = FastAPIServer(broker=broker_from_env())
 
-    broker = RedisBroker(redis_url=os.getenv("REDIS_URL"))
-    server = FastAPIServer(broker=broker)
-
-    await server.run(host=os.getenv("SERVER_HOST"), port=port)
+    await server.run(host=host, port=port)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Aethelgard Server")
     parser.add_argument("--config", type=str, default=".env", help="Path to the .env profile")
     args = parser.parse_args()
-    asyncio.run(main(args.config))
\ No newline at end of file
+    # Load the specific profile passed via CLI; worker processes inherit the environment
+    load_dotenv(args.config, override=False)
+    host, port = os.getenv("SERVER_HOST"), int(os.getenv("SERVER_PORT"))
+
+    # SERVER_WORKERS > 1 runs that many processes on the shared port (0: one per CPU)
+    workers = int(os.getenv("SERVER_WORKERS", "1"))
+    if workers == 1:
+        asyncio.run(main(host, port))
+    else:
+        run_workers(host=host, port=port, workers=workers or None)
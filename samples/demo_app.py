@@ -1,5 +1,4 @@
 import argparse
-import asyncio
 import base64
 import json
 import os
@@ -11,6 +10,7 @@ import numpy as np
 from dotenv import load_dotenv
 from nicegui import ui, app, events
 
+from aethelgard.core.codec import pack_vector_b64
 from aethelgard.core.config import get_logger
 
 logger = get_logger(__name__)
@@ -22,8 +22,7 @@ logger = get_logger(__name__)
 # Aethelgard Network Configuration
 TARGET_NODES = ["Hospital_B"]
 VECTOR_DIMENSIONS = 1920  # Matches LanceDB (768 text + 1152 image)
-POLL_INTERVAL = 30
-MAX_ATTEMPTS = 8
+CONSENSUS_TIMEOUT = 240  # Seconds to wait for every target node on the consensus event stream
 NOISE_SIGMA = 0.15
 
 # Holds the current patient data
@@ -146,10 +145,11 @@ def format_medical_insight(insight_data) -> str:
 
 
 async def broadcast_and_poll(query_text: str, query_vector: list, update_container) -> List[Dict]:
-    """Broadcasts query to the Orchestrator and polls for global consensus."""
+    """Broadcasts query to the Orchestrator and waits for global consensus on its event stream."""
     payload = {
         "query_text": query_text or "General clinical query",
-        "query_vector": query_vector,
+        # Packed float32 (base64) is ~4x smaller than JSON floats and parsed without per-float validation
+        "query_vector_b64": pack_vector_b64(query_vector),
         "target_clients": TARGET_NODES
     }
 
@@ -164,25 +164,25 @@ async def broadcast_and_poll(query_text: str, query_vector: list, update_contain
             logger.error(f"Broadcast failed: {e}")
             return [{"node": "Orchestrator Error", "match_confidence": "0%", "insight": f"Broadcast failed: {e}"}]
 
-        # 2. Poll for Consensus
+        # 2. Stream the consensus: insights are pushed as they arrive, until every target acked
         data = []
-        for attempt in range(1, MAX_ATTEMPTS + 1):
-            with update_container:
-                ui.notify(f"Polling orchestrator... Attempt {attempt}/{MAX_ATTEMPTS}", type='info', position='bottom-left')
-
-            await asyncio.sleep(POLL_INTERVAL)
-
-            try:
-                cons_resp = await client.get(f"{SERVER_URL}/api/v1/query/{req_id}/consensus")
-                cons_resp.raise_for_status()
-                data = cons_resp.json().get("consensus_data", [])
-
-                # Success Condition
-                if len(data) == len(TARGET_NODES):
-                    break
-            except httpx.RequestError as e:
-                logger.error(f"Error fetching consensus: {e}")
-                continue
+        with update_container:
+            ui.notify("Waiting for the network's insights...", type='info', position='bottom-left')
+        try:
+            async with client.stream("GET", f"{SERVER_URL}/api/v1/query/{req_id}/stream",
+                                     params={"timeout": CONSENSUS_TIMEOUT}, timeout=None) as stream:
+                stream.raise_for_status()
+                event = None
+                async for line in stream.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event == "insight":
+                        data.append(json.loads(line[len("data: "):]))
+                        with update_container:
+                            ui.notify(f"Insight received ({len(data)}/{len(TARGET_NODES)})",
+                                      type='info', position='bottom-left')
+        except httpx.HTTPError as e:
+            logger.error(f"Error streaming consensus: {e}")
 
         # 3. Format insights for the UI
         formatted_results = []
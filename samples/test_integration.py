@@ -10,8 +10,8 @@ TARGET_NODES = ["Hospital_A", "Hospital_B"]
 VECTOR_DIMENSIONS = 1920  # Matches LanceDB (768 text + 1152 image)
 
 # --- Polling Tuning ---
-POLL_INTERVAL = 10  # Longer delay between checks (seconds)
-MAX_ATTEMPTS = 4  # Fewer total checks (Max timeout = 40 seconds)
+POLL_INTERVAL = 2  # The consensus status reports completion, so checks can be frequent (seconds)
+MAX_ATTEMPTS = 20  # Max timeout = 40 seconds
 
 
 def print_insights(data: list, start_time: float, is_partial: bool = False):
@@ -77,24 +77,28 @@ async def run_integration_test():
         # 3. Poll for Consensus
         print(f"\n Polling every {POLL_INTERVAL}s for global consensus...")
 
-        data = []
+        data, status = [], "pending"
         for attempt in range(1, MAX_ATTEMPTS + 1):
             await asyncio.sleep(POLL_INTERVAL)
 
             try:
                 cons_resp = await client.get(f"{SERVER_URL}/api/v1/query/{req_id}/consensus")
                 cons_resp.raise_for_status()
-                data = cons_resp.json().get("consensus_data", [])
+                consensus = cons_resp.json()
+                data, status = consensus.get("consensus_data", []), consensus.get("status", "pending")
             except httpx.RequestError as e:
                 print(f"   [Attempt {attempt}/{MAX_ATTEMPTS}] Error fetching consensus: {e}")
                 continue
 
-            print(f"   [Attempt {attempt}/{MAX_ATTEMPTS}] Received {len(data)}/{len(TARGET_NODES)} insights...")
+            print(f"   [Attempt {attempt}/{MAX_ATTEMPTS}] Status '{status}': "
+                  f"received {len(data)}/{len(TARGET_NODES)} insights...")
 
-            # 4. Success Condition
-            if len(data) == len(TARGET_NODES):
+            # 4. Success Condition: every target node acked its task
+            if status == "complete":
                 print_insights(data, start_time, is_partial=False)
                 return
+            if status == "expired":
+                break
 
         # 5. Timeout Fallback (Prints partial data if available)
         print_insights(data, start_time, is_partial=True)
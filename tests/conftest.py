@@ -0,0 +1,98 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from aethelgard.brokers.log_broker import LogBroker
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.brokers import redis_cluster_broker
+from aethelgard.brokers.redis_broker import RedisBroker
+from aethelgard.brokers.redis_cluster_broker import RedisClusterBroker
+from aethelgard.brokers.sqlite_broker import SQLiteBroker
+from aethelgard.core.codec import Float32TaskCodec
+from aethelgard.transports.fastapi_server import FastAPIServer
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+else:
+    class FakeRedis(fakeredis.FakeAsyncRedis):
+        """fakeredis has no INFO; reports `used_memory` so that memory budgets and reports work."""
+
+        used_memory = 0
+
+        async def info(self, section=None, *args, **kwargs):
+            return {"used_memory": self.used_memory, "used_memory_peak": self.used_memory, "maxmemory": 0,
+                    "maxmemory_policy": "noeviction", "expired_keys": 0, "evicted_keys": 0}
+
+BROKERS = {
+    "memory": lambda tmp_path, **options: InMemoryBroker(**options),
+    "sqlite": lambda tmp_path, **options: SQLiteBroker(str(tmp_path / "broker.db"), **options),
+    "sqlite_float32": lambda tmp_path, **options: SQLiteBroker(str(tmp_path / "broker.db"),
+                                                               codec=Float32TaskCodec(), **options),
+    "log": lambda tmp_path, **options: LogBroker(str(tmp_path / "log"), **options),
+    "redis": lambda tmp_path, **options: RedisBroker(**options),
+    "redis_fanout": lambda tmp_path, **options: RedisBroker(fanout=True, **options),
+    "redis_float32": lambda tmp_path, **options: RedisBroker(codec=Float32TaskCodec(), **options),
+    "redis_cluster": lambda tmp_path, **options: RedisClusterBroker(**options),
+}
+REDIS_BROKERS = {name for name in BROKERS if name.startswith("redis")}
+
+
+def broker_params(names=BROKERS):
+    """pytest params of the named brokers; the Redis ones are skipped without fakeredis."""
+    return [
+        pytest.param(name, marks=pytest.mark.skipif(fakeredis is None, reason="needs fakeredis"))
+        if name in REDIS_BROKERS else name
+        for name in sorted(names)
+    ]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """
+    Points every RedisBroker built in the test at one fresh in-process fakeredis server. A
+    RedisClusterBroker sees it as a single-node cluster; fakeredis does not check key slots.
+    """
+    server = fakeredis.FakeServer()
+
+    def connect(redis_url, decode_responses=False):
+        return FakeRedis(server=server, decode_responses=decode_responses)
+
+    async def primaries_info(self, section):
+        return [await self.redis.info(section)]
+
+    monkeypatch.setattr(RedisBroker, "_connect", staticmethod(connect))
+    monkeypatch.setattr(RedisClusterBroker, "_connect", staticmethod(connect))
+    monkeypatch.setattr(RedisClusterBroker, "_primaries_info", primaries_info)
+    monkeypatch.setattr(redis_cluster_broker.redis, "from_url", connect)
+    return server
+
+
+@pytest.fixture(params=broker_params())
+async def make_broker(request, tmp_path):
+    """Builds brokers of the parametrised kind with the given options; they are closed after the test."""
+    if request.param in REDIS_BROKERS:
+        request.getfixturevalue("fake_redis")
+    brokers = []
+
+    def build(**options):
+        brokers.append(BROKERS[request.param](tmp_path, **options))
+        return brokers[-1]
+
+    yield build
+    for broker in brokers:
+        await broker.close()
+
+
+@pytest.fixture
+def broker(make_broker):
+    return make_broker()
+
+
+@pytest.fixture(params=broker_params())
+def client(request, tmp_path):
+    """A TestClient of the orchestrator; its lifespan starts and closes the broker."""
+    if request.param in REDIS_BROKERS:
+        request.getfixturevalue("fake_redis")
+    with TestClient(FastAPIServer(BROKERS[request.param](tmp_path)).app) as client:
+        yield client
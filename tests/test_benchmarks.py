@@ -0,0 +1,21 @@
+"""Smoke runs of the benchmark scripts on tiny in-process workloads."""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_bench_suite_reports_every_method(tmp_path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, str(ROOT / "benchmarks" / "bench_suite.py"), "--brokers", "memory", "sqlite", "log",
+         "--clients", "2", "--depths", "3", "--dims", "4", "--metrics-calls", "1", "--output", str(output)],
+        check=True, capture_output=True, env={**os.environ, "PYTHONPATH": str(ROOT)}, timeout=120,
+    )
+
+    results = json.loads(output.read_text())["results"]
+    assert {row["broker"] for row in results} == {"InMemoryBroker", "SQLiteBroker", "LogBroker"}
+    assert {row["op"] for row in results} >= {"enqueue_many", "dequeue_queries", "ack", "update_push"}
@@ -0,0 +1,313 @@
+"""The BaseTaskBroker contract, run against every broker of conftest.BROKERS."""
+import asyncio
+
+import pytest
+
+from aethelgard.core.broker import (
+    ADMISSION_SHED_OLDEST, ADMISSION_SKIP, AdmissionControl, NodeSaturatedError, PRIORITY_ROUTINE, PRIORITY_STAT,
+    PRIORITY_URGENT
+)
+
+# Exactly representable in float32, so the vector survives any codec unchanged
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+
+async def test_enqueued_task_is_dequeued_once(broker):
+    await broker.enqueue_query("a", "req-1", VECTOR)
+
+    tasks = await broker.dequeue_queries("a")
+    assert [task["request_id"] for task in tasks] == ["req-1"]
+    assert list(tasks[0]["query_vector"]) == VECTOR
+    assert await broker.dequeue_queries("a") == []
+    assert await broker.dequeue_queries("b") == []
+
+
+async def test_insight_and_ack(broker):
+    await broker.enqueue_query("a", "req-1", VECTOR)
+    await broker.dequeue_queries("a")
+
+    await broker.save_insight("req-1", "a", '{"summary": "n/a"}')
+    await broker.ack("a", "req-1")
+    assert await broker.get_consensus("req-1") == [{"client_id": "a", "insight": '{"summary": "n/a"}'}]
+    assert (await broker.get_metrics())["in_flight"] == 0
+
+
+async def test_ack_of_unknown_task_is_a_no_op(broker):
+    await broker.ack("a", "missing")
+    await broker.enqueue_query("a", "req-1", VECTOR)
+    await broker.ack("b", "req-1")
+
+    assert [task["request_id"] for task in await broker.dequeue_queries("a")] == ["req-1"]
+
+
+async def test_consensus_of_unknown_request_is_empty(broker):
+    assert await broker.get_consensus("missing") == []
+
+
+async def test_ack_settles_only_its_task(broker):
+    for i in range(3):
+        await broker.enqueue_query("a", f"req-{i}", VECTOR)
+    assert len(await broker.dequeue_queries("a", max_batch=3)) == 3
+
+    await broker.ack("a", "req-1")
+    assert (await broker.get_metrics())["in_flight"] == 2
+    await broker.ack("a", "req-1")
+    await broker.ack("a", "req-0")
+    await broker.ack("a", "req-2")
+    assert (await broker.get_metrics())["in_flight"] == 0
+
+
+async def test_dequeue_respects_max_batch_in_fifo_order(broker):
+    for i in range(5):
+        await broker.enqueue_query("a", f"req-{i}", VECTOR)
+
+    first = await broker.dequeue_queries("a", max_batch=3)
+    rest = await broker.dequeue_queries("a", max_batch=3)
+    assert [task["request_id"] for task in first + rest] == [f"req-{i}" for i in range(5)]
+    assert await broker.dequeue_queries("a", max_batch=3) == []
+
+
+async def test_enqueue_many_reaches_every_target_once(broker):
+    report = await broker.enqueue_many("req-1", ["a", "b", "c"], VECTOR)
+    assert report["skipped"] == [] and report["shed"] == {}
+
+    for client_id in ("a", "b", "c"):
+        assert [task["request_id"] for task in await broker.dequeue_queries(client_id)] == ["req-1"]
+        assert await broker.dequeue_queries(client_id) == []
+
+
+async def test_expired_lease_is_redelivered(make_broker):
+    broker = make_broker(visibility_timeout=0.05, max_deliveries=3)
+    await broker.enqueue_query("a", "req-1", VECTOR)
+    assert len(await broker.dequeue_queries("a")) == 1
+    assert await broker.dequeue_queries("a") == []
+
+    await asyncio.sleep(0.1)
+    totals = await broker.reap_expired_leases()
+    assert (totals["redelivered"], totals["dead_lettered"]) == (1, 0)
+    assert [task["request_id"] for task in await broker.dequeue_queries("a")] == ["req-1"]
+
+    await broker.ack("a", "req-1")
+    await asyncio.sleep(0.1)
+    assert (await broker.reap_expired_leases())["redelivered"] == 0
+
+
+async def test_lease_is_dead_lettered_after_max_deliveries(make_broker):
+    broker = make_broker(visibility_timeout=0.05, max_deliveries=2)
+    await broker.enqueue_query("a", "req-1", VECTOR)
+
+    for _ in range(2):
+        assert len(await broker.dequeue_queries("a")) == 1
+        await asyncio.sleep(0.1)
+        await broker.reap_expired_leases()
+
+    assert await broker.dequeue_queries("a") == []
+    metrics = await broker.get_metrics()
+    assert (metrics["dead_lettered_total"], metrics["redelivered_total"], metrics["in_flight"]) == (1, 1, 0)
+
+
+async def test_reaper_runs_in_the_background(make_broker):
+    broker = make_broker(visibility_timeout=0.05, reap_interval=0.05)
+    await broker.start()
+    await broker.enqueue_query("a", "req-1", VECTOR)
+    await broker.dequeue_queries("a")
+
+    await asyncio.sleep(0.3)
+    assert [task["request_id"] for task in await broker.dequeue_queries("a")] == ["req-1"]
+
+
+async def test_long_poll_wakes_on_enqueue(broker):
+    poll = asyncio.create_task(broker.dequeue_queries("a", wait_timeout=5))
+    await asyncio.sleep(0.05)
+    assert not poll.done()
+
+    await broker.enqueue_query("a", "req-1", VECTOR)
+    assert [task["request_id"] for task in await asyncio.wait_for(poll, 2)] == ["req-1"]
+
+
+async def test_long_poll_times_out_empty(broker):
+    started = asyncio.get_running_loop().time()
+    assert await broker.dequeue_queries("a", wait_timeout=0.2) == []
+    assert asyncio.get_running_loop().time() - started >= 0.15
+
+
+async def test_status_tracks_completion(broker):
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    status = await broker.get_status("req-1")
+    assert (status["status"], status["expected"], status["nodes_outstanding"]) == ("pending", 2, 2)
+
+    await broker.dequeue_queries("a")
+    await broker.save_insight("req-1", "a", "i")
+    assert (await broker.get_status("req-1"))["status"] == "partial"
+    await broker.ack("a", "req-1")
+    await broker.ack("a", "req-1")
+    status = await broker.get_status("req-1")
+    assert (status["status"], status["insights_received"], status["acks_received"]) == ("partial", 1, 1)
+
+    await broker.ack("b", "req-1")
+    status = await broker.get_status("req-1")
+    assert (status["status"], status["acks_received"], status["nodes_outstanding"]) == ("complete", 2, 0)
+
+
+async def test_status_of_unknown_request_is_expired(broker):
+    assert await broker.get_status("missing") == {
+        "status": "expired", "expected": 0, "insights_received": 0, "acks_received": 0, "nodes_outstanding": 0
+    }
+
+
+async def test_dead_lettered_request_expires(make_broker):
+    broker = make_broker(visibility_timeout=0.05, max_deliveries=1)
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.dequeue_queries("a")
+    await broker.dequeue_queries("b")
+    await broker.ack("b", "req-1")
+
+    await asyncio.sleep(0.1)
+    await broker.reap_expired_leases()
+    status = await broker.get_status("req-1")
+    assert (status["status"], status["acks_received"], status["nodes_outstanding"]) == ("expired", 1, 0)
+
+
+async def test_subscription_is_notified_of_updates(broker):
+    await broker.enqueue_many("req-1", ["a"], VECTOR)
+
+    async def save_later():
+        await asyncio.sleep(0.05)
+        await broker.save_insight("req-1", "a", "i")
+
+    loop = asyncio.get_running_loop()
+    async with broker.subscribe_updates("req-1") as subscription:
+        update, started = asyncio.create_task(save_later()), loop.time()
+        # wait() may also return early (e.g. on a pub/sub subscribe confirmation); callers re-read the state
+        while not await broker.get_consensus("req-1"):
+            assert loop.time() - started < 0.5
+            await subscription.wait(5)
+        await update
+
+
+async def test_insight_resubmission_replaces_the_previous_one(broker):
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.save_insight("req-1", "a", "first")
+    await broker.save_insight("req-1", "b", "other")
+    await broker.save_insight("req-1", "a", "second")
+
+    consensus = sorted(await broker.get_consensus("req-1"), key=lambda item: item["client_id"])
+    assert consensus == [{"client_id": "a", "insight": "second"}, {"client_id": "b", "insight": "other"}]
+    assert (await broker.get_status("req-1"))["insights_received"] == 2
+
+
+async def test_higher_priority_lanes_are_served_first(make_broker):
+    broker = make_broker(priority_aging=0)
+    for request_id, priority in [("r-0", PRIORITY_ROUTINE), ("s-0", PRIORITY_STAT), ("u-0", PRIORITY_URGENT),
+                                 ("r-1", PRIORITY_ROUTINE), ("s-1", PRIORITY_STAT)]:
+        await broker.enqueue_query("a", request_id, VECTOR, priority)
+    assert (await broker.get_metrics())["queued"] == {"routine": 2, "urgent": 1, "stat": 2}
+
+    tasks = await broker.dequeue_queries("a", max_batch=10)
+    assert [task["request_id"] for task in tasks] == ["s-0", "s-1", "u-0", "r-0", "r-1"]
+    assert (await broker.get_metrics())["queued"] == {"routine": 0, "urgent": 0, "stat": 0}
+
+
+async def test_waiting_tasks_age_into_higher_lanes(make_broker):
+    broker = make_broker(priority_aging=0.05)
+    await broker.enqueue_query("a", "routine", VECTOR, PRIORITY_ROUTINE)
+    await asyncio.sleep(0.2)
+    await broker.enqueue_query("a", "urgent", VECTOR, PRIORITY_URGENT)
+
+    assert [task["request_id"] for task in await broker.dequeue_queries("a", max_batch=2)] == ["routine", "urgent"]
+
+
+@pytest.mark.parametrize("priority", [-1, 3])
+async def test_invalid_priority_is_rejected(broker, priority):
+    with pytest.raises(ValueError):
+        await broker.enqueue_many("req-1", ["a"], VECTOR, priority)
+    assert await broker.dequeue_queries("a") == []
+
+
+async def test_admission_rejects_broadcasts_to_saturated_nodes(make_broker):
+    broker = make_broker(admission=AdmissionControl(max_queue_depth=1))
+    await broker.enqueue_many("req-1", ["a"], VECTOR)
+
+    with pytest.raises(NodeSaturatedError) as raised:
+        await broker.enqueue_many("req-2", ["a", "b"], VECTOR)
+    assert raised.value.nodes == ["a"]
+    assert await broker.dequeue_queries("b") == []
+    assert (await broker.get_status("req-2"))["status"] == "expired"
+
+
+async def test_admission_skips_saturated_nodes(make_broker):
+    broker = make_broker(admission=AdmissionControl(max_queue_depth=1, policy=ADMISSION_SKIP))
+    await broker.enqueue_many("req-1", ["a"], VECTOR)
+
+    assert await broker.enqueue_many("req-2", ["a", "b"], VECTOR) == {"skipped": ["a"], "shed": {}}
+    assert [task["request_id"] for task in await broker.dequeue_queries("a", max_batch=5)] == ["req-1"]
+    assert [task["request_id"] for task in await broker.dequeue_queries("b")] == ["req-2"]
+    assert (await broker.get_status("req-2"))["expected"] == 1
+
+
+async def test_broadcast_with_every_target_skipped_is_expired(make_broker):
+    broker = make_broker(admission=AdmissionControl(max_queue_depth=1, policy=ADMISSION_SKIP))
+    await broker.enqueue_many("req-1", ["a"], VECTOR)
+
+    assert await broker.enqueue_many("req-2", ["a"], VECTOR) == {"skipped": ["a"], "shed": {}}
+    status = await broker.get_status("req-2")
+    assert (status["status"], status["expected"]) == ("expired", 0)
+
+
+async def test_admission_sheds_the_oldest_queued_tasks(make_broker):
+    broker = make_broker(admission=AdmissionControl(max_queue_depth=2, policy=ADMISSION_SHED_OLDEST))
+    await broker.enqueue_many("req-1", ["a"], VECTOR)
+    await broker.enqueue_many("req-2", ["a"], VECTOR)
+
+    assert await broker.enqueue_many("req-3", ["a"], VECTOR) == {"skipped": [], "shed": {"a": ["req-1"]}}
+    assert [task["request_id"] for task in await broker.dequeue_queries("a", max_batch=5)] == ["req-2", "req-3"]
+    assert (await broker.get_status("req-1"))["status"] == "expired"
+    assert (await broker.get_metrics())["shed_total"] == 1
+
+
+async def test_group_membership(broker):
+    assert await broker.add_group_members("region:eu", ["a", "b"]) == 2
+    assert await broker.add_group_members("region:eu", ["b", "c"]) == 1
+    assert await broker.add_group_members("region:us", ["d"]) == 1
+    assert await broker.get_group_members("region:eu") == ["a", "b", "c"]
+    assert await broker.list_groups() == {"region:eu": 3, "region:us": 1}
+
+    assert await broker.remove_group_members("region:us", ["d", "x"]) == 1
+    assert await broker.list_groups() == {"region:eu": 3}
+    assert await broker.get_group_members("region:us") == []
+
+
+async def test_group_broadcast_reaches_every_member_once(broker):
+    await broker.add_group_members("region:eu", ["a", "b"])
+    await broker.add_group_members("icu", ["b", "c"])
+
+    report = await broker.enqueue_groups("req-1", ["region:eu", "icu"], VECTOR, client_ids=["d", "a"])
+    assert (report["targets"], report["skipped"]) == (4, [])
+    for client_id in ("a", "b", "c", "d"):
+        assert [task["request_id"] for task in await broker.dequeue_queries(client_id)] == ["req-1"]
+        assert await broker.dequeue_queries(client_id) == []
+    assert (await broker.get_status("req-1"))["expected"] == 4
+    assert (await broker.enqueue_groups("req-2", ["missing"], VECTOR))["targets"] == 0
+
+
+async def test_group_broadcast_goes_through_admission(make_broker):
+    broker = make_broker(admission=AdmissionControl(max_queue_depth=1, policy=ADMISSION_SKIP))
+    await broker.add_group_members("icu", ["a", "b"])
+    await broker.enqueue_query("a", "req-1", VECTOR)
+
+    report = await broker.enqueue_groups("req-2", ["icu"], VECTOR)
+    assert (report["targets"], report["skipped"]) == (1, ["a"])
+
+
+async def test_save_results_saves_insights_and_acks_in_order(broker):
+    for i in range(3):
+        await broker.enqueue_query("a", f"req-{i}", VECTOR)
+    assert len(await broker.dequeue_queries("a", max_batch=3)) == 3
+
+    await broker.save_results("a", [("req-0", "i0"), ("req-1", None), ("req-2", "i2"), ("missing", "x")])
+    assert (await broker.get_metrics())["in_flight"] == 0
+    assert await broker.get_consensus("req-0") == [{"client_id": "a", "insight": "i0"}]
+    assert await broker.get_consensus("req-1") == []
+    for request_id in ("req-0", "req-1", "req-2"):
+        assert (await broker.get_status(request_id))["status"] == "complete"
+    assert await broker.dequeue_queries("a") == []
@@ -0,0 +1,57 @@
+import json
+from array import array
+
+import pytest
+
+from aethelgard.core.codec import (
+    FLOAT32_MAGIC, Float32TaskCodec, JsonTaskCodec, get_codec, pack_vector_b64, unpack_vector_b64
+)
+
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+
+@pytest.mark.parametrize("codec", [JsonTaskCodec(), Float32TaskCodec()], ids=lambda codec: codec.name)
+@pytest.mark.parametrize("vector", [VECTOR, array("f", VECTOR)], ids=["list", "array"])
+def test_round_trip(codec, vector):
+    data = codec.encode("req-é", vector)
+    task = {"request_id": "req-é", "query_vector": VECTOR}
+
+    for reader in (JsonTaskCodec(), Float32TaskCodec()):
+        assert reader.decode(data) == task
+        assert reader.decode(memoryview(data)) == task
+        assert json.loads(reader.to_json(data)) == task
+
+
+def test_float32_is_packed():
+    data = Float32TaskCodec().encode("req-1", [0.1] * 1920)
+
+    assert data[:4] == FLOAT32_MAGIC
+    assert len(data) == 10 + len("req-1") + 4 * 1920
+    assert Float32TaskCodec().decode(data)["query_vector"][0] == pytest.approx(0.1, rel=1e-6)
+
+
+def test_json_written_before_codecs_is_read():
+    stored = json.dumps({"request_id": "req-1", "query_vector": VECTOR})
+
+    assert Float32TaskCodec().decode(stored) == {"request_id": "req-1", "query_vector": VECTOR}
+    assert Float32TaskCodec().to_json(stored) == stored.encode()
+
+
+def test_get_codec():
+    assert isinstance(get_codec("float32"), Float32TaskCodec)
+    with pytest.raises(ValueError):
+        get_codec("msgpack")
+
+
+def test_b64_vector_round_trip():
+    packed = pack_vector_b64(VECTOR)
+
+    assert packed == "AAAAPwAAgL4AAIA/AAAAPg=="
+    assert unpack_vector_b64(packed).tolist() == VECTOR
+    assert unpack_vector_b64(packed.encode()).typecode == "f"
+
+
+@pytest.mark.parametrize("data", ["", "AAAAPwA=", "not base64!"])
+def test_malformed_b64_vector_is_rejected(data):
+    with pytest.raises(ValueError):
+        unpack_vector_b64(data)
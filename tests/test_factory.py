@@ -0,0 +1,58 @@
+import pytest
+
+from aethelgard.brokers.factory import broker_class_from_env, broker_from_env
+from aethelgard.brokers.log_broker import LogBroker
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.brokers.redis_broker import RedisBroker
+from aethelgard.brokers.redis_cluster_broker import RedisClusterBroker
+from aethelgard.brokers.sqlite_broker import SQLiteBroker
+from aethelgard.core.codec import Float32TaskCodec
+from aethelgard.transports import runner
+
+
+@pytest.mark.parametrize("env, broker_class", [
+    ({}, RedisBroker),
+    ({"REDIS_CLUSTER": "true"}, RedisClusterBroker),
+    ({"BROKER": "SQLite", "REDIS_CLUSTER": "true"}, SQLiteBroker),
+    ({"BROKER": "memory"}, InMemoryBroker),
+])
+def test_broker_class_from_env(env, broker_class):
+    assert broker_class_from_env(env) is broker_class
+
+
+def test_unknown_broker_is_rejected():
+    with pytest.raises(ValueError):
+        broker_class_from_env({"BROKER": "kafka"})
+
+
+async def test_broker_from_env(tmp_path):
+    broker = broker_from_env({"BROKER": "memory", "ADMISSION_MAX_QUEUE_DEPTH": "10", "ADMISSION_POLICY": "skip"})
+    assert (broker.admission.max_queue_depth, broker.admission.policy) == (10, "skip")
+
+    db_path = str(tmp_path / "broker.db")
+    broker = broker_from_env({"BROKER": "sqlite", "SQLITE_BROKER_DB": db_path, "BROKER_CODEC": "float32"})
+    assert (broker.db_path, type(broker.codec), broker.admission) == (db_path, Float32TaskCodec, None)
+    await broker.close()
+
+    broker = broker_from_env({"BROKER": "log", "LOG_BROKER_DIR": str(tmp_path / "log")})
+    assert isinstance(broker, LogBroker) and broker.directory == str(tmp_path / "log")
+    await broker.close()
+
+
+def test_run_workers_refuses_in_process_state(monkeypatch):
+    monkeypatch.setenv("BROKER", "memory")
+    monkeypatch.setattr(runner.uvicorn, "run", lambda *args, **kwargs: pytest.fail("uvicorn started"))
+
+    with pytest.raises(ValueError):
+        runner.run_workers(workers=2)
+
+
+def test_run_workers_starts_the_app_factory(monkeypatch):
+    calls = []
+    monkeypatch.setenv("BROKER", "sqlite")
+    monkeypatch.setattr(runner.uvicorn, "run", lambda *args, **kwargs: calls.append((args, kwargs)))
+
+    runner.run_workers(port=9000, workers=3)
+    [(args, kwargs)] = calls
+    assert args == (runner.APP_FACTORY,)
+    assert (kwargs["factory"], kwargs["workers"], kwargs["port"]) == (True, 3, 9000)
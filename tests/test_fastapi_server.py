@@ -0,0 +1,243 @@
+import json
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from aethelgard.brokers.memory_broker import InMemoryBroker
+from aethelgard.core.broker import ADMISSION_REJECT, ADMISSION_SKIP, AdmissionControl
+from aethelgard.core.codec import VECTOR_B64_MEDIA_TYPE, pack_vector_b64
+from aethelgard.transports import fastapi_server
+from aethelgard.transports.fastapi_server import FastAPIServer, FastJSONResponse
+
+# Exactly representable in float32, so the vector survives the packed encodings unchanged
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+
+def broadcast(client, targets, **body) -> str:
+    body.setdefault("query_vector", VECTOR)
+    response = client.post("/api/v1/query/broadcast", json={"query_text": "q", "target_clients": targets, **body})
+    assert response.status_code == 202, response.text
+    return response.json()["request_id"]
+
+
+def poll(client, client_id, **params) -> list:
+    response = client.get(f"/api/v1/client/{client_id}/poll", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()["pending_tasks"]
+
+
+def consensus(client, request_id) -> dict:
+    response = client.get(f"/api/v1/query/{request_id}/consensus")
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_broadcast_poll_insight_ack(client):
+    request_id = broadcast(client, ["a"])
+    assert poll(client, "a") == [{"request_id": request_id, "query_vector": VECTOR}]
+    assert poll(client, "a") == []
+
+    response = client.post(f"/api/v1/query/{request_id}/insight", json={"client_id": "a", "sanitized_insight": "i"})
+    assert response.json()["status"] == "success"
+    response = client.post(f"/api/v1/query/{request_id}/ack", json={"client_id": "a"})
+    assert response.json() == {"status": "success", "message": "ACK"}
+    assert consensus(client, request_id)["consensus_data"] == [{"client_id": "a", "insight": "i"}]
+
+
+@pytest.mark.parametrize("body", [{"target_clients": []}, {"query_text": None}])
+def test_broadcast_validation(client, body):
+    response = client.post("/api/v1/query/broadcast",
+                           json={"query_text": "q", "target_clients": ["a"], "query_vector": VECTOR, **body})
+    assert response.status_code == 422
+
+
+def test_poll_returns_at_most_max_batch(client):
+    request_ids = [broadcast(client, ["a"]) for _ in range(3)]
+
+    assert [task["request_id"] for task in poll(client, "a", max_batch=2)] == request_ids[:2]
+    assert [task["request_id"] for task in poll(client, "a", max_batch=2)] == request_ids[2:]
+    assert client.get("/api/v1/client/a/poll", params={"max_batch": 0}).status_code == 422
+
+
+def test_broadcast_deduplicates_targets(client):
+    response = client.post("/api/v1/query/broadcast",
+                           json={"query_text": "q", "target_clients": ["a", "b", "a"], "query_vector": VECTOR})
+    assert response.json()["target_count"] == 2
+    assert len(poll(client, "a")) == 1
+    assert len(poll(client, "b")) == 1
+
+
+def test_poll_wait(client):
+    assert poll(client, "a", wait=0.1) == []
+    request_id = broadcast(client, ["a"])
+    assert [task["request_id"] for task in poll(client, "a", wait=5)] == [request_id]
+    assert client.get("/api/v1/client/a/poll", params={"wait": -1}).status_code == 422
+
+
+def test_consensus_reports_status(client):
+    request_id = broadcast(client, ["a", "b"])
+    assert consensus(client, request_id)["status"] == "pending"
+
+    client.post(f"/api/v1/query/{request_id}/ack", json={"client_id": "a"})
+    assert consensus(client, request_id)["status"] == "partial"
+    client.post(f"/api/v1/query/{request_id}/ack", json={"client_id": "b"})
+    assert consensus(client, request_id)["status"] == "complete"
+    assert consensus(client, "missing")["status"] == "expired"
+
+
+def test_stream_sends_insights_then_completes(client):
+    request_id = broadcast(client, ["a"])
+    client.post(f"/api/v1/query/{request_id}/insight", json={"client_id": "a", "sanitized_insight": "i"})
+    client.post(f"/api/v1/query/{request_id}/ack", json={"client_id": "a"})
+
+    response = client.get(f"/api/v1/query/{request_id}/stream")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [frame.split("\n") for frame in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == ["event: insight", "event: complete"]
+    assert json.loads(events[0][1][len("data: "):]) == {"client_id": "a", "insight": "i"}
+    assert json.loads(events[1][1][len("data: "):])["status"] == "complete"
+
+
+def test_stream_of_unknown_request_completes_expired(client):
+    response = client.get("/api/v1/query/missing/stream")
+    assert response.text.startswith("event: complete\n")
+    assert '"status": "expired"' in response.text
+
+
+def test_insight_retry_is_idempotent(client):
+    request_id = broadcast(client, ["a"])
+    for _ in range(2):
+        response = client.post(f"/api/v1/query/{request_id}/insight", json={"client_id": "a", "sanitized_insight": "i"})
+        assert response.json()["status"] == "success"
+
+    result = consensus(client, request_id)
+    assert (result["consensus_data"], result["insights_received"]) == ([{"client_id": "a", "insight": "i"}], 1)
+
+
+def test_broadcast_priority(client):
+    routine = broadcast(client, ["a"])
+    stat = broadcast(client, ["a"], priority=2)
+
+    assert [task["request_id"] for task in poll(client, "a", max_batch=2)] == [stat, routine]
+    response = client.post("/api/v1/query/broadcast",
+                           json={"query_text": "q", "target_clients": ["a"], "query_vector": VECTOR, "priority": 3})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("policy", [ADMISSION_REJECT, ADMISSION_SKIP])
+def test_broadcast_to_saturated_nodes(policy):
+    broker = InMemoryBroker(admission=AdmissionControl(max_queue_depth=1, policy=policy))
+    with TestClient(FastAPIServer(broker).app) as client:
+        broadcast(client, ["a"])
+        response = client.post("/api/v1/query/broadcast",
+                               json={"query_text": "q", "target_clients": ["a", "b"], "query_vector": VECTOR})
+
+        if policy == ADMISSION_SKIP:
+            assert response.status_code == 202
+            assert (response.json()["target_count"], response.json()["skipped_nodes"]) == (1, ["a"])
+        else:
+            assert (response.status_code, response.headers["retry-after"]) == (503, "30")
+            assert response.json()["detail"]["saturated_nodes"] == ["a"]
+
+
+def test_group_endpoints_and_group_broadcast(client):
+    response = client.post("/api/v1/groups/icu/members", json={"client_ids": ["a", "b", "a"]})
+    assert response.json() == {"group": "icu", "added": 2}
+    assert client.get("/api/v1/groups").json() == {"groups": {"icu": 2}}
+    assert client.get("/api/v1/groups/icu/members").json() == {"group": "icu", "members": ["a", "b"]}
+
+    response = client.post("/api/v1/query/broadcast",
+                           json={"query_text": "q", "target_groups": ["icu"], "target_clients": ["c"],
+                                 "query_vector": VECTOR})
+    assert response.json()["target_count"] == 3
+    for client_id in ("a", "b", "c"):
+        assert len(poll(client, client_id)) == 1
+
+    assert client.delete("/api/v1/groups/icu/members/a").json() == {"group": "icu", "removed": 1}
+    assert client.delete("/api/v1/groups/icu/members/a").status_code == 404
+    response = client.post("/api/v1/query/broadcast",
+                           json={"query_text": "q", "target_groups": ["empty"], "query_vector": VECTOR})
+    assert response.status_code == 404
+
+
+def test_broadcast_and_poll_b64_vectors(client):
+    request_id = broadcast(client, ["a", "b"], query_vector=None, query_vector_b64=pack_vector_b64(VECTOR))
+    assert poll(client, "a") == [{"request_id": request_id, "query_vector": VECTOR}]
+
+    response = client.get("/api/v1/client/b/poll", headers={"Accept": VECTOR_B64_MEDIA_TYPE})
+    assert response.headers["content-type"] == VECTOR_B64_MEDIA_TYPE
+    [task] = response.json()["pending_tasks"]
+    assert task == {"request_id": request_id, "query_vector_b64": pack_vector_b64(VECTOR)}
+
+
+@pytest.mark.parametrize("vectors", [
+    {"query_vector_b64": "AAAAPwA="},
+    {"query_vector_b64": "not base64!"},
+    {"query_vector": VECTOR, "query_vector_b64": pack_vector_b64(VECTOR)},
+    {},
+])
+def test_broadcast_vector_validation(client, vectors):
+    response = client.post("/api/v1/query/broadcast",
+                           json={"query_text": "q", "target_clients": ["a"], "query_vector": None, **vectors})
+    assert response.status_code == 422
+
+
+def test_poll_is_json_on_every_path(client):
+    request_id = broadcast(client, ["a"])
+    response = client.get("/api/v1/client/a/poll")
+
+    assert response.headers["content-type"] == "application/json"
+    assert json.loads(response.content) == {"pending_tasks": [{"request_id": request_id, "query_vector": VECTOR}]}
+    assert client.get("/api/v1/client/a/poll").content in (b'{"pending_tasks":[]}', b'{"pending_tasks": []}')
+
+
+@pytest.mark.parametrize("without_orjson", [False, True])
+def test_fast_json_response_renders_like_json_response(monkeypatch, without_orjson):
+    if without_orjson:
+        monkeypatch.setattr(fastapi_server, "orjson", None)
+    content = {"pending_tasks": [{"request_id": "req-1", "query_vector": VECTOR}], "counts": {1: 2}, "none": None}
+
+    assert json.loads(FastJSONResponse(content).body) == json.loads(JSONResponse(content).body)
+
+
+def test_responses_match_the_plain_json_response_class():
+    bodies = []
+    for response_class in (FastJSONResponse, JSONResponse):
+        with TestClient(FastAPIServer(InMemoryBroker(), response_class=response_class).app) as client:
+            request_id = broadcast(client, ["a"])
+            [task] = poll(client, "a")
+            client.post(f"/api/v1/query/{request_id}/insight", json={"client_id": "a", "sanitized_insight": "i"})
+            result = consensus(client, request_id)
+            metrics = client.get("/api/v1/metrics").json()
+            bodies.append((task["query_vector"], {**result, "request_id": None}, sorted(metrics)))
+    assert bodies[0] == bodies[1]
+
+
+def test_results_batch(client):
+    request_ids = [broadcast(client, ["a"]) for _ in range(2)]
+    assert len(poll(client, "a", max_batch=2)) == 2
+
+    response = client.post("/api/v1/client/a/results", json={"results": [
+        {"request_id": request_ids[0], "insight": "i"}, {"request_id": request_ids[1]},
+    ]})
+    assert response.json() == {"status": "success", "acked": 2, "insights": 1}
+    assert consensus(client, request_ids[0])["consensus_data"] == [{"client_id": "a", "insight": "i"}]
+    assert [consensus(client, request_id)["status"] for request_id in request_ids] == ["complete", "complete"]
+    assert client.post("/api/v1/client/a/results", json={"results": []}).status_code == 422
+
+
+def test_insight_with_ack(client):
+    request_id = broadcast(client, ["a", "b"])
+    poll(client, "a")
+
+    response = client.post(f"/api/v1/query/{request_id}/insight",
+                           json={"client_id": "a", "sanitized_insight": "i", "ack": True})
+    assert response.json() == {"status": "success", "acked": True}
+    result = consensus(client, request_id)
+    assert (result["acks_received"], result["insights_received"], result["nodes_outstanding"]) == (1, 1, 1)
+    assert poll(client, "a") == []
+
+    response = client.post(f"/api/v1/query/{request_id}/insight", json={"client_id": "b", "sanitized_insight": "j"})
+    assert response.json() == {"status": "success", "acked": False}
+    assert consensus(client, request_id)["acks_received"] == 1
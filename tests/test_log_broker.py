@@ -0,0 +1,119 @@
+import asyncio
+import json
+import os
+import resource
+
+import pytest
+
+from aethelgard.brokers.log_broker import LogBroker
+from aethelgard.core.broker import PRIORITY_LEVELS
+
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+CLIENTS = 300
+MAX_OPEN_PARTITIONS = 16
+# Per open partition: the active segment's log, index and mmap, a sealed segment's mmap, commit.offsets
+DESCRIPTOR_BUDGET = MAX_OPEN_PARTITIONS * 5 + 8
+
+
+def open_descriptors() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.fixture
+def descriptor_limit():
+    """Lowers the soft RLIMIT_NOFILE to the budget above what is open now, so a leak fails with EMFILE."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (open_descriptors() + DESCRIPTOR_BUDGET, hard))
+    yield
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="counts descriptors in /proc/self/fd")
+async def test_descriptors_stay_bounded_with_many_clients(tmp_path, descriptor_limit):
+    baseline = open_descriptors()
+    clients = [f"node-{i}" for i in range(CLIENTS)]
+    broker = LogBroker(str(tmp_path), segment_bytes=256, max_open_partitions=MAX_OPEN_PARTITIONS)
+    for round_ in range(3):
+        for priority in range(PRIORITY_LEVELS):
+            await broker.enqueue_many(f"req-{round_}-{priority}", clients, [0.5] * 16, priority=priority)
+    for client_id in clients[:CLIENTS // 2]:
+        tasks = await broker.dequeue_queries(client_id, max_batch=100)
+        assert len(tasks) == 3 * PRIORITY_LEVELS
+        await broker.save_results(client_id, [(task["request_id"], None) for task in tasks])
+    assert (await broker.get_metrics())["log"]["open_partitions"] <= MAX_OPEN_PARTITIONS
+    assert open_descriptors() - baseline <= DESCRIPTOR_BUDGET
+    await broker.close()
+    assert open_descriptors() == baseline
+
+    # Only the lanes with uncommitted records are reopened, and lazily
+    broker = LogBroker(str(tmp_path), segment_bytes=256, max_open_partitions=MAX_OPEN_PARTITIONS)
+    assert sorted(broker._partitions) == sorted(clients[CLIENTS // 2:])
+    assert open_descriptors() - baseline <= DESCRIPTOR_BUDGET
+    for client_id in clients[CLIENTS // 2:]:
+        tasks = await broker.dequeue_queries(client_id, max_batch=100)
+        assert len(tasks) == 3 * PRIORITY_LEVELS
+        await broker.save_results(client_id, [(task["request_id"], None) for task in tasks])
+    assert open_descriptors() - baseline <= DESCRIPTOR_BUDGET
+    await broker.close()
+    assert open_descriptors() == baseline
+
+
+async def test_fsync_survives_evicted_partitions(tmp_path):
+    broker = LogBroker(str(tmp_path), fsync=True, max_open_partitions=1)
+    await broker.enqueue_many("req-1", ["a", "b", "c"], [0.5, 0.25])
+    await broker.close()
+
+    broker = LogBroker(str(tmp_path), max_open_partitions=1)
+    for client_id in ("a", "b", "c"):
+        assert [task["request_id"] for task in await broker.dequeue_queries(client_id)] == ["req-1"]
+    await broker.close()
+
+
+async def test_restart_recovers_requests_and_uncommitted_tasks(tmp_path):
+    broker = LogBroker(str(tmp_path))
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.dequeue_queries("a")
+    await broker.save_insight("req-1", "a", "i")
+    await broker.ack("a", "req-1")
+    assert len(await broker.dequeue_queries("b")) == 1
+    await broker.close()
+    with open(tmp_path / "requests.log", "a") as f:
+        f.write('{"op": "insight", "request_id": "req-1", "cli')
+
+    broker = LogBroker(str(tmp_path))
+    try:
+        assert await broker.dequeue_queries("a") == []
+        # Leases are not persisted: the unacked task is delivered again
+        assert [task["request_id"] for task in await broker.dequeue_queries("b")] == ["req-1"]
+        assert await broker.get_consensus("req-1") == [{"client_id": "a", "insight": "i"}]
+        status = await broker.get_status("req-1")
+        assert (status["status"], status["acks_received"], status["nodes_outstanding"]) == ("partial", 1, 1)
+    finally:
+        await broker.close()
+
+
+async def test_prune_rewrites_the_logs_with_retained_requests_only(tmp_path):
+    broker = LogBroker(str(tmp_path), insight_ttl=0, metadata_ttl=0, visibility_timeout=0.01, max_deliveries=1)
+    await broker.enqueue_many("done", ["a"], VECTOR)
+    await broker.enqueue_many("dead", ["b"], VECTOR)
+    await broker.enqueue_many("pending", ["c"], VECTOR)
+    await broker.dequeue_queries("a")
+    await broker.save_results("a", [("done", "i")])
+    await broker.dequeue_queries("b")
+    await asyncio.sleep(0.02)
+    await broker.reap_expired_leases()
+
+    assert await broker.prune_expired() == {"insights": 1, "requests": 2, "deadletter": 1}
+    with open(tmp_path / "requests.log") as f:
+        assert [json.loads(line)["request_id"] for line in f] == ["pending"]
+    assert os.path.getsize(tmp_path / "deadletter.log") == 0
+    await broker.close()
+
+    broker = LogBroker(str(tmp_path))
+    try:
+        assert await broker.get_consensus("done") == []
+        assert (await broker.get_status("done"))["expected"] == 0
+        assert (await broker.get_status("pending"))["status"] == "pending"
+    finally:
+        await broker.close()
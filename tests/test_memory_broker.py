@@ -0,0 +1,53 @@
+"""InMemoryBroker specifics."""
+import asyncio
+
+from aethelgard.brokers.memory_broker import InMemoryBroker
+
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+
+async def test_prune_forgets_expired_requests_and_idle_clients():
+    broker = InMemoryBroker(insight_ttl=0, metadata_ttl=0, visibility_timeout=0.01, max_deliveries=1)
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.dequeue_queries("a")
+    await broker.save_insight("req-1", "a", "i")
+    await broker.ack("a", "req-1")
+    await broker.dequeue_queries("b")
+    await asyncio.sleep(0.02)
+    await broker.reap_expired_leases()
+    await broker.dequeue_queries("never-enqueued")
+
+    assert await broker.prune_expired() == {"insights": 1, "requests": 1, "deadletter": 1, "clients": 3}
+    assert await broker.get_consensus("req-1") == []
+    assert (await broker.get_status("req-1"))["status"] == "expired"
+    assert not (broker._queues or broker._tasks or broker._deliveries or broker._events or broker._deadletter)
+
+
+async def test_prune_keeps_pending_work():
+    broker = InMemoryBroker(insight_ttl=0)
+    await broker.enqueue_many("req-1", ["a"], VECTOR)
+    await asyncio.sleep(0.01)
+
+    assert (await broker.prune_expired())["requests"] == 0
+    assert [task["request_id"] for task in await broker.dequeue_queries("a")] == ["req-1"]
+
+
+async def test_prune_keeps_the_event_of_a_waiting_poller():
+    broker = InMemoryBroker()
+    poll = asyncio.create_task(broker.dequeue_queries("a", wait_timeout=5))
+    await asyncio.sleep(0.01)
+    await broker.prune_expired()
+    await broker.enqueue_query("a", "req-1", VECTOR)
+
+    assert [task["request_id"] for task in await asyncio.wait_for(poll, 1)] == ["req-1"]
+
+
+async def test_dead_letters_are_capped_per_client():
+    broker = InMemoryBroker(visibility_timeout=0.01, max_deliveries=1, max_dead_letters=2)
+    for i in range(3):
+        await broker.enqueue_query("a", f"req-{i}", VECTOR)
+    await broker.dequeue_queries("a", max_batch=3)
+    await asyncio.sleep(0.02)
+    await broker.reap_expired_leases()
+
+    assert [request_id for request_id, _ in broker._deadletter["a"]] == ["req-1", "req-2"]
@@ -0,0 +1,89 @@
+"""RedisBroker specifics, against fakeredis (see conftest.fake_redis)."""
+import pytest
+
+from aethelgard.brokers.redis_broker import PAYLOAD_REF, RedisBroker
+from aethelgard.core.broker import BrokerCapacityError
+
+pytest.importorskip("fakeredis")
+
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+
+@pytest.fixture
+async def make_redis_broker(fake_redis):
+    brokers = []
+
+    def build(**options):
+        brokers.append(RedisBroker(**options))
+        return brokers[-1]
+
+    yield build
+    for broker in brokers:
+        await broker.close()
+
+
+async def test_fanout_stores_the_payload_once(make_redis_broker):
+    broker = make_redis_broker(fanout=True)
+    await broker.enqueue_many("req-1", ["a", "b", "c"], VECTOR)
+
+    for client_id in ("a", "b", "c"):
+        assert await broker.redis.hget(broker._tasks_key(client_id), "req-1") == PAYLOAD_REF
+    assert await broker.redis.get(broker._refs_key("req-1")) == "3"
+
+    for client_id in ("a", "b", "c"):
+        [task] = await broker.dequeue_queries(client_id)
+        assert task["query_vector"] == VECTOR
+        await broker.ack(client_id, "req-1")
+    assert not await broker.redis.exists(broker._payload_key("req-1"), broker._refs_key("req-1"))
+
+
+async def test_keys_expire(make_redis_broker):
+    broker = make_redis_broker(task_ttl=600, insight_ttl=3600, metadata_ttl=7200)
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.dequeue_queries("a")
+    await broker.save_insight("req-1", "a", "i")
+
+    for key in (broker._tasks_key("b"), broker._enqueued_key("b"), broker._queue_key("b")):
+        assert 0 < await broker.redis.ttl(key) <= 600
+    for key in (broker._results_key("req-1"), broker._status_key("req-1"), broker._outstanding_key("req-1")):
+        assert 600 < await broker.redis.ttl(key) <= 3600
+
+
+async def test_memory_budget_rejects_broadcasts(make_redis_broker):
+    broker = make_redis_broker(max_memory_bytes=1000)
+    await broker.enqueue_many("req-1", ["a"], VECTOR)
+
+    with pytest.raises(BrokerCapacityError):
+        await broker.enqueue_many("req-2", [f"node-{i}" for i in range(100)], VECTOR)
+    assert await broker.dequeue_queries("node-0") == []
+
+
+async def test_compact_prunes_expired_clients(make_redis_broker):
+    broker = make_redis_broker()
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.redis.delete(*broker._client_keys("a"))
+
+    report = await broker.compact()
+    assert report["pruned_clients"] == 1
+    assert await broker.redis.smembers(broker.CLIENTS_KEY) == {"b"}
+
+
+async def test_pickup_latency_is_sampled_per_client(make_redis_broker):
+    broker = make_redis_broker(task_ttl=600)
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.dequeue_queries("a")
+    await broker.dequeue_queries("b")
+
+    routine = broker._latency_keys("a")[0]
+    assert routine == "metrics:pickup:a:routine"
+    assert 0 < await broker.redis.ttl(routine) <= 600
+    assert (await broker.pickup_latency())["routine"]["samples"] == 2
+
+
+async def test_memory_budget_covers_every_group_member(make_redis_broker):
+    broker = make_redis_broker(max_memory_bytes=1000)
+    await broker.add_group_members("all", [f"node-{i}" for i in range(100)])
+
+    with pytest.raises(BrokerCapacityError):
+        await broker.enqueue_groups("req-1", ["all"], VECTOR)
+    assert await broker.dequeue_queries("node-0") == []
@@ -0,0 +1,60 @@
+"""RedisClusterBroker key placement, against fakeredis (see conftest.fake_redis)."""
+import asyncio
+
+import pytest
+from redis.commands.core import AsyncScript
+from redis.crc import key_slot
+
+from aethelgard.brokers.redis_cluster_broker import RedisClusterBroker
+from aethelgard.core.broker import ADMISSION_SHED_OLDEST, PRIORITY_LEVELS, AdmissionControl
+
+pytest.importorskip("fakeredis")
+
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+
+def slots(keys) -> set:
+    return {key_slot(key.encode()) for key in keys}
+
+
+def test_keys_are_hash_tagged_by_client_and_request():
+    broker = RedisClusterBroker
+    client_keys = [*(broker._queue_key("node-1", priority) for priority in range(PRIORITY_LEVELS)),
+                   *broker._latency_keys("node-1"), broker._tasks_key("node-1"), broker._inflight_key("node-1"),
+                   broker._deliveries_key("node-1"), broker._enqueued_key("node-1"), broker._wake_key("node-1"),
+                   broker._deadletter_key("node-1"), broker._ack_rate_key("node-1")]
+    request_keys = [broker._results_key("req-1"), broker._insights_key("req-1"), broker._status_key("req-1"),
+                    broker._outstanding_key("req-1"), broker._payload_key("req-1"), broker._refs_key("req-1")]
+
+    assert slots(client_keys) == {key_slot(b"node-1")}
+    assert slots(request_keys) == {key_slot(b"req-1")}
+
+
+def test_fanout_is_refused():
+    with pytest.raises(ValueError):
+        RedisClusterBroker(fanout=True)
+
+
+async def test_scripts_touch_a_single_slot(fake_redis, monkeypatch):
+    call = AsyncScript.__call__
+
+    async def checked(self, keys=(), args=(), client=None):
+        assert len(slots(keys)) <= 1, f"CROSSSLOT {keys}"
+        return await call(self, keys, args, client)
+
+    monkeypatch.setattr(AsyncScript, "__call__", checked)
+    broker = RedisClusterBroker(visibility_timeout=0.05, max_deliveries=1,
+                                admission=AdmissionControl(max_queue_depth=2, policy=ADMISSION_SHED_OLDEST))
+    try:
+        for request_id in ("req-1", "req-2", "req-3"):
+            await broker.enqueue_many(request_id, ["a", "b"], VECTOR)
+        await broker.dequeue_queries("a")
+        await broker.save_results("a", [("req-2", "i")])
+        await broker.dequeue_queries("b")
+        await asyncio.sleep(0.1)
+
+        assert await broker.reap_expired_leases() == {"redelivered": 0, "dead_lettered": 3}
+        status = await broker.get_status("req-2")
+        assert (status["status"], status["acks_received"], status["insights_received"]) == ("expired", 1, 1)
+    finally:
+        await broker.close()
@@ -0,0 +1,56 @@
+"""SQLiteBroker specifics."""
+import asyncio
+
+from aethelgard.brokers.sqlite_broker import SQLiteBroker
+
+VECTOR = [0.5, -0.25, 1.0, 0.125]
+
+
+async def test_state_survives_a_restart(tmp_path):
+    db_path = str(tmp_path / "broker.db")
+    broker = SQLiteBroker(db_path)
+    await broker.enqueue_many("req-1", ["a", "b"], VECTOR)
+    await broker.dequeue_queries("a")
+    await broker.save_insight("req-1", "a", "i")
+    await broker.ack("a", "req-1")
+    await broker.close()
+
+    broker = SQLiteBroker(db_path)
+    try:
+        assert await broker.dequeue_queries("a") == []
+        assert [task["request_id"] for task in await broker.dequeue_queries("b")] == ["req-1"]
+        assert await broker.get_consensus("req-1") == [{"client_id": "a", "insight": "i"}]
+        assert (await broker.get_status("req-1"))["status"] == "partial"
+    finally:
+        await broker.close()
+
+
+async def test_prune_deletes_expired_rows(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "broker.db"), insight_ttl=0, metadata_ttl=0,
+                          visibility_timeout=0.01, max_deliveries=1)
+    try:
+        await broker.enqueue_many("req-1", ["a"], VECTOR)
+        await broker.enqueue_many("req-2", ["b"], VECTOR)
+        await broker.dequeue_queries("a")
+        await broker.save_insight("req-1", "a", "i")
+        await broker.ack("a", "req-1")
+        await broker.dequeue_queries("b")
+        await asyncio.sleep(0.02)
+        await broker.reap_expired_leases()
+
+        assert await broker.prune_expired() == {"insights": 1, "requests": 2, "deadletter": 1}
+        assert await broker.get_consensus("req-1") == []
+    finally:
+        await broker.close()
+
+
+async def test_prune_keeps_requests_with_pending_tasks(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "broker.db"), insight_ttl=0)
+    try:
+        await broker.enqueue_many("req-1", ["a"], VECTOR)
+        await asyncio.sleep(0.01)
+
+        assert (await broker.prune_expired())["requests"] == 0
+        assert (await broker.get_status("req-1"))["status"] == "pending"
+    finally:
+        await broker.close()